@@ -1,64 +1,59 @@
 import re
-import os
-from io import BytesIO
-from PIL import Image
 
-def resize_aadhar_mar(image_bytes, height, width):
+import imageAdmission
+import imageOps
+import imagePool
+import ocrBackend
+import structuredLog
+
+log = structuredLog.get_logger(__name__)
+
+def resize_aadhar_mar(image_bytes, height, width, as_buffer=False, output=None):
     """
     Resize Aadhar maintaining aspect ratio
-    Returns: resized image bytes or None
+    image_bytes may also be a seekable upload stream
+    output: outputFormat 'format' step; with it the imageOps pipeline result
+            dict is returned instead of the JPEG
+    Returns: resized image bytes (a BytesIO with as_buffer) or None
     """
     try:
-        # Open image from bytes
-        img = Image.open(BytesIO(image_bytes))
-        
-        # Calculate height maintaining aspect ratio
-        aspect_ratio = img.height / img.width
-        new_height = int(width * aspect_ratio)
-        
-        # Resize image
-        resized = img.resize((width, new_height), Image.Resampling.LANCZOS)
-        
-        # Convert to bytes
-        output = BytesIO()
-        resized.save(output, format='JPEG', quality=95)
-        resized_bytes = output.getvalue()
+        # Height follows from width and the source aspect ratio
+        if output is not None:
+            return imageOps.resize_image(image_bytes, width, height, keep_aspect=True, output=output)
+        resized_bytes = imageOps.resize_to_jpeg(image_bytes, width, height, keep_aspect=True, as_buffer=as_buffer)
         
         # Optional: Validate with OCR only if credentials available
         # Skip validation to allow resize without Google Cloud
         return resized_bytes
         
-    except Exception as e:
-        print(f"Error in resize_aadhar_mar: {e}")
-        import traceback
-        traceback.print_exc()
+    except (imagePool.ImagePoolError, imageAdmission.ImageRejectedError):
+        raise
+    except Exception:
+        log.exception("Error in resize_aadhar_mar")
         return None
 
-def resize_aadhar_hard(image_bytes, height, width):
+def resize_aadhar_hard(image_bytes, height, width, as_buffer=False, output=None):
     """
     Hard resize Aadhar to exact dimensions
-    Returns: resized image bytes or None
+    image_bytes may also be a seekable upload stream
+    output: outputFormat 'format' step; with it the imageOps pipeline result
+            dict is returned instead of the JPEG
+    Returns: resized image bytes (a BytesIO with as_buffer) or None
     """
     try:
-        # Open image from bytes
-        img = Image.open(BytesIO(image_bytes))
-        
         # Resize to exact dimensions
-        resized = img.resize((width, height), Image.Resampling.LANCZOS)
-        
-        # Convert to bytes
-        output = BytesIO()
-        resized.save(output, format='JPEG', quality=95)
-        resized_bytes = output.getvalue()
+        if output is not None:
+            return imageOps.resize_image(image_bytes, width, height, output=output)
+        resized_bytes = imageOps.resize_to_jpeg(image_bytes, width, height, as_buffer=as_buffer)
         
         # Optional: Validate with OCR only if credentials available
         # Skip validation to allow resize without Google Cloud
         return resized_bytes
         
-    except Exception as e:
-        print(f"Error in resize_aadhar_hard: {e}")
-        import traceback
-        traceback.print_exc()
+    except (imagePool.ImagePoolError, imageAdmission.ImageRejectedError):
+        raise
+    except Exception:
+        log.exception("Error in resize_aadhar_hard")
         return None
 
 def _validate_aadhar_ocr(image_bytes):
@@ -67,16 +62,12 @@ def _validate_aadhar_ocr(image_bytes):
     This is optional and only used if Google Cloud credentials are available
     """
     try:
-        from google.cloud import vision
-        
-        # Use environment variable or fallback
-        creds_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', 'credentials.json')
-        if creds_path and os.path.exists(creds_path):
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
+        backend = ocrBackend.get_backend()
+        if not backend.available():
+            # No credentials: skip validation and allow the resize
+            return True
         
-        client = vision.ImageAnnotatorClient()
-        image = vision.Image(content=image_bytes)
-        response = client.text_detection(image=image)
+        response = backend.text_detection(image_bytes)
         
         if not response.text_annotations:
             return False
@@ -93,6 +84,6 @@ def _validate_aadhar_ocr(image_bytes):
         
         return False
     except Exception as e:
-        print(f"Error in _validate_aadhar_ocr: {e}")
+        log.warning("Error in _validate_aadhar_ocr", extra={'error': str(e)})
         # Return True to allow resize even if OCR fails
         return True
\ No newline at end of file
@@ -0,0 +1,356 @@
+import json
+from collections import namedtuple
+
+from werkzeug.exceptions import HTTPException
+
+import aadharVerification
+import panVerification
+import panResize
+import aadharResize
+import reduceSize
+import imageOps
+import imageAdmission
+import imagePool
+import outputFormat
+import resultCache
+import metrics
+import structuredLog
+
+# Route handlers shared by the Flask app (app.py) and the ASGI app (asgi.py).
+#
+# A handler takes a request exposing path, headers, values, form and files
+# the way Flask's request does (asgi.py builds one from the same werkzeug
+# datastructures) and returns a Reply, which each app turns into its own
+# response. The verification handlers have an async twin that awaits the
+# OCR backend; every other handler blocks and the ASGI app runs it on an
+# executor thread.
+
+log = structuredLog.get_logger(__name__)
+
+# download_name set: send body as an attachment; content_type None: no body (304)
+Reply = namedtuple('Reply', ['status', 'body', 'content_type', 'headers', 'download_name'], defaults=(None, None))
+
+TEXT = 'text/html; charset=utf-8'
+
+
+def text(body, status=200):
+    return Reply(status, body.encode('utf-8'), TEXT)
+
+
+def json_reply(data, status=200, headers=None):
+    # Same bytes as Flask's jsonify outside debug mode
+    body = json.dumps(data, sort_keys=True, separators=(',', ':')) + "\n"
+    return Reply(status, body.encode('utf-8'), 'application/json', headers)
+
+
+def missing_file():
+    return text("No file uploaded", 400)
+
+
+def image_pool_error(e):
+    """503 while the image pool queue is full, 504 when a task timed out"""
+    if isinstance(e, imagePool.PoolBusyError):
+        return json_reply({'error': str(e)}, 503, {'Retry-After': '1'})
+    return json_reply({'error': str(e)}, 504)
+
+
+def image_rejected(e):
+    """413 for uploads over the pixel budget, 422 for unreadable images and oversized outputs"""
+    return json_reply({'error': str(e), 'reason': e.reason}, e.status)
+
+
+def _image_failure(e, description):
+    """
+    Returns: the Reply for an exception raised while serving an image route
+    Raises: werkzeug HTTP errors (413 past MAX_CONTENT_LENGTH), left to the app
+    """
+    if isinstance(e, HTTPException):
+        raise e
+    if isinstance(e, imageAdmission.ImageRejectedError):
+        return image_rejected(e)
+    if isinstance(e, imagePool.ImagePoolError):
+        return image_pool_error(e)
+    log.exception(f"Error in {description}")
+    return text(f"Error: {str(e)}", 500)
+
+
+def _upload(request):
+    """
+    Returns: the uploaded 'file', or None when there is none or it has no name
+    """
+    upload = request.files.get('file')
+    if upload is None or upload.filename == "":
+        return None
+    return upload
+
+
+def _output(request, lossy=False):
+    """Output format of a request, from the format parameter or the Accept header"""
+    return outputFormat.choose(request.values.get('format'), request.headers.get('Accept'), lossy)
+
+
+def _image_entry(result, name, output=None):
+    """An imageOps pipeline result as a cacheable body with its size/quality report headers"""
+    headers = {
+        'X-Original-Size': str(result['original_size']),
+        'X-Achieved-Size': str(result['size']),
+        'X-Encode-Passes': str(result['passes']),
+    }
+    if result['target_bytes'] is not None:
+        headers['X-Target-Size'] = str(result['target_bytes'])
+        headers['X-Target-Met'] = 'true' if result['target_met'] else 'false'
+    if result['quality'] is not None:
+        headers['X-Quality'] = str(result['quality'])
+    if output is not None:
+        headers.update(outputFormat.report(result, output))
+    extension = result.get('extension', 'jpeg')
+    return resultCache.Entry(result['buffer'].getvalue(), result.get('mimetype', 'image/jpeg'), f"{name}.{extension}", headers)
+
+
+def cached_image(request, upload, params, compute, name, output=None):
+    """
+    Answers 304 to a matching If-None-Match, or sends the derivative from the
+    result cache, or runs compute() and caches what it returns
+    params: everything besides the upload and route that determines the output
+    compute: returns an imageOps pipeline result, or None when the input is refused
+    Returns: Reply, or None when compute() returned None
+    """
+    cache_key = resultCache.key(request.path, upload, params)
+    if resultCache.not_modified(request.headers.get('If-None-Match'), cache_key):
+        headers = {'ETag': resultCache.etag(cache_key), 'Cache-Control': 'no-cache'}
+        if output is not None:
+            headers['Vary'] = 'Accept'
+        return Reply(304, b'', None, headers)
+    entry = resultCache.get(cache_key)
+    status = 'hit'
+    if entry is None:
+        result = compute()
+        if not result:
+            return None
+        entry = _image_entry(result, name, output)
+        resultCache.put(cache_key, entry)
+        status = 'miss'
+    headers = dict(entry.headers, **{'ETag': resultCache.etag(cache_key), 'X-Cache': status})
+    return Reply(200, entry.body, entry.mimetype, headers, entry.download_name)
+
+
+def _aadhar_reply(result, from_image):
+    is_valid, num, confidence = result
+    if from_image:
+        message = 'Aadhar card verified successfully' if is_valid else 'Invalid or unreadable Aadhar card'
+    else:
+        message = 'Valid Aadhar number' if is_valid else 'Invalid Aadhar number format'
+    return json_reply({'valid': bool(is_valid), 'number': str(num), 'confidence': int(confidence), 'message': message})
+
+
+def _aadhar_failed(e):
+    log.exception("Error in aadhar verification")
+    return json_reply({
+        'valid': False,
+        'number': '',
+        'confidence': 0,
+        'error': str(e),
+        'message': 'Error processing Aadhar verification'
+    }, 403)
+
+
+def aadhar(request):
+    """
+    /aadharVerification: OCR of an uploaded card, or a check of a typed number
+    Returns: Reply
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is None:
+            return _aadhar_reply(aadharVerification.aadhar_auth_number(request.form.get("number", "")), False)
+        if upload.filename == "":
+            return missing_file()
+        return _aadhar_reply(aadharVerification.aadhar_auth_img(upload.read()), True)
+    except Exception as e:
+        return _aadhar_failed(e)
+
+
+async def aadhar_async(request):
+    """
+    aadhar() awaiting the OCR backend instead of blocking on it
+    Returns: Reply
+    """
+    try:
+        upload = _upload(request)
+        if upload is None:
+            return aadhar(request)
+        return _aadhar_reply(await aadharVerification.aadhar_auth_img_async(upload.read()), True)
+    except Exception as e:
+        return _aadhar_failed(e)
+
+
+def _pan_reply(result, from_image):
+    is_valid, num, confidence = result
+    if from_image:
+        message = 'PAN card verified successfully' if is_valid else 'Invalid or unreadable PAN card'
+    else:
+        message = 'Valid PAN number' if is_valid else 'Invalid PAN number format'
+    return json_reply({
+        'valid': bool(is_valid),
+        'number': str(num),
+        'confidence': int(confidence),
+        'holder_type': panVerification.get_pan_holder_type(num) if num else '',
+        'message': message
+    })
+
+
+def _pan_failed(e):
+    log.exception("Error in PAN verification")
+    return json_reply({
+        'valid': False,
+        'number': '',
+        'confidence': 0,
+        'error': str(e),
+        'message': 'Error processing PAN verification'
+    }, 400)
+
+
+def pan(request):
+    """
+    /panVerification: OCR of an uploaded card, or a check of a typed number
+    Returns: Reply
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is None:
+            return _pan_reply(panVerification.pan_auth_number(request.form.get("number", "")), False)
+        if upload.filename == "":
+            return missing_file()
+        return _pan_reply(panVerification.pan_auth_img(upload.read()), True)
+    except Exception as e:
+        return _pan_failed(e)
+
+
+async def pan_async(request):
+    """
+    pan() awaiting the OCR backend instead of blocking on it
+    Returns: Reply
+    """
+    try:
+        upload = _upload(request)
+        if upload is None:
+            return pan(request)
+        return _pan_reply(await panVerification.pan_auth_img_async(upload.read()), True)
+    except Exception as e:
+        return _pan_failed(e)
+
+
+def resize_route(resize, description):
+    """
+    Returns: a handler for a resize route taking width and height form fields
+    resize(stream, width, height, output) returns an imageOps pipeline result,
+    or None when the requested size is not allowed
+    """
+    def handler(request):
+        try:
+            upload = _upload(request)
+            if upload is None:
+                return missing_file()
+            height = int(request.form.get('height', 0))
+            width = int(request.form.get('width', 0))
+            output = _output(request)
+            step = outputFormat.operation(output)
+            reply = cached_image(
+                request, upload.stream, {'width': width, 'height': height, 'format': step},
+                lambda: resize(upload.stream, width, height, step), 'resized', output)
+            if reply is None:
+                return text("Inappropriate size", 400)
+            return reply
+        except outputFormat.OutputFormatError as e:
+            return text(str(e), 400)
+        except ValueError as e:
+            # Non-numeric or non-positive width/height
+            return text(f"Invalid parameters: {str(e)}", 400)
+        except Exception as e:
+            return _image_failure(e, description)
+
+    return handler
+
+
+pan_resize_mar = resize_route(
+    lambda stream, width, height, output: panResize.resize_pan_mar(stream, height=height, width=width, output=output),
+    'PAN resize MAR')
+pan_resize_hard = resize_route(
+    lambda stream, width, height, output: panResize.resize_pan_hard(stream, height=height, width=width, output=output),
+    'PAN resize hard')
+aadhar_resize_hard = resize_route(
+    lambda stream, width, height, output: aadharResize.resize_aadhar_hard(stream, height=height, width=width, output=output),
+    'Aadhar resize hard')
+aadhar_resize_mar = resize_route(
+    lambda stream, width, height, output: aadharResize.resize_aadhar_mar(stream, height=height, width=width, output=output),
+    'Aadhar resize MAR')
+# General image resizes (for any image); MAR derives the height from the width and the source aspect ratio
+resize_mar = resize_route(
+    lambda stream, width, height, output: imageOps.resize_image(stream, width, height, keep_aspect=True, output=output),
+    'general resize MAR')
+resize_hard = resize_route(
+    lambda stream, width, height, output: imageOps.resize_image(stream, width, height, output=output),
+    'general resize hard')
+
+
+def reduce(request):
+    """
+    /reduceSize: re-encodes an upload to an optional byte budget
+    Returns: Reply
+    """
+    try:
+        upload = _upload(request)
+        if upload is None:
+            return missing_file()
+        # Optional budget: target_bytes / target_kb, or target_ratio of the upload size
+        target_bytes = int(request.values.get('target_bytes', 0)) or int(float(request.values.get('target_kb', 0)) * 1024) or None
+        target_ratio = float(request.values.get('target_ratio', 0)) or None
+        if (target_bytes or 0) < 0 or (target_ratio or 0) < 0:
+            raise ValueError("the target must be positive")
+        output = _output(request, lossy=True)
+        step = outputFormat.operation(output, reduce=True)
+        reply = cached_image(
+            request, upload.stream, {'target_bytes': target_bytes, 'target_ratio': target_ratio, 'format': step},
+            lambda: reduceSize.reduce_to_target(upload.stream, target_bytes=target_bytes, target_ratio=target_ratio, output=step),
+            'reduced', output)
+        if reply is None:
+            return text("Error reducing size", 500)
+        return reply
+    except outputFormat.OutputFormatError as e:
+        return text(str(e), 400)
+    except ValueError as e:
+        # Non-numeric or non-positive budget
+        return text(f"Invalid parameters: {str(e)}", 400)
+    except Exception as e:
+        return _image_failure(e, "reduce size")
+
+
+def pipeline(request):
+    """
+    /pipeline: runs several image operations (resize, fit, reduce, format) on one upload
+    Returns: Reply
+    """
+    try:
+        upload = _upload(request)
+        if upload is None:
+            return missing_file()
+        operations, output = outputFormat.with_output(
+            request.values.get('ops', ''), request.values.get('format'), request.headers.get('Accept'))
+        return cached_image(
+            request, upload.stream, {'ops': operations},
+            lambda: imageOps.run_pipeline(upload.stream, operations), 'processed', output)
+    except ValueError as e:
+        return text(f"Invalid operations: {str(e)}", 400)
+    except Exception as e:
+        return _image_failure(e, "pipeline")
+
+
+def health(request):
+    return json_reply({"status": "healthy"})
+
+
+def metrics_page(request):
+    if not metrics.available():
+        return json_reply({'error': 'prometheus_client is not installed'}, 501)
+    body, content_type = metrics.render()
+    return Reply(200, body, content_type)
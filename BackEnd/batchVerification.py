@@ -0,0 +1,98 @@
+import aadharVerification
+import panVerification
+import structuredLog
+import textDetection
+
+log = structuredLog.get_logger(__name__)
+
+
+def _aadhar_result(full_text):
+    is_valid, num, confidence = aadharVerification.aadhar_auth_text(full_text)
+    return {
+        'valid': bool(is_valid),
+        'number': str(num),
+        'confidence': int(confidence),
+        'message': 'Aadhar card verified successfully' if is_valid else 'Invalid or unreadable Aadhar card'
+    }
+
+
+def _pan_result(full_text):
+    is_valid, num, confidence = panVerification.pan_auth_text(full_text)
+    return {
+        'valid': bool(is_valid),
+        'number': str(num),
+        'confidence': int(confidence),
+        'holder_type': panVerification.get_pan_holder_type(num) if num else '',
+        'message': 'PAN card verified successfully' if is_valid else 'Invalid or unreadable PAN card'
+    }
+
+
+DOCUMENT_TYPES = {
+    'aadhar': _aadhar_result,
+    'pan': _pan_result,
+}
+
+
+def _error_result(index, filename, error):
+    return {
+        'index': index,
+        'filename': filename,
+        'valid': False,
+        'number': '',
+        'confidence': 0,
+        'error': error,
+        'message': 'Error processing document'
+    }
+
+
+def verify_batch(files, doc_type):
+    """
+    Verifies many uploaded documents with batched Vision calls
+    files: list of (filename, file-like object or bytes)
+    Yields: one result dict per document, in input order, as each batch completes
+    """
+    build_result = DOCUMENT_TYPES[doc_type]
+
+    for start in range(0, len(files), textDetection.BATCH_LIMIT):
+        chunk = files[start:start + textDetection.BATCH_LIMIT]
+
+        # Read only the current chunk so a large batch is never held in memory at once
+        images = []
+        read_errors = {}
+        for offset, (filename, source) in enumerate(chunk):
+            try:
+                images.append(source if isinstance(source, bytes) else source.read())
+            except Exception as e:
+                read_errors[offset] = str(e)
+                images.append(b'')
+
+        readable = [offset for offset in range(len(chunk)) if offset not in read_errors and images[offset]]
+        try:
+            ocr_results = textDetection.detect_text_batch([images[offset] for offset in readable])
+        except Exception as e:
+            log.exception("Batch OCR failed")
+            ocr_results = [(None, f"EXCEPTION: {str(e)}")] * len(readable)
+        ocr_by_offset = dict(zip(readable, ocr_results))
+
+        for offset, (filename, _) in enumerate(chunk):
+            index = start + offset
+            if offset in read_errors:
+                yield _error_result(index, filename, read_errors[offset])
+                continue
+            if offset not in ocr_by_offset:
+                yield _error_result(index, filename, 'EMPTY_FILE')
+                continue
+
+            full_text, error = ocr_by_offset[offset]
+            if error:
+                yield _error_result(index, filename, error)
+                continue
+
+            try:
+                result = build_result(full_text)
+            except Exception as e:
+                yield _error_result(index, filename, f"EXCEPTION: {str(e)}")
+                continue
+            result['index'] = index
+            result['filename'] = filename
+            yield result
@@ -0,0 +1,186 @@
+import io
+import csv
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import aadharVerification
+import panVerification
+
+# Bulk validation of stored Aadhar and PAN numbers.
+#
+# Input is a CSV or NDJSON stream that is read row by row, validated in
+# fixed-size chunks and written back as one result per row, so memory use
+# does not grow with the input size. With NumPy installed the Verhoeff
+# checksum runs over a (rows x 12) digit matrix instead of digit by digit.
+
+CHUNK_SIZE = 65536
+
+# Field names tried, in order, for the number in CSV headers and NDJSON objects
+NUMBER_FIELDS = ('number', 'aadhar', 'aadhaar', 'pan', 'id')
+
+if np is not None:
+    _D = np.array(aadharVerification._VERHOEFF_D, dtype=np.uint8)
+    _P = np.array(aadharVerification._VERHOEFF_P, dtype=np.uint8)
+
+
+def _pick_number(record):
+    for field in NUMBER_FIELDS:
+        if field in record:
+            return record[field]
+    return next(iter(record.values()), '')
+
+
+def detect_format(content_type='', filename=''):
+    """
+    Returns: 'ndjson' or 'csv' from a content type or file name
+    """
+    content_type = (content_type or '').lower()
+    filename = (filename or '').lower()
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+        return 'ndjson'
+    if filename.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'csv'
+
+
+def iter_numbers(stream, fmt='csv'):
+    """
+    Reads numbers from a binary or text stream one row at a time
+    CSV input may have a header naming one of NUMBER_FIELDS; otherwise the
+    first column is used. NDJSON lines may be objects or bare strings.
+    Yields: raw number strings (unparseable rows yield '')
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8', errors='replace', newline='')
+
+    if fmt == 'ndjson':
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield ''
+                continue
+            value = _pick_number(record) if isinstance(record, dict) else record
+            yield '' if value is None else str(value)
+        return
+
+    reader = csv.reader(stream)
+    column = 0
+    for row_number, row in enumerate(reader):
+        if not row:
+            continue
+        if row_number == 0:
+            header = [cell.strip().lower() for cell in row]
+            named = [field for field in NUMBER_FIELDS if field in header]
+            if named:
+                column = header.index(named[0])
+                continue
+        yield row[column] if column < len(row) else ''
+
+
+def _chunks(values, size):
+    chunk = []
+    for value in values:
+        chunk.append(value)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _clean_aadhar(number):
+    clean = number.replace(" ", "").replace("-", "")
+    # isdigit() alone accepts non-ASCII digits such as '２' or '٣'
+    if len(clean) == 12 and clean.isascii() and clean.isdigit() and clean[0] in '23456789':
+        return clean
+    return None
+
+
+def verhoeff_valid_many(numbers):
+    """
+    Verhoeff-checks many 12 digit strings at once
+    Returns: list of bools in input order
+    """
+    if not numbers:
+        return []
+    if np is None:
+        return [aadharVerification._verhoeff_validate(number) for number in numbers]
+
+    # One row of digits per number, least significant digit first
+    digits = np.frombuffer(''.join(numbers).encode('ascii'), dtype=np.uint8).reshape(len(numbers), 12)
+    digits = digits[:, ::-1] - ord('0')
+    check = np.zeros(len(numbers), dtype=np.uint8)
+    for position in range(12):
+        check = _D[check, _P[position % 8, digits[:, position]]]
+    return (check == 0).tolist()
+
+
+def validate_aadhar_numbers(numbers, chunk_size=CHUNK_SIZE):
+    """
+    Validates an iterable of Aadhar numbers in chunks
+    Yields: (is_valid, formatted_number) per input, in order;
+            formatted_number is '' for invalid numbers
+    """
+    for chunk in _chunks(numbers, chunk_size):
+        cleaned = [_clean_aadhar(number) for number in chunk]
+        candidates = [number for number in cleaned if number is not None]
+        checks = iter(verhoeff_valid_many(candidates))
+        for number in cleaned:
+            if number is not None and next(checks):
+                yield True, f"{number[0:4]} {number[4:8]} {number[8:12]}"
+            else:
+                yield False, ''
+
+
+def validate_aadhar_stream(stream, fmt='csv', chunk_size=CHUNK_SIZE):
+    """
+    Validates a CSV/NDJSON stream of Aadhar numbers
+    Yields: one result dict per row, then a final {'summary': {...}} dict
+    """
+    total = valid = 0
+    for row, (is_valid, number) in enumerate(validate_aadhar_numbers(iter_numbers(stream, fmt), chunk_size)):
+        total += 1
+        valid += is_valid
+        yield {'row': row, 'valid': is_valid, 'number': number}
+    yield {'summary': {'total': total, 'valid': valid, 'invalid': total - valid}}
+
+
+def validate_pan_numbers(numbers):
+    """
+    Validates an iterable of PAN numbers
+    Yields: (is_valid, pan_number, holder_type) per input, in order;
+            pan_number and holder_type are '' for invalid numbers
+    """
+    structure = panVerification.PAN_STRUCTURE.fullmatch
+    holder_types = panVerification.PAN_HOLDER_TYPES
+    for number in numbers:
+        clean = number.strip().upper().replace(" ", "").replace("-", "")
+        if structure(clean):
+            yield True, clean, holder_types[clean[3]]
+        else:
+            yield False, '', ''
+
+
+def validate_pan_stream(stream, fmt='csv'):
+    """
+    Validates a CSV/NDJSON stream of PAN numbers
+    Yields: one result dict per row, then a final {'summary': {...}} dict
+            whose holder_types counts valid numbers per holder category
+    """
+    total = valid = 0
+    holder_counts = dict.fromkeys(panVerification.PAN_HOLDER_TYPES.values(), 0)
+    for row, (is_valid, number, holder_type) in enumerate(validate_pan_numbers(iter_numbers(stream, fmt))):
+        total += 1
+        if is_valid:
+            valid += 1
+            holder_counts[holder_type] += 1
+        yield {'row': row, 'valid': is_valid, 'number': number, 'holder_type': holder_type}
+    yield {'summary': {'total': total, 'valid': valid, 'invalid': total - valid, 'holder_types': holder_counts}}
@@ -0,0 +1,143 @@
+import os
+import math
+from PIL import Image
+
+import metrics
+import structuredLog
+
+# Admission control for uploaded images, before any pixel is decoded.
+#
+# Image.open only parses the header, which is enough to learn the format,
+# mode and declared dimensions. A 50KB PNG can declare 30000x30000 pixels
+# and inflate to gigabytes on load(), so the image routes check the header
+# against IMAGE_MAX_PIXELS first. A JPEG over the budget is downgraded:
+# libjpeg decodes it at 1/2, 1/4 or 1/8 scale (draft mode) so the decoded
+# pixels fit. Other formats over the budget are refused with 413. Headers
+# that cannot be read and requested outputs larger than
+# IMAGE_MAX_OUTPUT_PIXELS are refused with 422. Every format Pillow opens is
+# accepted unless IMAGE_FORMATS lists the ones to keep (e.g. JPEG,PNG,WEBP).
+
+MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50_000_000)))
+MAX_OUTPUT_PIXELS = int(os.getenv('IMAGE_MAX_OUTPUT_PIXELS', str(MAX_PIXELS)))
+FORMATS = tuple(fmt.strip().upper() for fmt in os.getenv('IMAGE_FORMATS', '').split(',') if fmt.strip())
+
+# Scales libjpeg can decode at
+DRAFT_SCALES = (1, 2, 4, 8)
+
+# Pillow refuses images over twice MAX_IMAGE_PIXELS inside Image.open, and
+# warns over it, before check() sees them. Raise its limit to what the
+# smallest draft scale can bring within budget, so a JPEG is downgraded as
+# long as 1/8 scale fits and check() refuses the rest with 413.
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS * DRAFT_SCALES[-1] ** 2
+
+ADMITTED = 'admitted'
+DOWNGRADED = 'downgraded'
+
+log = structuredLog.get_logger(__name__)
+
+
+class ImageRejectedError(Exception):
+    """An upload refused from its header; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=413, reason='pixels'):
+        # All three in args so the error survives pickling from a pool process
+        super().__init__(message, status, reason)
+        self.status = status
+        self.reason = reason
+
+    def __str__(self):
+        return self.args[0]
+
+
+def open_image(stream):
+    """
+    Parses only the header of an encoded image
+    Returns: PIL image, not decoded yet
+    Raises: ImageRejectedError for unreadable or unsupported images and for
+            Pillow's own decompression bomb limit
+    """
+    try:
+        return Image.open(stream, formats=FORMATS or None)
+    except Image.DecompressionBombError:
+        raise ImageRejectedError(f"Image exceeds the budget of {MAX_PIXELS} pixels", 413, 'pixels')
+    except (Image.UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        accepted = ', '.join(FORMATS) if FORMATS else 'any Pillow format'
+        raise ImageRejectedError(f"Unreadable or unsupported image ({accepted} accepted)", 422, 'format')
+
+
+def decode_scale(size):
+    """
+    Returns: smallest draft scale at which an image of this size fits
+             IMAGE_MAX_PIXELS, or None if it does not fit even at 1/8
+    """
+    width, height = size
+    for scale in DRAFT_SCALES:
+        if math.ceil(width / scale) * math.ceil(height / scale) <= MAX_PIXELS:
+            return scale
+    return None
+
+
+def draft_size(size, scale):
+    """
+    Returns: the size to pass to Image.draft so a JPEG decodes at 1/scale
+    """
+    return max(1, size[0] // scale), max(1, size[1] // scale)
+
+
+def decoded_size(size, scale):
+    """
+    Returns: the size libjpeg produces when decoding at 1/scale
+    """
+    return math.ceil(size[0] / scale), math.ceil(size[1] / scale)
+
+
+def check(img, plan=None):
+    """
+    Checks an opened, not yet decoded image against the pixel budgets
+    plan: function from the decoded size to the output size, checked
+          against IMAGE_MAX_OUTPUT_PIXELS
+    Returns: (scale, output_size) - scale is 1 to decode at full size, or
+             the draft scale (2, 4 or 8) a JPEG over IMAGE_MAX_PIXELS must be
+             decoded at; output_size is None without plan
+    Raises: ImageRejectedError
+    """
+    width, height = img.size
+    scale = 1
+    if width * height > MAX_PIXELS:
+        scale = decode_scale(img.size) if img.format == 'JPEG' else None
+        if scale is None:
+            raise ImageRejectedError(
+                f"{img.format} image of {width}x{height} exceeds the budget of {MAX_PIXELS} pixels", 413, 'pixels'
+            )
+    # A downgraded image is planned from the size it is decoded at, so
+    # size-preserving operations do not scale it back up
+    planned = plan(decoded_size(img.size, scale)) if plan else None
+    if planned is not None and planned[0] * planned[1] > MAX_OUTPUT_PIXELS:
+        raise ImageRejectedError(
+            f"Requested output of {planned[0]}x{planned[1]} exceeds the budget of {MAX_OUTPUT_PIXELS} pixels",
+            422, 'output_pixels'
+        )
+    return scale, planned
+
+
+def admit(stream, plan=None):
+    """
+    Header-only admission of one upload, counted in the admission metrics
+    plan: function from the decoded size to the output size, for the output budget
+    Returns: (image, scale) - the undecoded image and the draft scale to decode at
+    Raises: ImageRejectedError
+    """
+    try:
+        img = open_image(stream)
+        metrics.IMAGE_DECLARED_PIXELS.observe(img.width * img.height)
+        scale, _ = check(img, plan)
+    except ImageRejectedError as e:
+        metrics.IMAGE_ADMISSIONS.labels(f"rejected_{e.reason}").inc()
+        log.warning("Image rejected before decode", extra={'reason': e.reason, 'error': str(e)})
+        raise
+    decision = ADMITTED if scale == 1 else DOWNGRADED
+    metrics.IMAGE_ADMISSIONS.labels(decision).inc()
+    if scale > 1:
+        log.info("Image downgraded to fit the pixel budget",
+                 extra={'format': img.format, 'mode': img.mode, 'width': img.width, 'height': img.height, 'scale': scale})
+    return img, scale
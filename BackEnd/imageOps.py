@@ -0,0 +1,568 @@
+import os
+import json
+import math
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+try:
+    # Registers an AVIF encoder with Pillow versions that lack one
+    import pillow_avif
+except ImportError:
+    pillow_avif = None
+
+import imageAdmission
+import imagePool
+import stageTimer
+
+# Single-pass image pipeline shared by the Aadhar/PAN resize functions, the
+# generic resize routes, /reduceSize and /pipeline.
+#
+# A request is a list of operations, e.g.
+#
+#   [{"op": "resize", "width": 300},
+#    {"op": "reduce", "target_kb": 100},
+#    {"op": "format", "format": "JPEG"}]
+#
+# The upload is decoded once, all geometry steps are folded into a single
+# resample, and the result is encoded once (or, for "reduce", by a bounded
+# quality search over the same decoded pixels).
+#
+# When the target is much smaller than the source, JPEGs are decoded with
+# libjpeg's scaled IDCT (draft mode, 1/2, 1/4 or 1/8 scale) and the remaining
+# reduction uses Pillow's reducing_gap, so a 12MP photo is never fully
+# decoded just to produce a 200px thumbnail.
+#
+# Before anything is decoded, or handed to the image pool, the header is
+# checked by imageAdmission against the pixel budgets.
+#
+# Above IMAGE_STRIP_PIXELS the decoded image is converted, flattened and
+# resized IMAGE_STRIP_ROWS rows at a time, instead of making a full-size
+# converted copy, a full-size white background and alpha bands next to it.
+# A resize keeps only a target-width image a few times the target height
+# (the source height for images with alpha) besides the decoded source and
+# the current strip. The output is pixel for pixel the same as without strips.
+
+# Keep at least this factor between the draft-decoded size and the target so
+# the final LANCZOS pass still has enough detail to work with
+REDUCING_GAP = float(os.getenv('RESIZE_REDUCING_GAP', '2.0'))
+
+MIN_QUALITY = 5
+MAX_QUALITY = 95
+DEFAULT_QUALITY = 95
+MAX_PASSES = int(os.getenv('REDUCE_MAX_PASSES', '8'))
+# Candidate qualities encoded in parallel per search round (1 = plain bisection)
+WORKERS = int(os.getenv('REDUCE_WORKERS', '1'))
+# Decoded images above this many pixels are processed in strips (0 = never)
+STRIP_PIXELS = int(os.getenv('IMAGE_STRIP_PIXELS', str(8_000_000)))
+STRIP_ROWS = int(os.getenv('IMAGE_STRIP_ROWS', '256'))
+
+# Modes Image.resize premultiplies by alpha before resampling
+PREMULTIPLIED = {'RGBA': 'RGBa', 'LA': 'La'}
+
+# Format name -> (mimetype, file extension, supports quality)
+FORMATS = {
+    'JPEG': ('image/jpeg', 'jpeg', True),
+    'WEBP': ('image/webp', 'webp', True),
+    'PNG': ('image/png', 'png', False),
+}
+Image.init()
+if 'AVIF' in Image.SAVE:
+    FORMATS['AVIF'] = ('image/avif', 'avif', True)
+
+GEOMETRY_OPS = ('resize', 'fit')
+OPERATIONS = GEOMETRY_OPS + ('reduce', 'format')
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def _executor():
+    # One pool for the life of the process, sized once: a pool replaced while
+    # another request is still mapping on it would leak its threads. Callers
+    # asking for more candidates than it has threads just wait for one.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(WORKERS, os.cpu_count() or 1), thread_name_prefix='encode')
+        return _pool
+
+
+def _positive_int(op, name, required=True):
+    value = op.get(name)
+    if value in (None, '') and not required:
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{op['op']}' needs an integer '{name}'")
+    if value <= 0:
+        raise ValueError(f"'{op['op']}' needs a positive '{name}'")
+    return value
+
+
+def parse_operations(operations):
+    """
+    Validates and normalises a pipeline description
+    operations: list of dicts or its JSON text
+    Returns: list of normalised operation dicts
+    Raises: ValueError describing the first invalid step
+    """
+    if isinstance(operations, (str, bytes)):
+        try:
+            operations = json.loads(operations)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Operations are not valid JSON: {e}")
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("Operations must be a non-empty list")
+
+    parsed = []
+    for op in operations:
+        if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+            raise ValueError(f"Unknown operation {op!r}, expected one of {list(OPERATIONS)}")
+        name = op['op']
+        if name == 'resize':
+            parsed.append({
+                'op': name,
+                'width': _positive_int(op, 'width'),
+                # Without a height the aspect ratio is kept
+                'height': _positive_int(op, 'height', required=False),
+            })
+        elif name == 'fit':
+            parsed.append({'op': name, 'width': _positive_int(op, 'width'), 'height': _positive_int(op, 'height')})
+        elif name == 'reduce':
+            target_bytes = op.get('target_bytes') or (op.get('target_kb') and int(float(op['target_kb']) * 1024))
+            target_ratio = op.get('target_ratio')
+            if not target_bytes and not target_ratio:
+                raise ValueError("'reduce' needs target_bytes, target_kb or target_ratio")
+            parsed.append({
+                'op': name,
+                'target_bytes': int(target_bytes) if target_bytes else None,
+                'target_ratio': float(target_ratio) if target_ratio else None,
+                'max_passes': int(op.get('max_passes') or MAX_PASSES),
+                # Lowest quality the search may go down to
+                'min_quality': min(MAX_QUALITY, max(MIN_QUALITY, int(op.get('min_quality') or MIN_QUALITY))),
+            })
+        else:
+            fmt = str(op.get('format', 'JPEG')).upper().replace('JPG', 'JPEG')
+            if fmt not in FORMATS:
+                raise ValueError(f"Unsupported format '{fmt}', expected one of {list(FORMATS)}")
+            quality = op.get('quality')
+            parsed.append({
+                'op': name,
+                'format': fmt,
+                'quality': int(quality) if quality else None,
+                # Progressive (and Huffman optimised) JPEG
+                'progressive': bool(op.get('progressive')) and fmt == 'JPEG',
+                'optimize': bool(op.get('optimize')),
+                # Also report the size of the same output as a quality 95 JPEG
+                'baseline': bool(op.get('baseline')),
+            })
+
+    formats = [op for op in parsed if op['op'] == 'format']
+    reduces = [op for op in parsed if op['op'] == 'reduce']
+    if len(formats) > 1 or len(reduces) > 1:
+        raise ValueError("At most one 'format' and one 'reduce' step are allowed")
+    if reduces and formats and not FORMATS[formats[0]['format']][2]:
+        raise ValueError(f"'reduce' needs a lossy format, not {formats[0]['format']}")
+    return parsed
+
+
+def target_size(size, width, height, keep_aspect):
+    """
+    Returns the output size for a resize request
+    keep_aspect derives the height from width and the source aspect ratio
+    """
+    if keep_aspect:
+        source_width, source_height = size
+        return width, int(width * (source_height / source_width))
+    return width, height
+
+
+def _apply_geometry(size, op):
+    if op['op'] == 'resize':
+        return target_size(size, op['width'], op['height'], keep_aspect=op['height'] is None)
+    # fit: largest size inside the box that keeps the aspect ratio, never upscaling
+    scale = min(op['width'] / size[0], op['height'] / size[1], 1.0)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def plan_size(size, operations):
+    """
+    Returns the final output size after all geometry steps
+    """
+    for op in operations:
+        if op['op'] in GEOMETRY_OPS:
+            size = _apply_geometry(size, op)
+    return size
+
+
+def _normalise_mode(img):
+    # Resample in a mode LANCZOS supports: palette and bilevel images are expanded first
+    if img.mode == 'P':
+        return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    if img.mode in ('1', 'I;16', 'I', 'F'):
+        return img.convert('L')
+    if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        return img.convert('RGB')
+    return img
+
+
+def flatten_for(img, fmt):
+    """
+    Converts an image to a mode the output format can store
+    Transparency is flattened onto white for formats without alpha
+    """
+    if fmt == 'JPEG' and img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        # getchannel copies only the alpha band, split() would copy all of them
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+        return img.convert('RGB')
+    return img
+
+
+def encoder_options(format_op):
+    """
+    Returns: Image.save options for a parsed 'format' step, besides quality
+    """
+    options = {}
+    if format_op.get('optimize') or format_op.get('progressive'):
+        options['optimize'] = True
+    if format_op.get('progressive'):
+        options['progressive'] = True
+    return options
+
+
+def encode_buffer(img, fmt='JPEG', quality=None, **options):
+    """
+    Encodes straight into an in-memory buffer that can be streamed as is
+    Returns: BytesIO positioned at the start of the encoded image
+    """
+    img.load()
+    output = BytesIO()
+    params = dict(options)
+    if FORMATS[fmt][2]:
+        params['quality'] = quality or DEFAULT_QUALITY
+    img.save(output, format=fmt, **params)
+    output.seek(0)
+    return output
+
+
+def encode(img, fmt='JPEG', quality=None, **options):
+    """
+    Returns: encoded image bytes
+    """
+    return encode_buffer(img, fmt, quality, **options).getvalue()
+
+
+def buffer_size(buffer):
+    """
+    Returns: number of bytes in a BytesIO without copying it
+    """
+    return buffer.getbuffer().nbytes
+
+
+def result_bytes(result):
+    """
+    Returns: the encoded output of a pipeline result as bytes
+    """
+    buffer = result['buffer']
+    buffer.seek(0)
+    return buffer.read()
+
+
+def encode_jpeg(img, quality=DEFAULT_QUALITY):
+    """
+    Returns: JPEG bytes
+    """
+    return encode(img, 'JPEG', quality)
+
+
+def _probe_qualities(lo, hi, count):
+    # Evenly spaced qualities across the current search range
+    if count <= 1 or hi - lo + 1 <= count:
+        return [(lo + hi) // 2] if count <= 1 else list(range(lo, hi + 1))
+    step = (hi - lo) / (count + 1)
+    return sorted({round(lo + step * (i + 1)) for i in range(count)})
+
+
+def encode_to_target(img, fmt, target_bytes, max_passes=None, workers=None, min_quality=None, **options):
+    """
+    Finds the highest quality whose output fits target_bytes with a bounded
+    bisection search between min_quality (default MIN_QUALITY) and MAX_QUALITY
+    over one decoded image
+    Returns: (buffer, quality, passes) - the lowest quality tried when nothing fits
+    """
+    max_passes = max_passes or MAX_PASSES
+    workers = max(1, workers or WORKERS)
+    # Decode before encodes run in parallel. Image.save keeps its encoder
+    # options on the image, so each concurrent encode gets its own copy.
+    img.load()
+    images = [img] + [img.copy() for _ in range(workers - 1)]
+
+    lo, hi = min_quality or MIN_QUALITY, MAX_QUALITY
+    passes = 0
+    best = None      # (quality, buffer) of the highest quality that fits
+    smallest = None  # (quality, buffer) of the lowest quality tried
+
+    while lo <= hi and passes < max_passes:
+        qualities = _probe_qualities(lo, hi, min(workers, max_passes - passes))
+        if len(qualities) > 1:
+            encoded = list(_executor().map(
+                lambda image, q: (q, encode_buffer(image, fmt, q, **options)), images, qualities))
+        else:
+            encoded = [(qualities[0], encode_buffer(img, fmt, qualities[0], **options))]
+        passes += len(encoded)
+
+        if smallest is None or encoded[0][0] < smallest[0]:
+            smallest = encoded[0]
+
+        fitting = [(q, buffer) for q, buffer in encoded if buffer_size(buffer) <= target_bytes]
+        if fitting:
+            quality, buffer = fitting[-1]
+            if best is None or quality > best[0]:
+                best = (quality, buffer)
+            lo = quality + 1
+            above = [q for q, _ in encoded if q > quality]
+            if above:
+                hi = min(above) - 1
+        else:
+            hi = encoded[0][0] - 1
+
+    quality, buffer = best if best is not None else smallest
+    return buffer, quality, passes
+
+
+def as_stream(source):
+    """
+    Returns a readable stream for bytes or an upload stream, rewound to the start
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        # BytesIO shares an immutable bytes object instead of copying it
+        return BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def source_size(source):
+    """
+    Returns: size in bytes of an encoded upload given as bytes or a stream
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def open_for_size(source, operations):
+    """
+    Opens an image and, for JPEGs, enables draft decoding for the planned
+    output size and the pixel budget
+    source: encoded bytes or a seekable stream such as a spooled upload
+    Returns: (image, output_size) - the image is not decoded yet
+    Raises: imageAdmission.ImageRejectedError
+    """
+    # Decoding reads from the stream, so the upload never has to be copied into memory
+    img = imageAdmission.open_image(as_stream(source))
+    # Plan from the header size (scaled down to the pixel budget); draft() changes img.size
+    scale, planned = imageAdmission.check(img, lambda size: plan_size(size, operations))
+
+    if img.format == 'JPEG':
+        draft = None
+        if REDUCING_GAP > 0 and planned != img.size:
+            draft = (int(planned[0] * REDUCING_GAP), int(planned[1] * REDUCING_GAP))
+        if scale > 1:
+            budget = imageAdmission.draft_size(img.size, scale)
+            draft = budget if draft is None else (min(draft[0], budget[0]), min(draft[1], budget[1]))
+        if draft is not None:
+            img.draft(img.mode, draft)
+
+    return img, planned
+
+
+def admit(source, operations):
+    """
+    Header-only admission of an upload for a pipeline, counted in the metrics
+    Raises: imageAdmission.ImageRejectedError
+    """
+    with stageTimer.stage('admit'):
+        imageAdmission.admit(as_stream(source), lambda size: plan_size(size, operations))
+
+
+def resize(img, target):
+    """
+    LANCZOS resize that reduces by whole factors first when shrinking a lot
+    """
+    return img.resize(target, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP or None)
+
+
+def _reduce_factor(size, target):
+    # The whole-factor box reduction Image.resize applies first with reducing_gap
+    if not REDUCING_GAP:
+        return 1, 1
+    return int(size[0] / target[0] / REDUCING_GAP) or 1, int(size[1] / target[1] / REDUCING_GAP) or 1
+
+
+def _strips(img, rows):
+    width, height = img.size
+    for top in range(0, height, rows):
+        yield top, _normalise_mode(img.crop((0, top, width, min(top + rows, height))))
+
+
+def convert_in_strips(img, target, fmt, rows=None):
+    """
+    _normalise_mode, resize and flatten_for on a decoded image, a strip of
+    rows at a time. The output matches the whole-image path pixel for pixel.
+    Returns: image of size target in a mode fmt can store
+    """
+    rows = rows or STRIP_ROWS
+    width, height = img.size
+    mode = _normalise_mode(img.crop((0, 0, 1, 1))).mode
+    if target == img.size:
+        if flatten_for(Image.new(mode, (1, 1)), fmt).mode == img.mode:
+            # Nothing to convert, and no copy needed
+            return img
+        result = None
+        for top, strip in _strips(img, rows):
+            strip = flatten_for(strip, fmt)
+            if result is None:
+                result = Image.new(strip.mode, img.size)
+            result.paste(strip, (0, top))
+        return result
+
+    # LANCZOS runs horizontally, then vertically. The reduce pre-pass and
+    # the horizontal pass only read within a row (of reduction blocks), so
+    # strips on the reduction grid go through both into a target-width
+    # image, which the vertical pass then resizes as Image.resize would.
+    # Image.resize skips the pre-pass for images with alpha.
+    factor = (1, 1) if mode in PREMULTIPLIED else _reduce_factor(img.size, target)
+    rows = max(rows // factor[1], 1) * factor[1]
+    reduced_width, reduced_height = width / factor[0], height / factor[1]
+    columns = None
+    for top, strip in _strips(img, rows):
+        if mode in PREMULTIPLIED:
+            strip = strip.convert(PREMULTIPLIED[mode])
+        if factor != (1, 1):
+            strip = strip.reduce(factor)
+        strip = strip.resize((target[0], strip.height), Image.Resampling.LANCZOS,
+                             box=(0, 0, reduced_width, strip.height))
+        if columns is None:
+            columns = Image.new(strip.mode, (target[0], math.ceil(reduced_height)))
+        columns.paste(strip, (0, top // factor[1]))
+    result = columns.resize(target, Image.Resampling.LANCZOS, box=(0, 0, target[0], reduced_height))
+    if mode in PREMULTIPLIED:
+        result = result.convert(mode)
+    return flatten_for(result, fmt)
+
+
+def run_pipeline(source, operations, workers=None):
+    """
+    Decodes once, applies every operation in memory and encodes once, in a
+    pool process when the image pool is enabled for the current route
+    source: encoded bytes or a seekable stream such as a spooled upload
+    Returns: dict with buffer (BytesIO at position 0), format, mimetype,
+             extension, width, height, size, original_size, quality, passes,
+             target_bytes, target_met, baseline_size (None unless the
+             format step asks for it) and source_format
+    Raises: ValueError for invalid operations, imageAdmission.ImageRejectedError
+            for uploads over the pixel budgets, imagePool.ImagePoolError when
+            the pool is full or the task times out
+    """
+    operations = parse_operations(operations)
+    admit(source, operations)
+    if imagePool.offloading():
+        return imagePool.run_pipeline(source, operations, workers)
+    return run_pipeline_local(source, operations, workers)
+
+
+def run_pipeline_local(source, operations, workers=None):
+    """
+    run_pipeline on the calling thread
+    """
+    operations = parse_operations(operations)
+    format_op = next((op for op in operations if op['op'] == 'format'), {'format': 'JPEG', 'quality': None})
+    reduce_op = next((op for op in operations if op['op'] == 'reduce'), None)
+    fmt = format_op['format']
+
+    original_size = source_size(source)
+    with stageTimer.stage('decode'):
+        img, planned = open_for_size(source, operations)
+        source_format = img.format
+        img.load()
+    with stageTimer.stage('resize'):
+        if STRIP_PIXELS and img.width * img.height > STRIP_PIXELS:
+            img = convert_in_strips(img, planned, fmt)
+        else:
+            img = _normalise_mode(img)
+            if planned != img.size:
+                img = resize(img, planned)
+            img = flatten_for(img, fmt)
+
+    options = encoder_options(format_op)
+    target_bytes = None
+    if reduce_op:
+        target_bytes = reduce_op['target_bytes'] or int(original_size * reduce_op['target_ratio'])
+        if fmt == 'JPEG':
+            options['optimize'] = True
+        with stageTimer.stage('encode'):
+            buffer, quality, passes = encode_to_target(
+                img, fmt, target_bytes, reduce_op['max_passes'], workers, reduce_op['min_quality'], **options)
+    else:
+        quality = format_op['quality'] or (DEFAULT_QUALITY if FORMATS[fmt][2] else None)
+        with stageTimer.stage('encode'):
+            buffer = encode_buffer(img, fmt, quality, **options)
+        passes = 1
+    size = buffer_size(buffer)
+
+    baseline_size = None
+    if format_op.get('baseline'):
+        if fmt == 'JPEG' and quality == DEFAULT_QUALITY and not options:
+            baseline_size = size
+        else:
+            with stageTimer.stage('baseline'):
+                baseline_size = buffer_size(encode_buffer(flatten_for(img, 'JPEG'), 'JPEG', DEFAULT_QUALITY))
+
+    mimetype, extension, _ = FORMATS[fmt]
+    return {
+        'buffer': buffer,
+        'format': fmt,
+        'mimetype': mimetype,
+        'extension': extension,
+        'width': img.width,
+        'height': img.height,
+        'size': size,
+        'original_size': original_size,
+        'quality': quality,
+        'passes': passes,
+        'target_bytes': target_bytes,
+        'target_met': target_bytes is None or size <= target_bytes,
+        'baseline_size': baseline_size,
+        'source_format': source_format,
+    }
+
+
+def resize_image(source, width, height, keep_aspect=False, output=None):
+    """
+    Resizes an encoded image and re-encodes it
+    output: 'format' step for the result, by default a quality 95 JPEG
+    Returns: the run_pipeline result dict
+    """
+    operations = [
+        {'op': 'resize', 'width': width, 'height': None if keep_aspect else height},
+        output or {'op': 'format', 'format': 'JPEG', 'quality': DEFAULT_QUALITY},
+    ]
+    return run_pipeline(source, operations)
+
+
+def resize_to_jpeg(source, width, height, keep_aspect=False, quality=DEFAULT_QUALITY, as_buffer=False):
+    """
+    Resizes an encoded image and re-encodes it as JPEG
+    Returns: resized image bytes, or a BytesIO at position 0 with as_buffer
+    """
+    result = resize_image(source, width, height, keep_aspect, {'op': 'format', 'format': 'JPEG', 'quality': quality})
+    return result['buffer'] if as_buffer else result_bytes(result)
@@ -0,0 +1,264 @@
+import os
+import time
+import signal
+import struct
+import threading
+import contextvars
+import multiprocessing
+from io import BytesIO
+from multiprocessing import shared_memory
+
+import stageTimer
+import structuredLog
+
+# Optional process pool for the CPU-bound image pipeline.
+#
+# Decoding, LANCZOS resampling and the multi-pass JPEG search hold the GIL
+# for most of their run time, so with threaded workers a few large resizes
+# stall every verification request waiting on OCR in the same process.
+# With IMAGE_POOL_WORKERS > 0, imageOps.run_pipeline hands its work to
+# separate processes on the routes listed in IMAGE_POOL_ROUTES.
+#
+# The upload is copied once into a shared memory block mapped by the pool
+# process instead of being pickled through a pipe; only the (much smaller)
+# encoded output travels back through the result pipe. Tasks beyond IMAGE_POOL_WORKERS +
+# IMAGE_POOL_QUEUE are refused with PoolBusyError, and a task running past
+# IMAGE_POOL_TIMEOUT raises TaskTimeoutError and its process is replaced.
+# A task writes its pid into its shared memory block and clears it when it
+# ends, both under a lock shared with the parent; the parent reads the pid
+# and kills under the same lock, so a process that already moved on to the
+# next task is never killed for this one.
+# Each gunicorn worker owns its pool, so the process count is
+# gunicorn workers x IMAGE_POOL_WORKERS.
+
+WORKERS = int(os.getenv('IMAGE_POOL_WORKERS', '0'))
+QUEUE_SIZE = int(os.getenv('IMAGE_POOL_QUEUE', str(2 * WORKERS)))
+TIMEOUT = float(os.getenv('IMAGE_POOL_TIMEOUT', '30'))
+# Comma separated routes, e.g. '/reduceSize,/aadharResizeMAR'; '*' for all
+ROUTES = frozenset(route.strip() for route in os.getenv('IMAGE_POOL_ROUTES', '*').split(',') if route.strip())
+
+log = structuredLog.get_logger(__name__)
+
+# Shared memory header: pid of the pool process running the task (0 when none)
+_HEADER = struct.Struct('q')
+
+_offload = contextvars.ContextVar('image_pool_offload', default=False)
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+# Guards the pid headers, shared by this worker and its pool processes
+_task_lock = None
+_stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'timeouts': 0, 'failed': 0}
+
+
+class ImagePoolError(Exception):
+    pass
+
+
+class PoolBusyError(ImagePoolError):
+    pass
+
+
+class TaskTimeoutError(ImagePoolError):
+    pass
+
+
+def _reset_after_fork():
+    # Pool threads and pipes do not survive a fork; the worker builds its own pool
+    global _lock, _pool, _slots, _task_lock
+    _lock = threading.Lock()
+    _pool = None
+    _slots = None
+    _task_lock = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def enabled():
+    return WORKERS > 0
+
+
+def bind_route(route):
+    """
+    Decides for the current request whether image work goes to the pool
+    """
+    _offload.set(enabled() and ('*' in ROUTES or route in ROUTES))
+
+
+def offloading():
+    return _offload.get()
+
+
+def _context():
+    # Forking a threaded worker can copy held locks into the child, so pool
+    # processes come from a clean fork server with Pillow already imported
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['imageOps', 'imagePool'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _init_process(task_lock):
+    # Runs in each pool process, including the ones replacing killed processes
+    global _task_lock
+    _task_lock = task_lock
+
+
+def _get_pool():
+    global _pool, _slots, _task_lock
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                context = _context()
+                _slots = threading.BoundedSemaphore(WORKERS + QUEUE_SIZE)
+                _task_lock = context.Lock()
+                _pool = context.Pool(WORKERS, initializer=_init_process, initargs=(_task_lock,))
+                log.info("Image pool started", extra={'workers': WORKERS, 'queue': QUEUE_SIZE})
+    return _pool, _slots
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _to_shared_memory(source):
+    # One copy of the upload, straight from the spooled file or bytes
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source)
+        size = data.nbytes
+    else:
+        import imageOps
+        data = None
+        size = imageOps.source_size(source)
+    block = shared_memory.SharedMemory(create=True, size=_HEADER.size + max(size, 1))
+    _HEADER.pack_into(block.buf, 0, 0)
+    view = block.buf[_HEADER.size:_HEADER.size + size]
+    try:
+        if data is not None:
+            view[:] = data
+        else:
+            read = 0
+            while read < size:
+                count = source.readinto(view[read:])
+                if not count:
+                    break
+                read += count
+            size = read
+    finally:
+        view.release()
+    return block, size
+
+
+def _set_pid(block, pid):
+    with _task_lock:
+        _HEADER.pack_into(block.buf, 0, pid)
+
+
+def _run_task(name, size, operations, workers):
+    # Runs in a pool process
+    import imageOps
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        _set_pid(block, os.getpid())
+        source = bytes(block.buf[_HEADER.size:_HEADER.size + size])
+        with stageTimer.collect() as timings:
+            result = imageOps.run_pipeline_local(source, operations, workers)
+        result['buffer'] = result['buffer'].getvalue()
+        result['stages'] = timings.stages
+        return result
+    finally:
+        # Also when the task raised: the process is about to take another task
+        _set_pid(block, 0)
+        block.close()
+
+
+def _kill_task_process(block):
+    # While the lock is held the task cannot clear its pid and move on
+    if not _task_lock.acquire(timeout=TIMEOUT):
+        log.warning("Could not lock the image task to kill it")
+        return
+    try:
+        pid = _HEADER.unpack_from(block.buf, 0)[0]
+        if pid:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+    finally:
+        _task_lock.release()
+
+
+def run_pipeline(source, operations, workers=None):
+    """
+    imageOps.run_pipeline in a pool process
+    Returns: the same result dict, with buffer a BytesIO at position 0
+    Raises: ValueError for invalid operations, PoolBusyError when the queue
+            is full, TaskTimeoutError after IMAGE_POOL_TIMEOUT seconds
+    """
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        _count('rejected')
+        raise PoolBusyError("Too many pending image tasks")
+
+    block = None
+    try:
+        with stageTimer.stage('pool_copy'):
+            block, size = _to_shared_memory(source)
+        _count('submitted')
+        started = time.perf_counter()
+        pending = pool.apply_async(_run_task, (block.name, size, operations, workers))
+        try:
+            result = pending.get(TIMEOUT)
+        except multiprocessing.TimeoutError:
+            _count('timeouts')
+            # The pool replaces a killed process; the header names the one
+            # running this task, or none if it never left the queue
+            if not pending.ready():
+                _kill_task_process(block)
+            log.warning("Image task timed out", extra={'timeout_s': TIMEOUT})
+            raise TaskTimeoutError(f"Image processing took longer than {TIMEOUT:g}s")
+        except ValueError:
+            raise
+        except Exception:
+            _count('failed')
+            raise
+        _count('completed')
+    finally:
+        if block is not None:
+            block.close()
+            block.unlink()
+        slots.release()
+
+    stages = result.pop('stages')
+    for name, seconds in stages.items():
+        stageTimer.add(name, seconds)
+    stageTimer.add('pool_wait', max(time.perf_counter() - started - sum(stages.values()), 0.0))
+    result['buffer'] = BytesIO(result['buffer'])
+    return result
+
+
+def stats():
+    """
+    Returns: dict with pool configuration and task counters
+    """
+    with _lock:
+        counters = dict(_stats)
+    counters.update({'workers': WORKERS, 'queue': QUEUE_SIZE, 'timeout_s': TIMEOUT, 'routes': sorted(ROUTES)})
+    return counters
+
+
+def shutdown():
+    """
+    Stops the pool processes of this worker
+    """
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aadharVerification
+import panVerification
+import aadharResize
+import imageOps
+import panResize
+import reduceSize
+import structuredLog
+
+log = structuredLog.get_logger(__name__)
+
+# Asynchronous verification/resize jobs.
+#
+# Jobs run on a bounded thread pool inside the worker that accepted them.
+# State, results and the uploads of pending jobs are kept in SQLite so that
+# any gunicorn worker on the host can answer a poll and a full queue does not
+# hold JOB_QUEUE_SIZE uploads in memory. The accepting worker refreshes
+# updated_at of its pending jobs every JOB_STALE_AFTER / 4 seconds; a queued
+# or running job left without that heartbeat for JOB_STALE_AFTER seconds
+# belonged to a worker that died, and is marked failed when a worker starts
+# and when the job is polled.
+#
+# Uploads are card images and results carry the full ID number, so the
+# database lives in a directory private to the user running the workers
+# (0700, files 0600) and deleted rows are overwritten. A verification result
+# keeps its full number for the first poll only; later polls see it masked.
+
+DB_PATH = os.getenv('JOB_DB_PATH') or os.path.join(tempfile.gettempdir(), f"kyc-jobs-{os.getuid()}", 'jobs.sqlite3')
+MAX_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+MAX_QUEUED = int(os.getenv('JOB_QUEUE_SIZE', '64'))
+TTL_SECONDS = float(os.getenv('JOB_TTL', '3600'))
+STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '120'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _aadhar_verification(image_bytes, params):
+    is_valid, num, confidence = aadharVerification.aadhar_auth_img(image_bytes)
+    return {
+        'valid': bool(is_valid),
+        'number': str(num),
+        'confidence': int(confidence),
+        'message': 'Aadhar card verified successfully' if is_valid else 'Invalid or unreadable Aadhar card'
+    }
+
+
+def _pan_verification(image_bytes, params):
+    is_valid, num, confidence = panVerification.pan_auth_img(image_bytes)
+    return {
+        'valid': bool(is_valid),
+        'number': str(num),
+        'confidence': int(confidence),
+        'holder_type': panVerification.get_pan_holder_type(num) if num else '',
+        'message': 'PAN card verified successfully' if is_valid else 'Invalid or unreadable PAN card'
+    }
+
+
+# Image jobs answer with a baseline JPEG, as the routes do without a format
+JPEG_OUTPUT = {'op': 'format', 'format': 'JPEG'}
+
+
+def _resizer(resize_function):
+    def run(image_bytes, params):
+        return resize_function(image_bytes, height=params['height'], width=params['width'], output=JPEG_OUTPUT)
+    return run
+
+
+def _reduce(image_bytes, params):
+    # Sends the upload back unchanged, in its own format, when re-encoding does not help
+    return reduceSize.reduce_to_target(image_bytes, target_bytes=params.get('target_bytes'), target_ratio=params.get('target_ratio'))
+
+
+# Job type -> (handler, produces_image); image handlers return an imageOps pipeline result
+JOB_TYPES = {
+    'aadharVerification': (_aadhar_verification, False),
+    'panVerification': (_pan_verification, False),
+    'aadharResizeMAR': (_resizer(aadharResize.resize_aadhar_mar), True),
+    'aadharResizeHard': (_resizer(aadharResize.resize_aadhar_hard), True),
+    'panResizeMAR': (_resizer(panResize.resize_pan_mar), True),
+    'panResizeHard': (_resizer(panResize.resize_pan_hard), True),
+    'reduceSize': (_reduce, True),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    result_blob BLOB,
+    error TEXT,
+    upload BLOB,
+    result_mimetype TEXT
+)
+"""
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_pid = None
+_pending = set()  # ids of the jobs queued or running in this process
+_schema_ready = False
+
+
+def _prepare_db():
+    # Private to the user running the workers, whatever the umask. SQLite
+    # gives the -wal and -shm files the mode of the database file.
+    directory = os.path.dirname(DB_PATH) or '.'
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not os.getenv('JOB_DB_PATH'):
+        # The default directory has a predictable name in the shared temp dir
+        info = os.stat(directory)
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"{directory} belongs to another user")
+        if info.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+    os.close(os.open(DB_PATH, os.O_RDWR | os.O_CREAT, 0o600))
+    for path in (DB_PATH, DB_PATH + '-wal', DB_PATH + '-shm'):
+        try:
+            if os.stat(path).st_mode & 0o077:
+                os.chmod(path, 0o600)
+        except FileNotFoundError:
+            pass
+
+
+def _connect():
+    global _schema_ready
+    if not _schema_ready:
+        _prepare_db()
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    # Overwrite the uploads and numbers of deleted rows instead of leaving them in free pages
+    conn.execute("PRAGMA secure_delete=ON")
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        # Job databases created before uploads and result types were stored
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(jobs)")]
+        for column, column_type in (('upload', 'BLOB'), ('result_mimetype', 'TEXT')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        _fail_stale(conn)
+        conn.commit()
+        _schema_ready = True
+    return conn
+
+
+def _fail_stale(conn, job_id=None):
+    """Marks failed the queued and running jobs (or job_id) whose worker stopped sending heartbeats"""
+    query = "UPDATE jobs SET status = ?, error = ?, upload = NULL WHERE status IN (?, ?) AND updated_at < ?"
+    args = (FAILED, 'Worker stopped before finishing the job', QUEUED, RUNNING, time.time() - STALE_AFTER)
+    if job_id is not None:
+        query += " AND id = ?"
+        args += (job_id,)
+    if conn.execute(query, args).rowcount:
+        log.warning("Failed stale jobs", extra={'job_id': job_id})
+
+
+def _heartbeat():
+    while True:
+        time.sleep(STALE_AFTER / 4)
+        with _lock:
+            job_ids = list(_pending)
+        if not job_ids:
+            continue
+        try:
+            conn = _connect()
+            try:
+                conn.execute(
+                    f"UPDATE jobs SET updated_at = ? WHERE status IN (?, ?) AND id IN ({', '.join('?' * len(job_ids))})",
+                    (time.time(), QUEUED, RUNNING, *job_ids)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            log.exception("Job heartbeat failed")
+
+
+def _pool():
+    # Created lazily per process; a thread pool inherited across fork has no threads
+    global _executor, _slots, _pid
+    with _lock:
+        if _executor is None or _pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='job')
+            _slots = threading.BoundedSemaphore(MAX_QUEUED)
+            _pending.clear()
+            threading.Thread(target=_heartbeat, name='job-heartbeat', daemon=True).start()
+            _pid = os.getpid()
+        return _executor, _slots
+
+
+def _update(job_id, status, result=None, result_blob=None, error=None, result_mimetype=None):
+    # The upload is only needed until the job has run
+    keep_upload = status in (QUEUED, RUNNING)
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ?, result = ?, result_blob = ?, result_mimetype = ?, error = ?,"
+            " upload = CASE WHEN ? THEN upload END WHERE id = ?",
+            (status, time.time(), result, result_blob, result_mimetype, error, keep_upload, job_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _load_upload(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT upload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def _run(job_id, job_type, params, slots):
+    try:
+        _update(job_id, RUNNING)
+        image_bytes = _load_upload(job_id)
+        if image_bytes is None:
+            raise ValueError("Job upload is missing")
+        handler, produces_image = JOB_TYPES[job_type]
+        output = handler(image_bytes, params)
+        if produces_image:
+            if output:
+                _update(job_id, DONE, result_blob=imageOps.result_bytes(output), result_mimetype=output['mimetype'])
+            else:
+                _update(job_id, FAILED, error='Image processing failed')
+        else:
+            _update(job_id, DONE, result=json.dumps(output))
+    except Exception as e:
+        log.exception("Job failed", extra={'job_id': job_id, 'job_type': job_type})
+        _update(job_id, FAILED, error=str(e))
+    finally:
+        with _lock:
+            _pending.discard(job_id)
+        slots.release()
+
+
+def _purge_expired(conn):
+    conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - TTL_SECONDS,))
+
+
+def _mask_number(number):
+    # Every letter and digit but the last four replaced by X
+    masked, shown = [], 0
+    for char in reversed(number):
+        if char.isalnum():
+            if shown >= 4:
+                char = 'X'
+            shown += 1
+        masked.append(char)
+    return ''.join(reversed(masked))
+
+
+def submit(job_type, image_bytes, params=None):
+    """
+    Queues a job on the local worker pool, its upload spooled to the job database
+    Returns: job id
+    Raises: ValueError for unknown job types, QueueFullError when the pool is saturated
+    """
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise QueueFullError("Too many pending jobs")
+
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            _purge_expired(conn)
+            conn.execute(
+                "INSERT INTO jobs (id, type, status, created_at, updated_at, upload) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, QUEUED, now, now, image_bytes)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        with _lock:
+            _pending.add(job_id)
+        executor.submit(_run, job_id, job_type, params or {}, slots)
+    except Exception:
+        with _lock:
+            _pending.discard(job_id)
+        slots.release()
+        raise
+    return job_id
+
+
+def get(job_id):
+    """
+    Returns: job dict (id, type, status, result, error, has_image) or None if unknown
+    """
+    conn = _connect()
+    try:
+        _purge_expired(conn)
+        _fail_stale(conn, job_id)
+        row = conn.execute(
+            "SELECT id, type, status, result, result_blob IS NOT NULL, error FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        result = json.loads(row[3]) if row and row[3] else None
+        if result and result.get('number'):
+            # This poll gets the number, the database keeps it masked
+            masked = _mask_number(result['number'])
+            if masked != result['number']:
+                conn.execute("UPDATE jobs SET result = ? WHERE id = ?", (json.dumps(dict(result, number=masked)), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+    return {
+        'job_id': row[0],
+        'type': row[1],
+        'status': row[2],
+        'result': result,
+        'has_image': bool(row[4]),
+        'error': row[5],
+    }
+
+
+def get_image(job_id):
+    """
+    Returns: (encoded image bytes, mimetype) of a finished image job or None
+    """
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT result_blob, result_mimetype FROM jobs WHERE id = ? AND status = ? AND result_blob IS NOT NULL",
+            (job_id, DONE)
+        ).fetchone()
+    finally:
+        conn.close()
+    # Results stored before result_mimetype existed are JPEGs
+    return (row[0], row[1] or 'image/jpeg') if row else None
@@ -0,0 +1,228 @@
+import os
+import time
+import functools
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+from flask import request
+
+import imageOps
+
+# Prometheus metrics for the HTTP routes, OCR calls and image sizes.
+#
+# Under gunicorn every worker keeps its own counters. Set
+# PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers and
+# /metrics aggregates all of them. Without prometheus_client installed every
+# metric is a no-op and /metrics answers 501.
+
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTE_BUCKETS = tuple(1024 * 4 ** i for i in range(8))  # 1KB .. 16MB
+PIXEL_BUCKETS = tuple(250_000 * 2 ** i for i in range(12))  # 0.25MP .. 512MP
+
+
+class _Noop:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def observe(self, amount):
+        pass
+
+    def set(self, value):
+        pass
+
+
+if prometheus_client is not None:
+    REQUESTS = Counter(
+        'docapi_http_requests_total', 'HTTP requests by route, method and status',
+        ['route', 'method', 'status']
+    )
+    REQUEST_LATENCY = Histogram(
+        'docapi_http_request_duration_seconds', 'Time spent in the route handler',
+        ['route'], buckets=LATENCY_BUCKETS
+    )
+    IN_FLIGHT = Gauge(
+        'docapi_http_requests_in_flight', 'Requests currently being handled',
+        multiprocess_mode='livesum'
+    )
+    IMAGE_BYTES = Histogram(
+        'docapi_image_bytes', 'Image sizes on the resize and reduce routes',
+        ['route', 'direction'], buckets=BYTE_BUCKETS
+    )
+    OCR_LATENCY = Histogram(
+        'docapi_ocr_request_duration_seconds', 'OCR backend call latency',
+        ['backend', 'call'], buckets=LATENCY_BUCKETS
+    )
+    OCR_ERRORS = Counter(
+        'docapi_ocr_errors_total', 'Failed OCR backend calls',
+        ['backend', 'kind']
+    )
+    OCR_CACHE_LOOKUPS = Counter(
+        'docapi_ocr_cache_lookups_total', 'OCR cache lookups by result',
+        ['result']
+    )
+    OCR_COALESCED = Counter(
+        'docapi_ocr_coalesced_total', 'Image verifications answered by an identical request already in flight',
+        ['document', 'scope']
+    )
+    IMAGE_ADMISSIONS = Counter(
+        'docapi_image_admissions_total', 'Header-only admission decisions for uploaded images',
+        ['decision']
+    )
+    IMAGE_OUTPUTS = Counter(
+        'docapi_image_outputs_total', 'Images encoded by the resize and reduce routes, by output format',
+        ['format']
+    )
+    IMAGE_BYTES_SAVED = Counter(
+        'docapi_image_bytes_saved_total', 'Bytes saved against a quality 95 JPEG of the same image',
+        ['format']
+    )
+    RESULT_CACHE_LOOKUPS = Counter(
+        'docapi_result_cache_lookups_total', 'Derivative cache lookups on the image routes by result',
+        ['result']
+    )
+    RESULT_CACHE_BYTES = Gauge(
+        'docapi_result_cache_bytes', 'Bytes of encoded derivatives held in the result cache',
+        multiprocess_mode='livesum'
+    )
+    IMAGE_DECLARED_PIXELS = Histogram(
+        'docapi_image_declared_pixels', 'Pixel counts declared by uploaded image headers',
+        buckets=PIXEL_BUCKETS
+    )
+else:
+    REQUESTS = REQUEST_LATENCY = IN_FLIGHT = IMAGE_BYTES = _Noop()
+    IMAGE_ADMISSIONS = IMAGE_DECLARED_PIXELS = IMAGE_OUTPUTS = IMAGE_BYTES_SAVED = _Noop()
+    RESULT_CACHE_LOOKUPS = RESULT_CACHE_BYTES = _Noop()
+    OCR_LATENCY = OCR_ERRORS = OCR_CACHE_LOOKUPS = OCR_COALESCED = _Noop()
+
+
+def available():
+    return prometheus_client is not None
+
+
+@contextmanager
+def observe_ocr(backend, call='single'):
+    """
+    Times one OCR backend call and counts it as an error if it raises
+    API errors returned inside a response are counted with ocr_error()
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        OCR_ERRORS.labels(backend, 'exception').inc()
+        raise
+    finally:
+        OCR_LATENCY.labels(backend, call).observe(time.perf_counter() - start)
+
+
+def ocr_error(backend, kind):
+    OCR_ERRORS.labels(backend, kind).inc()
+
+
+def _status(rv):
+    # Status of a view return value without turning it into a Response
+    if isinstance(rv, tuple):
+        for item in rv[1:]:
+            if isinstance(item, int):
+                return item
+        rv = rv[0]
+    return getattr(rv, 'status_code', 200)
+
+
+def _response_size(rv):
+    if isinstance(rv, tuple):
+        rv = rv[0]
+    return getattr(rv, 'content_length', None)
+
+
+def _upload_size():
+    upload = request.files.get('file')
+    if upload is None:
+        return None
+    try:
+        return imageOps.source_size(upload.stream)
+    except (OSError, ValueError):
+        return None
+
+
+def instrument_view(view, route, image_route=False):
+    """
+    Wraps a Flask view: counts and times it, tracks in-flight requests and,
+    for image routes, records upload and response sizes
+    The view's return value is passed through untouched.
+    Streamed bodies are timed until the view returns, not until the last byte.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        status = 500
+        try:
+            rv = view(*args, **kwargs)
+            status = _status(rv)
+            if image_route:
+                size_in = _upload_size()
+                if size_in is not None:
+                    IMAGE_BYTES.labels(route, 'in').observe(size_in)
+                size_out = _response_size(rv) if status == 200 else None
+                if size_out is not None:
+                    IMAGE_BYTES.labels(route, 'out').observe(size_out)
+            return rv
+        finally:
+            REQUEST_LATENCY.labels(route).observe(time.perf_counter() - start)
+            REQUESTS.labels(route, request.method, str(status)).inc()
+            IN_FLIGHT.dec()
+
+    return wrapper
+
+
+def instrument_app(app, image_routes=(), exclude=('/metrics', '/static/<path:filename>')):
+    """
+    Wraps every registered view of a Flask app with instrument_view
+    Call after all routes are registered.
+    """
+    for rule in app.url_map.iter_rules():
+        if rule.rule in exclude:
+            continue
+        view = app.view_functions[rule.endpoint]
+        if getattr(view, '_instrumented', False):
+            continue
+        wrapped = instrument_view(view, rule.rule, image_route=rule.rule in image_routes)
+        wrapped._instrumented = True
+        app.view_functions[rule.endpoint] = wrapped
+
+
+def render():
+    """
+    Returns: (body, content_type) in the Prometheus text format, aggregated
+             over all workers when PROMETHEUS_MULTIPROC_DIR is set
+    """
+    if MULTIPROC_DIR:
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead(pid):
+    """
+    Drops the live gauges of an exited worker (gunicorn child_exit hook)
+    """
+    if MULTIPROC_DIR and prometheus_client is not None:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
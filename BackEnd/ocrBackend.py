@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import asyncio
+import base64
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import visionClient
+
+# OCR backends.
+#
+# Every backend exposes the same small surface, shaped after the Vision
+# client so callers can read `response.error.message` and
+# `response.text_annotations[0].description` regardless of where the text
+# came from:
+#
+#   available()                         -> bool
+#   text_detection(image_bytes)         -> response
+#   batch_text_detection(images)        -> list of responses, in input order
+#   await text_detection_async(bytes)   -> response, for the ASGI server
+#
+# The backend is chosen with OCR_BACKEND ('vision', 'vision_rest' or 'fake').
+
+
+class VisionBackend:
+    """Google Cloud Vision through the shared per-process client"""
+
+    name = 'vision'
+
+    def available(self):
+        return visionClient.credentials_path() is not None
+
+    def text_detection(self, image_bytes):
+        from google.cloud import vision
+        client = visionClient.get_client()
+        return client.text_detection(image=vision.Image(content=image_bytes))
+
+    def batch_text_detection(self, images):
+        from google.cloud import vision
+        client = visionClient.get_client()
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=image_bytes), features=[feature])
+            for image_bytes in images
+        ]
+        return list(client.batch_annotate_images(requests=requests).responses)
+
+    async def text_detection_async(self, image_bytes):
+        from google.cloud import vision
+        client = visionClient.get_async_client()
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        request = vision.AnnotateImageRequest(image=vision.Image(content=image_bytes), features=[feature])
+        reply = await client.batch_annotate_images(requests=[request])
+        return reply.responses[0]
+
+
+class VisionRestBackend:
+    """
+    Vision's REST endpoint (images:annotate) authenticated with an API key.
+
+    VISION_ENDPOINT can point at any server speaking the same JSON, such as
+    benchmarks/fake_vision.py for load tests. Each request thread keeps its
+    own pooled HTTP session; the ASGI server shares one httpx connection pool
+    of VISION_MAX_CONNECTIONS. Sessions are dropped in a forked worker.
+    """
+
+    name = 'vision_rest'
+
+    def __init__(self, endpoint=None, api_key=None, timeout=None):
+        self.endpoint = (endpoint or os.getenv('VISION_ENDPOINT', 'https://vision.googleapis.com')).rstrip('/')
+        self.api_key = api_key if api_key is not None else os.getenv('VISION_API_KEY', '')
+        self.timeout = timeout if timeout is not None else float(os.getenv('VISION_TIMEOUT', '30'))
+        self.max_connections = int(os.getenv('VISION_MAX_CONNECTIONS', '256'))
+        self._local = threading.local()
+        self._async = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_sessions)
+
+    def _reset_sessions(self):
+        self._local = threading.local()
+        self._async = None
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def available(self):
+        return bool(self.api_key)
+
+    @staticmethod
+    def _request_body(images):
+        return {
+            'requests': [
+                {
+                    'image': {'content': base64.b64encode(image_bytes).decode('ascii')},
+                    'features': [{'type': 'TEXT_DETECTION'}],
+                }
+                for image_bytes in images
+            ]
+        }
+
+    @staticmethod
+    def _responses(reply, count):
+        # reply: a requests or httpx response
+        if reply.status_code != 200:
+            try:
+                message = reply.json()['error']['message']
+            except (ValueError, KeyError, TypeError):
+                message = getattr(reply, 'reason', None) or getattr(reply, 'reason_phrase', '')
+            error = f"HTTP {reply.status_code}: {message}"
+            return [_response(error=error) for _ in range(count)]
+
+        responses = []
+        for result in reply.json().get('responses', []):
+            if 'error' in result:
+                responses.append(_response(error=result['error'].get('message', 'unknown error')))
+            else:
+                annotations = result.get('textAnnotations', [])
+                responses.append(_response(annotations[0]['description'] if annotations else None))
+        return responses
+
+    def _annotate(self, images):
+        reply = self._session().post(
+            f"{self.endpoint}/v1/images:annotate", params={'key': self.api_key},
+            json=self._request_body(images), timeout=self.timeout
+        )
+        return self._responses(reply, len(images))
+
+    def _async_client(self):
+        # httpx clients are bound to the event loop they were first used on
+        loop = asyncio.get_running_loop()
+        if self._async is None or self._async[0] is not loop:
+            import httpx
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._async = (loop, httpx.AsyncClient(timeout=self.timeout, limits=limits))
+        return self._async[1]
+
+    def text_detection(self, image_bytes):
+        return self._annotate([image_bytes])[0]
+
+    def batch_text_detection(self, images):
+        return self._annotate(images)
+
+    async def text_detection_async(self, image_bytes):
+        try:
+            client = self._async_client()
+        except ImportError:
+            # Without httpx the blocking client runs on an executor thread
+            return await asyncio.to_thread(self.text_detection, image_bytes)
+        reply = await client.post(
+            f"{self.endpoint}/v1/images:annotate", params={'key': self.api_key}, json=self._request_body([image_bytes])
+        )
+        return self._responses(reply, 1)[0]
+
+
+def _response(text=None, error=''):
+    annotations = [SimpleNamespace(description=text)] if text else []
+    return SimpleNamespace(error=SimpleNamespace(message=error), text_annotations=annotations)
+
+
+def _verhoeff_complete(digits):
+    # Appends the check digit that makes an 11 digit prefix pass the Verhoeff checksum
+    import aadharVerification
+    for check in '0123456789':
+        if aadharVerification._verhoeff_validate(digits + check):
+            return digits + check
+    return digits + '0'
+
+
+def synthetic_text(seed, document='both'):
+    """
+    Builds card-like OCR text with a valid Aadhar and/or PAN number
+    derived deterministically from seed (e.g. the image hash)
+    """
+    rng = random.Random(seed)
+    blocks = []
+    if document in ('aadhar', 'both'):
+        number = _verhoeff_complete(str(rng.randint(2, 9)) + ''.join(rng.choice('0123456789') for _ in range(10)))
+        blocks.append(
+            "GOVERNMENT OF INDIA\n"
+            "Test Holder\n"
+            f"DOB: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2005)}\n"
+            f"{rng.choice(['MALE', 'FEMALE'])}\n"
+            f"{number[0:4]} {number[4:8]} {number[8:12]}\n"
+            "Aadhaar - Aam Aadmi ka Adhikar"
+        )
+    if document in ('pan', 'both'):
+        letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        pan = (
+            ''.join(rng.choice(letters) for _ in range(3))
+            + rng.choice('PCHFATBLJG')
+            + rng.choice(letters)
+            + ''.join(rng.choice('0123456789') for _ in range(4))
+            + rng.choice(letters)
+        )
+        blocks.append(
+            "INCOME TAX DEPARTMENT\n"
+            "GOVT. OF INDIA\n"
+            "Permanent Account Number Card\n"
+            f"{pan}\n"
+            "Name\nTEST HOLDER\n"
+            "Father's Name\nTEST PARENT\n"
+            "Date of Birth\n01/01/1990\n"
+            "Signature"
+        )
+    return "\n".join(blocks)
+
+
+class FakeBackend:
+    """
+    Offline stand-in for load testing and profiling.
+
+    Responses come from recorded fixtures when one exists for the image
+    hash (OCR_FAKE_FIXTURES/<sha256>.json or .txt), otherwise from
+    synthetic card text. Each call sleeps for a latency drawn from the
+    configured distribution and fails with the configured error rate.
+    """
+
+    name = 'fake'
+
+    def __init__(self, fixtures_dir=None, document=None, latency_ms=None,
+                 distribution=None, spread=None, error_rate=None):
+        self.fixtures_dir = fixtures_dir if fixtures_dir is not None else os.getenv('OCR_FAKE_FIXTURES', '')
+        self.document = document or os.getenv('OCR_FAKE_DOCUMENT', 'both')
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv('OCR_FAKE_LATENCY_MS', '0'))
+        self.distribution = distribution or os.getenv('OCR_FAKE_LATENCY_DIST', 'fixed')
+        self.spread = spread if spread is not None else float(os.getenv('OCR_FAKE_LATENCY_SPREAD', '0.5'))
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv('OCR_FAKE_ERROR_RATE', '0'))
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def available(self):
+        return True
+
+    def sample_latency(self):
+        """
+        Returns: simulated latency in seconds
+        'fixed' uses latency_ms, 'uniform' spreads +/- spread * latency_ms,
+        'normal' uses spread * latency_ms as the standard deviation and
+        'lognormal' treats latency_ms as the median and spread as sigma
+        """
+        if self.latency_ms <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribution == 'uniform':
+                value = self._random.uniform(self.latency_ms * (1 - self.spread), self.latency_ms * (1 + self.spread))
+            elif self.distribution == 'normal':
+                value = self._random.gauss(self.latency_ms, self.latency_ms * self.spread)
+            elif self.distribution == 'lognormal':
+                value = self.latency_ms * self._random.lognormvariate(0, self.spread)
+            else:
+                value = self.latency_ms
+        return max(value, 0.0) / 1000.0
+
+    def _fails(self):
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _recorded_text(self, key):
+        if not self.fixtures_dir:
+            return None
+        json_path = os.path.join(self.fixtures_dir, key + '.json')
+        if os.path.exists(json_path):
+            with open(json_path, 'r', encoding='utf-8') as f:
+                recorded = json.load(f)
+            annotations = recorded.get('textAnnotations', recorded.get('text_annotations', []))
+            return annotations[0]['description'] if annotations else ''
+        text_path = os.path.join(self.fixtures_dir, key + '.txt')
+        if os.path.exists(text_path):
+            with open(text_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        return None
+
+    def _annotate(self, image_bytes):
+        if self._fails():
+            return _response(error='Simulated OCR backend error')
+        key = hashlib.sha256(image_bytes).hexdigest()
+        text = self._recorded_text(key)
+        if text is None:
+            text = synthetic_text(key, self.document)
+        return _response(text)
+
+    def text_detection(self, image_bytes):
+        time.sleep(self.sample_latency())
+        return self._annotate(image_bytes)
+
+    async def text_detection_async(self, image_bytes):
+        await asyncio.sleep(self.sample_latency())
+        return self._annotate(image_bytes)
+
+    def batch_text_detection(self, images):
+        # A batch costs one round trip, not one per image
+        time.sleep(self.sample_latency())
+        return [self._annotate(image_bytes) for image_bytes in images]
+
+
+BACKENDS = {
+    'vision': VisionBackend,
+    'vision_rest': VisionRestBackend,
+    'fake': FakeBackend,
+}
+
+_lock = threading.Lock()
+_backend = None
+
+
+def get_backend():
+    """
+    Returns the OCR backend selected by OCR_BACKEND (default 'vision')
+    """
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                name = os.getenv('OCR_BACKEND', 'vision').lower()
+                if name not in BACKENDS:
+                    raise ValueError(f"Unknown OCR_BACKEND '{name}', expected one of {sorted(BACKENDS)}")
+                _backend = BACKENDS[name]()
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Overrides the configured backend (used by benchmarks and load tests)
+    """
+    global _backend
+    with _lock:
+        _backend = backend
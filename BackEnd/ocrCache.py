@@ -0,0 +1,162 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import metrics
+import structuredLog
+
+# Content-addressed cache of raw OCR text.
+#
+# Entries are keyed on the SHA-256 of the uploaded image bytes. The memory
+# tier is a bounded LRU private to each worker; the optional disk tier
+# (OCR_CACHE_DIR) is shared by all gunicorn workers on the host. OCR text
+# carries ID numbers, names and dates of birth, so the directory and its
+# shards are created 0700 and entries 0600.
+
+log = structuredLog.get_logger(__name__)
+
+MAX_ENTRIES = int(os.getenv('OCR_CACHE_SIZE', '256'))
+TTL_SECONDS = float(os.getenv('OCR_CACHE_TTL', '3600'))
+CACHE_DIR = os.getenv('OCR_CACHE_DIR', '')
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_dir_ready = False
+_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+
+def image_key(image_bytes):
+    """
+    Returns the cache key for an image
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _disk_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + '.txt')
+
+
+def _memory_get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        expires_at, text = entry
+        if expires_at < time.monotonic():
+            del _entries[key]
+            _stats['evictions'] += 1
+            return None
+        _entries.move_to_end(key)
+        return text
+
+
+def _memory_put(key, text):
+    with _lock:
+        _entries[key] = (time.monotonic() + TTL_SECONDS, text)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+
+
+def _disk_get(key):
+    if not CACHE_DIR:
+        return None
+    path = _disk_path(key)
+    try:
+        if time.time() - os.path.getmtime(path) > TTL_SECONDS:
+            os.remove(path)
+            _count('evictions')
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _prepare_dir():
+    # Private to the user running the workers, whatever the umask
+    global _dir_ready
+    if not _dir_ready:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        if os.stat(CACHE_DIR).st_mode & 0o077:
+            os.chmod(CACHE_DIR, 0o700)
+        _dir_ready = True
+
+
+def _disk_put(key, text):
+    if not CACHE_DIR:
+        return
+    path = _disk_path(key)
+    try:
+        _prepare_dir()
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        # Write to a temporary file and rename so other workers never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning("Could not write OCR cache entry", extra={'error': str(e)})
+
+
+def get(key):
+    """
+    Looks up cached OCR text
+    Returns: OCR text (possibly empty) or None on a miss
+    """
+    text = _memory_get(key)
+    if text is not None:
+        _count('memory_hits')
+        metrics.OCR_CACHE_LOOKUPS.labels('memory_hit').inc()
+        return text
+
+    text = _disk_get(key)
+    if text is not None:
+        _count('disk_hits')
+        metrics.OCR_CACHE_LOOKUPS.labels('disk_hit').inc()
+        _memory_put(key, text)
+        return text
+
+    _count('misses')
+    metrics.OCR_CACHE_LOOKUPS.labels('miss').inc()
+    return None
+
+
+def put(key, text):
+    """
+    Stores OCR text in both tiers
+    """
+    if MAX_ENTRIES <= 0:
+        return
+    _memory_put(key, text)
+    _disk_put(key, text)
+    _count('stores')
+
+
+def stats():
+    """
+    Returns hit/miss counters and the current memory tier size
+    """
+    with _lock:
+        result = dict(_stats)
+        result['memory_entries'] = len(_entries)
+    return result
+
+
+def clear():
+    """
+    Empties the memory tier and resets the counters
+    """
+    with _lock:
+        _entries.clear()
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+from io import BytesIO
+from PIL import Image, ImageOps
+
+import imageAdmission
+import structuredLog
+
+# OCR pre-processing.
+#
+# Phone photos of cards arrive at 4000px and several MB, far more than Vision
+# needs to read the text. Before an image goes to the OCR backend it is
+# downscaled to a text-readable size, optionally converted to grayscale and
+# re-encoded as a compact JPEG. The transform is lossy, so it stays off
+# until benchmarks/ocr_preprocess.py has shown on a set of real card images
+# that the numbers are still read as often as from the originals.
+
+log = structuredLog.get_logger(__name__)
+
+ENABLED = os.getenv('OCR_PREPROCESS', '0').lower() in ('1', 'true', 'yes')
+MAX_DIMENSION = int(os.getenv('OCR_MAX_DIMENSION', '1600'))
+GRAYSCALE = os.getenv('OCR_GRAYSCALE', '').lower() in ('1', 'true', 'yes')
+JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', '85'))
+
+_lock = threading.Lock()
+_stats = {'images': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0}
+
+
+def _record(bytes_in, bytes_out, seconds):
+    with _lock:
+        _stats['images'] += 1
+        _stats['bytes_in'] += bytes_in
+        _stats['bytes_out'] += bytes_out
+        _stats['seconds'] += seconds
+
+
+def _target_size(size, max_dimension):
+    width, height = size
+    longest = max(width, height)
+    if max_dimension <= 0 or longest <= max_dimension:
+        return size
+    scale = max_dimension / longest
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def prepare_for_ocr(image_bytes):
+    """
+    Shrinks an image to the smallest payload that keeps its text readable
+    Returns: bytes to send to the OCR backend (the original bytes when
+             pre-processing is disabled, fails or would not make it smaller)
+    """
+    if not ENABLED:
+        return image_bytes
+
+    start = time.perf_counter()
+    try:
+        # Over the pixel budget the upload goes to OCR as it is, never decoded here
+        img, scale = imageAdmission.admit(BytesIO(image_bytes))
+        target = _target_size(img.size, MAX_DIMENSION)
+        target_mode = 'L' if GRAYSCALE else 'RGB'
+
+        if target == img.size and img.format == 'JPEG' and not GRAYSCALE:
+            # Already small enough; re-encoding would only add generation loss
+            _record(len(image_bytes), len(image_bytes), time.perf_counter() - start)
+            return image_bytes
+
+        if img.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when the target allows it
+            draft = target
+            if scale > 1:
+                budget = imageAdmission.draft_size(img.size, scale)
+                draft = (min(target[0], budget[0]), min(target[1], budget[1]))
+            img.draft(target_mode if img.mode in ('RGB', 'L') else img.mode, draft)
+
+        # Re-encoding drops EXIF, so bake the orientation into the pixels
+        ImageOps.exif_transpose(img, in_place=True)
+        target = _target_size(img.size, MAX_DIMENSION)
+
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        if img.mode != target_mode:
+            img = img.convert(target_mode)
+
+        if target != img.size:
+            img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=JPEG_QUALITY)
+        prepared = output.getvalue()
+
+        if len(prepared) >= len(image_bytes):
+            prepared = image_bytes
+        _record(len(image_bytes), len(prepared), time.perf_counter() - start)
+        return prepared
+
+    except Exception as e:
+        log.warning("Error in prepare_for_ocr", extra={'error': str(e)})
+        return image_bytes
+
+
+def stats():
+    """
+    Returns bytes received/sent and time spent in pre-processing
+    """
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,141 @@
+import os
+
+from werkzeug.http import parse_accept_header
+from werkzeug.datastructures import MIMEAccept
+
+import imageOps
+import metrics
+
+# Output format selection for the resize and reduce routes.
+#
+# A route answers with a named output: 'jpeg' is the quality 95 baseline
+# JPEG every route sent so far, 'pjpeg' an optimised progressive JPEG,
+# 'webp', 'avif' (when Pillow can encode it, natively or through
+# pillow-avif-plugin) and 'png', lossless for line-art scans. An explicit
+# `format` form or query parameter wins. Otherwise the outputs listed in
+# OUTPUT_NEGOTIATE are offered to the Accept header: one the client names
+# explicitly (image/avif, image/webp - wildcards do not count) with the
+# highest q is chosen, ties going to the earlier in OUTPUT_NEGOTIATE, and
+# OUTPUT_DEFAULT when none is named. Unless the output is the baseline
+# itself, the response reports the size of the same pixels as a baseline
+# JPEG and the bytes saved against it.
+
+# Output name -> (Pillow format, extra 'format' step options)
+PRESETS = {
+    'jpeg': ('JPEG', {}),
+    'pjpeg': ('JPEG', {'progressive': True}),
+    'webp': ('WEBP', {}),
+    'avif': ('AVIF', {}),
+    'png': ('PNG', {'optimize': True}),
+}
+
+# Quality presets of the lossy outputs, e.g. 'webp=75,avif=55'
+DEFAULT_QUALITIES = {'jpeg': imageOps.DEFAULT_QUALITY, 'pjpeg': 85, 'webp': 80, 'avif': 60}
+QUALITIES = dict(DEFAULT_QUALITIES, **{
+    name.strip().lower(): int(quality)
+    for name, _, quality in (item.partition('=') for item in os.getenv('OUTPUT_QUALITIES', '').split(','))
+    if name.strip() and quality.strip()
+})
+
+NEGOTIATE = tuple(name.strip().lower() for name in os.getenv('OUTPUT_NEGOTIATE', 'avif,webp').split(',') if name.strip())
+DEFAULT_OUTPUT = os.getenv('OUTPUT_DEFAULT', 'jpeg').strip().lower()
+# Report the bytes saved against the baseline JPEG (one more JPEG encode per response)
+COMPARE_BASELINE = os.getenv('OUTPUT_COMPARE_BASELINE', '1').lower() not in ('0', 'false', 'no')
+
+
+class OutputFormatError(ValueError):
+    pass
+
+
+def available():
+    """
+    Returns: names of the outputs this Pillow build can encode
+    """
+    return [name for name, (fmt, _) in PRESETS.items() if fmt in imageOps.FORMATS]
+
+
+def mimetype(name):
+    return imageOps.FORMATS[PRESETS[name][0]][0]
+
+
+def negotiate(accept, lossy=False):
+    """
+    accept: Accept header value, or None
+    lossy: only offer outputs with a quality setting (for a byte budget)
+    Returns: name of the output the client prefers, or OUTPUT_DEFAULT
+    """
+    offered = [name for name in NEGOTIATE if name in PRESETS and name in available()
+               and (not lossy or name in QUALITIES)]
+    if accept and offered:
+        # Exact mimetypes only: '*/*' and 'image/*' keep the default
+        named = {}
+        for value, quality in parse_accept_header(accept, MIMEAccept):
+            named[value.lower()] = max(quality, named.get(value.lower(), 0))
+        ranked = [(named.get(mimetype(name), 0), -index, name) for index, name in enumerate(offered)]
+        best = max(ranked)
+        if best[0] > 0:
+            return best[2]
+    if lossy and DEFAULT_OUTPUT not in QUALITIES:
+        return 'jpeg'
+    return DEFAULT_OUTPUT
+
+
+def choose(requested, accept, lossy=False):
+    """
+    Picks the output of one response
+    requested: the `format` parameter ('' or 'auto' to negotiate)
+    Returns: name of the output
+    Raises: OutputFormatError when the requested output is unknown or unavailable
+    """
+    name = (requested or '').strip().lower().replace('jpg', 'jpeg')
+    if name in ('', 'auto'):
+        return negotiate(accept, lossy)
+    if name not in available():
+        raise OutputFormatError(f"Unsupported output format '{requested}', expected one of {available()}")
+    if lossy and name not in QUALITIES:
+        raise OutputFormatError(f"Output format '{requested}' has no quality to reduce")
+    return name
+
+
+def operation(name, reduce=False):
+    """
+    Returns: the imageOps 'format' step producing an output
+    reduce: the step follows a 'reduce', which searches the quality itself
+    """
+    fmt, options = PRESETS[name]
+    step = {'op': 'format', 'format': fmt, 'quality': None if reduce else QUALITIES.get(name)}
+    step.update(options)
+    step['baseline'] = COMPARE_BASELINE and name != 'jpeg' and not reduce
+    return step
+
+
+def with_output(operations, requested, accept):
+    """
+    Adds the chosen output to a /pipeline description without a 'format' step
+    Returns: (parsed operations, output name or None when the description has its own)
+    Raises: ValueError for invalid operations, OutputFormatError
+    """
+    operations = imageOps.parse_operations(operations)
+    if any(op['op'] == 'format' for op in operations):
+        return operations, None
+    reduce = any(op['op'] == 'reduce' for op in operations)
+    name = choose(requested, accept, lossy=reduce)
+    return operations + [operation(name, reduce)], name
+
+
+def report(result, name):
+    """
+    Counts one output in the metrics
+    Returns: response headers describing the output and its savings
+    """
+    if result.get('passthrough'):
+        # The upload went back as it was: report its format, not the one negotiated
+        name = result['format'].lower()
+    headers = {'Vary': 'Accept', 'X-Output-Format': name}
+    metrics.IMAGE_OUTPUTS.labels(name).inc()
+    baseline = result.get('baseline_size')
+    if baseline is not None:
+        headers['X-Baseline-Size'] = str(baseline)
+        headers['X-Bytes-Saved'] = str(baseline - result['size'])
+        metrics.IMAGE_BYTES_SAVED.labels(name).inc(max(baseline - result['size'], 0))
+    return headers
@@ -1,102 +1,115 @@
 import re
-import os
+import logging
+
+import ocrCache
+import singleFlight
+import stageTimer
+import structuredLog
+import textDetection
+import textExtraction
+
+log = structuredLog.get_logger(__name__)
 
 def pan_auth_img(image_bytes):
     """
     Validates PAN card from image using Google Cloud Vision OCR
+    Concurrent calls with the same image share one OCR call (singleFlight)
     Returns: (is_valid, pan_number, confidence_score)
     """
+    key = ocrCache.image_key(image_bytes)
+    return tuple(singleFlight.do('pan', key, lambda: _pan_auth_img(image_bytes, key)))
+
+def _pan_auth_img(image_bytes, key):
     try:
-        # Check for credentials first
-        creds_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-        if not creds_path:
-            creds_path = 'credentials.json'
-        
-        print(f"Looking for credentials at: {creds_path}")
-        
-        if not os.path.exists(creds_path):
-            print(f"WARNING: Google Cloud credentials not found!")
-            print("Returning error - please upload credentials.json or set GOOGLE_APPLICATION_CREDENTIALS")
-            return False, "Please set up Google Cloud Vision API credentials to use image verification", 0
-        
-        from google.cloud import vision
+        full_text, error = textDetection.detect_text(image_bytes, key)
+        if error:
+            return False, error, 0
         
-        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
-        print("Credentials loaded successfully")
+        return pan_auth_text(full_text)
         
-        client = vision.ImageAnnotatorClient()
-        image = vision.Image(content=image_bytes)
-        
-        print("Calling Google Cloud Vision API...")
-        response = client.text_detection(image=image)
-        
-        if response.error.message:
-            print(f"Google Cloud Vision API error: {response.error.message}")
-            return False, f"API_ERROR: {response.error.message}", 0
-        
-        if not response.text_annotations:
-            print("No text found in image by OCR")
+    except Exception as e:
+        log.exception("PAN image verification failed")
+        return False, f"EXCEPTION: {str(e)}", 0
+
+async def pan_auth_img_async(image_bytes):
+    """
+    pan_auth_img for the ASGI server, awaiting the OCR backend
+    Returns: (is_valid, pan_number, confidence_score)
+    """
+    key = ocrCache.image_key(image_bytes)
+    return tuple(await singleFlight.do_async('pan', key, lambda: _pan_auth_img_async(image_bytes, key)))
+
+async def _pan_auth_img_async(image_bytes, key):
+    try:
+        full_text, error = await textDetection.detect_text_async(image_bytes, key)
+        if error:
+            return False, error, 0
+        return pan_auth_text(full_text)
+
+    except Exception as e:
+        log.exception("PAN image verification failed")
+        return False, f"EXCEPTION: {str(e)}", 0
+
+def pan_auth_text(full_text):
+    """
+    Validates PAN card from already extracted OCR text
+    Returns: (is_valid, pan_number, confidence_score)
+    """
+    try:
+        if not full_text:
+            log.info("No text found in image by OCR", extra={'document': 'pan', 'outcome': 'NO_TEXT_FOUND'})
             return False, "NO_TEXT_FOUND", 0
-            
-        full_text = response.text_annotations[0].description
-        texts = full_text.split("\n")
-        
-        print("="*50)
-        print("EXTRACTED TEXT:")
-        print(full_text)
-        print("="*50)
-        
-        # Check for PAN keywords
-        pan_keywords = [
-            'INCOME', 'TAX', 'GOVT', 'GOVERNMENT', 'PERMANENT', 'ACCOUNT', 'NUMBER',
-            'PAN', 'INDIA', 'FATHER', 'NAME', 'DOB', 'SIGNATURE', 'DATE', 'BIRTH'
-        ]
         
-        keyword_matches = sum(1 for keyword in pan_keywords if keyword.upper() in full_text.upper())
-        print(f"Keyword matches found: {keyword_matches}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("OCR text", extra={'document': 'pan', 'ocr_text': structuredLog.redact(full_text)})
         
-        # Extract PAN number
-        pan_number = None
-        regex1 = r"[A-Z]{5}[0-9]{4}[A-Z]{1}"
+        with stageTimer.stage('extract'):
+            extraction = textExtraction.extract(full_text)
+            keyword_matches = textExtraction.keyword_count(extraction, 'pan')
         
-        for text in texts:
-            text_clean = text.strip().upper().replace(" ", "").replace("-", "").replace(".", "").replace("_", "")
-            
-            if len(text_clean) == 10:
-                if re.match(regex1, text_clean):
-                    pan_number = text_clean
-                    print(f"Found PAN (exact match): {pan_number}")
-                    break
-            
-            match = re.search(regex1, text_clean)
-            if match:
-                pan_number = match.group()
-                print(f"Found PAN (regex search): {pan_number}")
-                break
-        
-        if not pan_number:
-            print("No PAN number pattern found in extracted text")
-            print("Extracted lines:")
-            for i, line in enumerate(texts[:20]):
-                print(f"  Line {i}: '{line}'")
+        if not extraction.pan:
+            log.info("No PAN number pattern found in extracted text",
+                     extra={'document': 'pan', 'outcome': 'NO_PAN_PATTERN', 'keyword_matches': keyword_matches})
             return False, "NO_PAN_PATTERN", 0
         
-        if not _validate_pan_structure(pan_number):
-            print(f"PAN structure validation failed for: {pan_number}")
-            return False, pan_number, 30
-        
-        confidence = 70
-        confidence += min(keyword_matches * 3, 30)
+        pan_number = next((number for number in extraction.pan if _validate_pan_structure(number)), None)
+        if pan_number is None:
+            log.info("PAN structure validation failed", extra={
+                'document': 'pan', 'outcome': 'INVALID_STRUCTURE', 'number': structuredLog.mask_pan(extraction.pan[0])
+            })
+            return False, extraction.pan[0], 30
         
-        print(f"✓ Validation successful! PAN: {pan_number}, Confidence: {confidence}%")
-        return True, pan_number, min(confidence, 100)
+        confidence = min(70 + min(keyword_matches * 3, 30), 100)
+        log.info("PAN verified", extra={
+            'document': 'pan', 'outcome': 'VALID', 'number': structuredLog.mask_pan(pan_number), 'confidence': confidence
+        })
+        return True, pan_number, confidence
         
     except Exception as e:
-        print(f"EXCEPTION in pan_auth_img: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("PAN text verification failed")
         return False, f"EXCEPTION: {str(e)}", 0
 
+# PAN holder category, keyed by the 4th character of the number
+PAN_HOLDER_TYPES = {
+    'P': 'Individual',
+    'C': 'Company',
+    'H': 'Hindu Undivided Family (HUF)',
+    'F': 'Firm',
+    'A': 'Association of Persons (AOP)',
+    'T': 'Trust (AOP)',
+    'B': 'Body of Individuals (BOI)',
+    'L': 'Local Authority',
+    'J': 'Artificial Juridical Person',
+    'G': 'Government'
+}
+
+_VALID_HOLDER_TYPES = frozenset(PAN_HOLDER_TYPES)
+
+_PAN_FORMAT = re.compile(r"[A-Z]{5}[0-9]{4}[A-Z]")
+
+# Format and holder type in one match, for callers that only need a yes/no
+PAN_STRUCTURE = re.compile(r"[A-Z]{3}[" + ''.join(PAN_HOLDER_TYPES) + r"][A-Z][0-9]{4}[A-Z]")
+
 def pan_auth_number(number):
     """
     Validates PAN card number format and structure
@@ -105,9 +118,7 @@ def pan_auth_number(number):
     try:
         clean_number = number.strip().upper().replace(" ", "").replace("-", "")
         
-        regex = r"^[A-Z]{5}[0-9]{4}[A-Z]{1}$"
-        
-        if len(clean_number) != 10 or not re.match(regex, clean_number):
+        if not _PAN_FORMAT.fullmatch(clean_number):
             return False, "", 0
         
         if not _validate_pan_structure(clean_number):
@@ -115,58 +126,26 @@ def pan_auth_number(number):
         
         return True, clean_number, 85
         
-    except Exception as e:
-        print(f"Error in pan_auth_number: {e}")
+    except Exception:
+        log.exception("PAN number validation failed")
         return False, "", 0
 
 def _validate_pan_structure(pan):
     """
     Validates PAN structure according to Indian Income Tax rules
     """
-    try:
-        if len(pan) != 10:
-            print(f"  Invalid length: {len(pan)}")
-            return False
-        
-        valid_types = ['P', 'C', 'H', 'F', 'A', 'T', 'B', 'L', 'J', 'G']
-        if pan[3] not in valid_types:
-            print(f"  Invalid 4th character: {pan[3]} (must be one of {valid_types})")
-            return False
-        
-        if not pan[:5].isalpha():
-            print(f"  First 5 chars not all letters: {pan[:5]}")
-            return False
-        
-        if not pan[5:9].isdigit():
-            print(f"  Middle 4 chars not all digits: {pan[5:9]}")
-            return False
-        
-        if not pan[9].isalpha():
-            print(f"  Last char not a letter: {pan[9]}")
-            return False
-        
-        return True
-    except Exception as e:
-        print(f"  Exception in structure validation: {e}")
-        return False
+    return (
+        len(pan) == 10
+        and pan[3] in _VALID_HOLDER_TYPES
+        and pan[:5].isalpha()
+        and pan[5:9].isdigit()
+        and pan[9].isalpha()
+    )
 
 def get_pan_holder_type(pan):
     """
     Returns the type of PAN holder based on 4th character
     """
-    types = {
-        'P': 'Individual',
-        'C': 'Company',
-        'H': 'Hindu Undivided Family (HUF)',
-        'F': 'Firm',
-        'A': 'Association of Persons (AOP)',
-        'T': 'Trust (AOP)',
-        'B': 'Body of Individuals (BOI)',
-        'L': 'Local Authority',
-        'J': 'Artificial Juridical Person',
-        'G': 'Government'
-    }
-    
     if len(pan) >= 4:
-        return types.get(pan[3], 'Unknown')
+        return PAN_HOLDER_TYPES.get(pan[3], 'Unknown')
     return 'Unknown'
@@ -1,44 +1,75 @@
-import os
 from io import BytesIO
 from PIL import Image
 
-def reduce_storage(image_bytes):
+import imageAdmission
+import imageOps
+import imagePool
+import structuredLog
+
+log = structuredLog.get_logger(__name__)
+
+# Without an explicit target, aim for a 30% reduction at the best quality that reaches it
+DEFAULT_TARGET_RATIO = 0.7
+# ...without going below the quality the old fixed ladder stopped at; only an
+# explicit target may push the search down to imageOps.MIN_QUALITY
+DEFAULT_MIN_QUALITY = 45
+
+
+def reduce_to_target(source, target_bytes=None, target_ratio=None, max_passes=None, workers=None, output=None):
+    """
+    Finds the highest JPEG quality whose output fits a byte budget with a
+    bounded bisection search over one decoded image
+    source: encoded bytes or a seekable stream such as a spooled upload
+    target_bytes wins over target_ratio; with neither, DEFAULT_TARGET_RATIO is
+    used and the quality stays at DEFAULT_MIN_QUALITY or above
+    output: outputFormat 'format' step with a lossy format to search instead of JPEG
+    Returns: dict with buffer, quality, size, original_size, target_bytes,
+             target_met and passes (number of encodes) or None on error;
+             passthrough is set when the upload is sent back unchanged
+    """
+    try:
+        operations = [
+            {
+                'op': 'reduce',
+                'target_bytes': target_bytes,
+                'target_ratio': None if target_bytes else (target_ratio or DEFAULT_TARGET_RATIO),
+                'max_passes': max_passes,
+                'min_quality': None if target_bytes or target_ratio else DEFAULT_MIN_QUALITY,
+            },
+            output or {'op': 'format', 'format': 'JPEG'},
+        ]
+        result = imageOps.run_pipeline(source, operations, workers=workers)
+
+        if result['size'] >= result['original_size']:
+            # Re-encoding did not help; send the upload back as it is. Upload
+            # streams are closed with the request, before the response body is sent.
+            original = source if isinstance(source, bytes) else imageOps.as_stream(source).read()
+            source_format = result['source_format']
+            result.update({
+                'buffer': BytesIO(original),
+                'quality': None,
+                'size': result['original_size'],
+                'target_met': result['original_size'] <= result['target_bytes'],
+                'format': source_format,
+                'mimetype': Image.MIME.get(source_format, 'application/octet-stream'),
+                'extension': source_format.lower(),
+                'passthrough': True,
+            })
+            if source_format in imageOps.FORMATS:
+                result['mimetype'], result['extension'], _ = imageOps.FORMATS[source_format]
+        return result
+
+    except (imagePool.ImagePoolError, imageAdmission.ImageRejectedError):
+        raise
+    except Exception:
+        log.exception("Error in reduce_to_target")
+        return None
+
+
+def reduce_storage(image_bytes, target_bytes=None, target_ratio=None):
     """
     Reduce image file size while maintaining quality
     Returns: reduced image bytes or None
     """
-    try:
-        # Open image
-        img = Image.open(BytesIO(image_bytes))
-        
-        # Convert to RGB if necessary (for PNG with transparency)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        
-        # Try different quality levels to reduce size
-        original_size = len(image_bytes)
-        best_result = image_bytes
-        
-        for quality in [85, 75, 65, 55, 45]:
-            output = BytesIO()
-            img.save(output, format='JPEG', quality=quality, optimize=True)
-            reduced_bytes = output.getvalue()
-            
-            # If we achieved significant reduction, use this
-            if len(reduced_bytes) < original_size * 0.7:  # 30% reduction
-                best_result = reduced_bytes
-                break
-            elif len(reduced_bytes) < len(best_result):
-                best_result = reduced_bytes
-        
-        return best_result if len(best_result) < original_size else image_bytes
-        
-    except Exception as e:
-        print(f"Error in reduce_storage: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
\ No newline at end of file
+    result = reduce_to_target(image_bytes, target_bytes=target_bytes, target_ratio=target_ratio)
+    return imageOps.result_bytes(result) if result else None
@@ -0,0 +1,167 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import PIL
+from werkzeug.http import parse_etags
+
+import imageAdmission
+import imageOps
+import metrics
+import stageTimer
+
+# Cache of encoded derivatives for the resize, reduce and pipeline routes.
+#
+# A derivative is identified by the SHA-256 of the upload, the route, its
+# parameters (size, budget, the resolved output format step) and the
+# settings that change the output (Pillow version, the pixel budget that
+# decides draft decoding, strip processing, reducing gap, quality search
+# passes and workers). That key doubles as a strong ETag, so a client sending
+# If-None-Match with the ETag of a previous answer gets 304 once the
+# upload is hashed, before anything is decoded. Other repeats are served
+# from a per-worker LRU of encoded bodies bounded by RESULT_CACHE_BYTES in
+# total; bodies above RESULT_CACHE_MAX_ENTRY_BYTES are not kept.
+
+MAX_BYTES = int(os.getenv('RESULT_CACHE_BYTES', str(64 * 1024 * 1024)))
+MAX_ENTRY_BYTES = int(os.getenv('RESULT_CACHE_MAX_ENTRY_BYTES', str(MAX_BYTES // 8)))
+# Bump when a code change alters encoded outputs for the same parameters
+VERSION = 2
+
+HASH_CHUNK = 1024 * 1024
+
+# An encoded derivative with the response headers describing it
+Entry = namedtuple('Entry', ['body', 'mimetype', 'download_name', 'headers'])
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_size = 0
+_stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'stores': 0, 'evictions': 0, 'too_large': 0}
+
+_SETTINGS = {
+    'version': VERSION,
+    'pillow': PIL.__version__,
+    'max_pixels': imageAdmission.MAX_PIXELS,
+    'strip_pixels': imageOps.STRIP_PIXELS,
+    'strip_rows': imageOps.STRIP_ROWS,
+    'reducing_gap': imageOps.REDUCING_GAP,
+    'max_passes': imageOps.MAX_PASSES,
+    # Parallel search rounds probe other qualities than plain bisection
+    'reduce_workers': imageOps.WORKERS,
+}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def upload_hash(source):
+    """
+    Hashes an upload given as bytes or a seekable stream, in chunks
+    Returns: hex SHA-256 of the upload
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    stream = imageOps.as_stream(source)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def key(route, source, params):
+    """
+    Returns: cache key and ETag value of a derivative - route and params
+             must determine the output together with the upload
+    """
+    with stageTimer.stage('cache'):
+        description = json.dumps(
+            {'route': route, 'params': params, 'settings': _SETTINGS, 'upload': upload_hash(source)},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+def etag(cache_key):
+    """
+    Returns: the quoted ETag header value for a cache key
+    """
+    return f'"{cache_key}"'
+
+
+def not_modified(if_none_match, cache_key):
+    """
+    if_none_match: If-None-Match header value, or None
+    Returns: True when the client already holds this derivative (counted)
+    """
+    if not if_none_match or not parse_etags(if_none_match).contains_weak(cache_key):
+        return False
+    _count('not_modified')
+    metrics.RESULT_CACHE_LOOKUPS.labels('not_modified').inc()
+    return True
+
+
+def get(cache_key):
+    """
+    Returns: the cached Entry, or None on a miss
+    """
+    with _lock:
+        entry = _entries.get(cache_key)
+        if entry is not None:
+            _entries.move_to_end(cache_key)
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+    metrics.RESULT_CACHE_LOOKUPS.labels('hit' if entry is not None else 'miss').inc()
+    return entry
+
+
+def put(cache_key, entry):
+    """
+    Stores an Entry, evicting the least recently used ones past RESULT_CACHE_BYTES
+    """
+    global _size
+    size = len(entry.body)
+    if MAX_BYTES <= 0:
+        return
+    if size > min(MAX_ENTRY_BYTES, MAX_BYTES):
+        _count('too_large')
+        return
+    with _lock:
+        previous = _entries.pop(cache_key, None)
+        if previous is not None:
+            _size -= len(previous.body)
+        _entries[cache_key] = entry
+        _size += size
+        _stats['stores'] += 1
+        while _size > MAX_BYTES:
+            _, evicted = _entries.popitem(last=False)
+            _size -= len(evicted.body)
+            _stats['evictions'] += 1
+        metrics.RESULT_CACHE_BYTES.set(_size)
+
+
+def stats():
+    """
+    Returns: hit/miss counters, entry count and bytes held
+    """
+    with _lock:
+        result = dict(_stats)
+        result.update({'entries': len(_entries), 'bytes': _size, 'max_bytes': MAX_BYTES})
+    return result
+
+
+def clear():
+    """
+    Empties the cache and resets the counters
+    """
+    global _size
+    with _lock:
+        _entries.clear()
+        _size = 0
+        for name in _stats:
+            _stats[name] = 0
+        metrics.RESULT_CACHE_BYTES.set(0)
@@ -0,0 +1,380 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import metrics
+import structuredLog
+
+# Coalescing of identical concurrent work ("single flight").
+#
+# The first caller for a key runs the work; callers arriving while it is in
+# flight wait for it and share its result instead of starting their own
+# OCR call. Inside a process followers wait on the leader's event (request
+# threads) or future (the ASGI event loop).
+#
+# With SINGLEFLIGHT_DIR set, sharing extends to the gunicorn workers of a
+# host. The leader holds an exclusive flock on <dir>/<name>-<key>.lock; a
+# worker finding it taken holds a shared flock on <name>-<key>.wait and
+# polls until the lock is released. Only when a worker is waiting does the
+# leader write its JSON encoded result to <name>-<key>.json, and the last
+# waiting worker to read it removes it. Results carry the ID numbers read
+# from the card, so the directory is created 0700 and its files 0600.
+# A follower whose leader failed, or that waited SINGLEFLIGHT_TIMEOUT
+# seconds, runs the work itself. Results are not kept: a request arriving
+# after the leader finished starts a new flight (the OCR cache covers that).
+
+ENABLED = os.getenv('SINGLEFLIGHT', '1').lower() not in ('0', 'false', 'no')
+# Unset or '' keeps coalescing inside each worker
+LOCK_DIR = os.getenv('SINGLEFLIGHT_DIR', '')
+TIMEOUT = float(os.getenv('SINGLEFLIGHT_TIMEOUT', '60'))
+POLL_SECONDS = 0.02
+# Lock files untouched for this long are removed. Leaders sweep at most
+# every TIMEOUT, also removing results no follower can still accept
+SWEEP_AGE = max(600.0, 2 * TIMEOUT)
+
+log = structuredLog.get_logger(__name__)
+
+_lock = threading.Lock()
+_flights = {}
+_async_flights = {}
+_last_sweep = 0.0
+_dir_ready = False
+_stats = {'leaders': 0, 'process_followers': 0, 'host_followers': 0, 'fallbacks': 0}
+
+# Result of a flight whose leader raised or was cancelled
+_FAILED = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = _FAILED
+
+
+def _reset_after_fork():
+    # Flights of the parent never finish in the child
+    global _lock, _flights, _async_flights
+    _lock = threading.Lock()
+    _flights = {}
+    _async_flights = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _count(name, document=None, scope=None):
+    with _lock:
+        _stats[name] += 1
+    if scope is not None:
+        metrics.OCR_COALESCED.labels(document, scope).inc()
+
+
+def _shared_path(name, key):
+    if fcntl is None or not LOCK_DIR:
+        return None
+    return os.path.join(LOCK_DIR, f"{name}-{key}")
+
+
+def _prepare_dir():
+    # Private to the user running the workers, whatever the umask
+    global _dir_ready
+    if not _dir_ready:
+        os.makedirs(LOCK_DIR, mode=0o700, exist_ok=True)
+        if os.stat(LOCK_DIR).st_mode & 0o077:
+            os.chmod(LOCK_DIR, 0o700)
+        _dir_ready = True
+
+
+def _open_lock(path, suffix='.lock'):
+    """
+    Returns: file descriptor of the lock file, or None if it cannot be created
+    """
+    try:
+        _prepare_dir()
+        return os.open(path + suffix, os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError as e:
+        log.warning("Could not open single flight lock", extra={'error': str(e)})
+        return None
+
+
+def _try_lock(fd, mode):
+    try:
+        fcntl.flock(fd, mode | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _begin_wait(path):
+    """
+    Marks this worker as waiting on another worker's flight
+    Returns: file descriptor holding a shared lock on the wait file, or None
+    """
+    fd = _open_lock(path, '.wait')
+    if fd is not None:
+        # Only blocks while a worker briefly checks for waiters
+        fcntl.flock(fd, fcntl.LOCK_SH)
+    return fd
+
+
+def _end_wait(path, fd):
+    # The last waiting worker to leave removes the shared result
+    if fd is None:
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        if _try_lock(fd, fcntl.LOCK_EX):
+            try:
+                os.remove(path + '.json')
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.warning("Could not remove single flight result", extra={'error': str(e)})
+    finally:
+        os.close(fd)
+
+
+def _followers_waiting(path):
+    """
+    Returns: True when another worker holds the wait lock of this flight
+    """
+    fd = _open_lock(path, '.wait')
+    if fd is None:
+        return False
+    try:
+        if _try_lock(fd, fcntl.LOCK_EX):
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return False
+        return True
+    finally:
+        os.close(fd)
+
+
+def _write_result(path, result):
+    # Rename into place so a follower never reads a partial result
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=LOCK_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'written': time.time(), 'result': result}, f)
+        os.replace(tmp_path, path + '.json')
+    except (OSError, TypeError, ValueError) as e:
+        log.warning("Could not share single flight result", extra={'error': str(e)})
+
+
+def _read_result(path, arrived):
+    """
+    Returns: (True, result) if a leader finished after `arrived`, else (False, None)
+    """
+    try:
+        with open(path + '.json', 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return False, None
+    if entry.get('written', 0) < arrived:
+        return False, None
+    return True, entry['result']
+
+
+def _sweep():
+    # Drops files of past flights; a flight still using a removed lock
+    # file at worst runs its work twice
+    global _last_sweep
+    now = time.time()
+    with _lock:
+        if now - _last_sweep < TIMEOUT:
+            return
+        _last_sweep = now
+    try:
+        with os.scandir(LOCK_DIR) as entries:
+            for entry in entries:
+                max_age = TIMEOUT if entry.name.endswith(('.json', '.tmp')) else SWEEP_AGE
+                try:
+                    if now - entry.stat().st_mtime > max_age:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+
+def _across_workers(name, key, work):
+    """
+    Runs work() unless another worker on the host is already running it
+    Returns: (result, scope) with scope 'host' when another worker's result was used
+    """
+    path = _shared_path(name, key)
+    fd = _open_lock(path) if path else None
+    if fd is None:
+        return work(), None
+    wait_fd = None
+    try:
+        arrived = time.time()
+        deadline = time.monotonic() + TIMEOUT
+        waited = False
+        while True:
+            if waited and _try_lock(fd, fcntl.LOCK_SH):
+                try:
+                    found, result = _read_result(path, arrived)
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                if found:
+                    return result, 'host'
+            if _try_lock(fd, fcntl.LOCK_EX):
+                _end_wait(path, wait_fd)
+                wait_fd = None
+                try:
+                    result = work()
+                    if _followers_waiting(path):
+                        _write_result(path, result)
+                    return result, None
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    _sweep()
+            if time.monotonic() >= deadline:
+                _count('fallbacks')
+                return work(), None
+            if not waited:
+                wait_fd = _begin_wait(path)
+                waited = True
+            time.sleep(POLL_SECONDS)
+    finally:
+        _end_wait(path, wait_fd)
+        os.close(fd)
+
+
+async def _across_workers_async(name, key, work):
+    """
+    _across_workers for the event loop: polls with asyncio.sleep and awaits work()
+    Returns: (result, scope)
+    """
+    path = _shared_path(name, key)
+    fd = _open_lock(path) if path else None
+    if fd is None:
+        return await work(), None
+    wait_fd = None
+    try:
+        arrived = time.time()
+        deadline = time.monotonic() + TIMEOUT
+        waited = False
+        while True:
+            if waited and _try_lock(fd, fcntl.LOCK_SH):
+                try:
+                    found, result = _read_result(path, arrived)
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                if found:
+                    return result, 'host'
+            if _try_lock(fd, fcntl.LOCK_EX):
+                _end_wait(path, wait_fd)
+                wait_fd = None
+                try:
+                    result = await work()
+                    if _followers_waiting(path):
+                        _write_result(path, result)
+                    return result, None
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    _sweep()
+            if time.monotonic() >= deadline:
+                _count('fallbacks')
+                return await work(), None
+            if not waited:
+                wait_fd = _begin_wait(path)
+                waited = True
+            await asyncio.sleep(POLL_SECONDS)
+    finally:
+        _end_wait(path, wait_fd)
+        os.close(fd)
+
+
+def do(name, key, work):
+    """
+    Runs work() once for all concurrent callers with the same name and key
+    name: kind of work, e.g. the document type; key: content hash of the input
+    Returns: work()'s result; it must be JSON serialisable, and a result
+             from another worker comes back JSON decoded (tuples as lists)
+    """
+    if not ENABLED:
+        return work()
+
+    flight_key = (name, key)
+    with _lock:
+        flight = _flights.get(flight_key)
+        leader = flight is None
+        if leader:
+            flight = _flights[flight_key] = _Flight()
+
+    if not leader:
+        if flight.done.wait(TIMEOUT) and flight.result is not _FAILED:
+            _count('process_followers', name, 'process')
+            return flight.result
+        _count('fallbacks')
+        return work()
+
+    try:
+        result, scope = _across_workers(name, key, work)
+        flight.result = result
+    finally:
+        with _lock:
+            del _flights[flight_key]
+        flight.done.set()
+    if scope:
+        _count('host_followers', name, scope)
+    else:
+        _count('leaders')
+    return result
+
+
+async def do_async(name, key, work):
+    """
+    do() for the ASGI event loop; work is a coroutine function
+    Returns: work()'s result, as do()
+    """
+    if not ENABLED:
+        return await work()
+
+    flight_key = (name, key)
+    flight = _async_flights.get(flight_key)
+    if flight is not None:
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight), TIMEOUT)
+        except asyncio.TimeoutError:
+            result = _FAILED
+        if result is not _FAILED:
+            _count('process_followers', name, 'process')
+            return result
+        _count('fallbacks')
+        return await work()
+
+    flight = _async_flights[flight_key] = asyncio.get_running_loop().create_future()
+    result = _FAILED
+    try:
+        result, scope = await _across_workers_async(name, key, work)
+    finally:
+        del _async_flights[flight_key]
+        flight.set_result(result)
+    if scope:
+        _count('host_followers', name, scope)
+    else:
+        _count('leaders')
+    return result
+
+
+def stats():
+    """
+    Returns: flights led, requests answered by another request of this
+             process or of another worker, and followers that ran the work themselves
+    """
+    with _lock:
+        result = dict(_stats)
+        result['in_flight'] = len(_flights) + len(_async_flights)
+    return result
@@ -0,0 +1,190 @@
+import os
+import re
+import time
+import random
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import structuredLog
+
+# Stage-level timers for a single request.
+#
+# Backend functions wrap their phases in `with stage('decode'):`. While a
+# request scope is open (begin() ... end()) the durations are collected per
+# stage and can be sent as a Server-Timing header; outside a scope, e.g. in
+# jobs or benchmarks, stage() only costs a context variable lookup.
+# Profiling hooks see every request's timings and may run code around it.
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1').lower() not in ('0', 'false', 'no')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/profiles')
+
+log = structuredLog.get_logger(__name__)
+
+_current = contextvars.ContextVar('stage_timings', default=None)
+_hooks = []
+
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9_\-]")
+
+
+class Timings:
+    """Accumulated seconds per stage, in first-seen order"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.hook_state = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        """
+        Returns: {stage: milliseconds}
+        """
+        return {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a block as one stage of the current request; repeated stages add up
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def add(name, seconds):
+    """
+    Adds a duration measured elsewhere, e.g. in a worker process, to the current request
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def collect():
+    """
+    Collects the stages of a block outside a request scope, without running hooks
+    Returns: Timings
+    """
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def begin():
+    """
+    Opens a timing scope for the current request and runs the hooks' start step
+    Returns: Timings
+    """
+    timings = Timings()
+    _current.set(timings)
+    for hook in _hooks:
+        try:
+            timings.hook_state[hook] = hook.start()
+        except Exception:
+            log.exception("Profiling hook failed to start", extra={'hook': type(hook).__name__})
+    return timings
+
+
+def end(timings, route):
+    """
+    Closes the timing scope and hands the timings to every hook
+    """
+    _current.set(None)
+    total = timings.total()
+    for hook in _hooks:
+        try:
+            hook.finish(timings.hook_state.get(hook), route, timings, total)
+        except Exception:
+            log.exception("Profiling hook failed", extra={'hook': type(hook).__name__})
+
+
+def server_timing(timings):
+    """
+    Returns: Server-Timing header value, e.g. 'decode;dur=12.5, resize;dur=3.1, total;dur=17.0'
+    """
+    parts = [f"{_TOKEN_UNSAFE.sub('_', name)};dur={ms}" for name, ms in timings.as_dict().items()]
+    parts.append(f"total;dur={round(timings.total() * 1000, 3)}")
+    return ', '.join(parts)
+
+
+class ProfilingHook:
+    """
+    Base class for hooks called around each timed request
+    start() runs before the view; its return value is passed to finish()
+    """
+
+    def start(self):
+        return None
+
+    def finish(self, state, route, timings, total):
+        pass
+
+
+class CProfileSampler(ProfilingHook):
+    """Runs cProfile on a random sample of requests and dumps one .prof file per request"""
+
+    def __init__(self, rate, directory):
+        self.rate = rate
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def start(self):
+        if random.random() >= self.rate:
+            return None
+        # The profiler hooks the calling thread only, so one per thread at a time
+        thread = threading.get_ident()
+        with self._lock:
+            if thread in self._active:
+                return None
+            self._active.add(thread)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish(self, profiler, route, timings, total):
+        if profiler is None:
+            return
+        profiler.disable()
+        with self._lock:
+            self._active.discard(threading.get_ident())
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{int(time.time() * 1000)}-{os.getpid()}-{_TOKEN_UNSAFE.sub('_', route.strip('/')) or 'root'}.prof"
+        path = os.path.join(self.directory, name)
+        profiler.dump_stats(path)
+        log.info("Request profile written", extra={'route': route, 'path': path, 'total_ms': round(total * 1000, 3)})
+
+
+def register_hook(hook):
+    """
+    Adds a ProfilingHook called for every timed request
+    """
+    _hooks.append(hook)
+
+
+def unregister_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+if PROFILE_SAMPLE_RATE > 0:
+    register_hook(CProfileSampler(PROFILE_SAMPLE_RATE, PROFILE_DIR))
@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# Levelled, structured logging that never writes on the request thread.
+#
+# Loggers hand records to a bounded in-memory queue; one listener thread per
+# process formats them (JSON lines by default) and writes them to stderr.
+# When the queue is full records are dropped and counted rather than making
+# the request wait. The listener thread does not survive a fork, so it is
+# restarted in each gunicorn worker.
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+ROOT_LOGGER = 'docapi'
+
+# Aadhar numbers and 16 digit VIDs, with or without group separators
+_AADHAR_LIKE = re.compile(r"(?<![0-9])[0-9]{4}([ \-.]?)[0-9]{4}\1[0-9]{4}(?:\1[0-9]{4})?(?![0-9])")
+_PAN_LIKE = re.compile(r"(?<![A-Za-z])[A-Za-z]{5}[0-9]{4}[A-Za-z](?![A-Za-z])")
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_lock = threading.Lock()
+_queue = None
+_listener = None
+_configured = False
+_dropped = 0
+
+
+def mask_aadhar(number):
+    """
+    Returns: the number with every digit but the last four replaced by X
+    """
+    digits = sum(char.isdigit() for char in number)
+    seen = 0
+    masked = []
+    for char in number:
+        if char.isdigit():
+            seen += 1
+            masked.append(char if seen > digits - 4 else 'X')
+        else:
+            masked.append(char)
+    return ''.join(masked)
+
+
+def mask_pan(number):
+    """
+    Returns: the PAN with everything but the holder type character replaced by X
+    """
+    return ''.join(char if i == 3 else 'X' for i, char in enumerate(number))
+
+
+def redact(text):
+    """
+    Masks Aadhar numbers, VIDs and PANs in free text such as OCR output
+    """
+    if not text:
+        return text
+    text = _AADHAR_LIKE.sub(lambda match: mask_aadhar(match.group()), text)
+    return _PAN_LIKE.sub(lambda match: mask_pan(match.group()), text)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the fields passed through extra="""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable lines for local development, extra fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = ' '.join(f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        return f"{line} {fields}" if fields else line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # The queue never leaves the process, so the record is passed as it is
+        # and all formatting, tracebacks included, happens on the listener thread
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def _start_listener():
+    global _queue, _listener
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+    _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(_queue, handler, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for existing in list(root.handlers):
+        if isinstance(existing, _DroppingQueueHandler):
+            root.removeHandler(existing)
+    root.addHandler(_DroppingQueueHandler(_queue))
+
+
+def _restart_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    if _configured:
+        _start_listener()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def configure(level=None):
+    """
+    Routes every logger under ROOT_LOGGER through the queue listener
+    Safe to call more than once; level defaults to LOG_LEVEL
+    """
+    global _configured
+    with _lock:
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level or LOG_LEVEL)
+        if _configured:
+            return
+        root.propagate = False
+        _start_listener()
+        _configured = True
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """
+    Flushes queued records and stops the listener thread
+    """
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def get_logger(name):
+    """
+    Returns: logger for a module, named ROOT_LOGGER.<module>
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def stats():
+    """
+    Returns: dict with queued and dropped record counts
+    """
+    return {
+        'queued': _queue.qsize() if _queue is not None else 0,
+        'dropped': _dropped,
+    }
@@ -0,0 +1,150 @@
+import asyncio
+
+import metrics
+import ocrBackend
+import ocrCache
+import ocrPreprocess
+import stageTimer
+import structuredLog
+
+log = structuredLog.get_logger(__name__)
+
+CREDENTIALS_ERROR = "Please set up Google Cloud Vision API credentials to use image verification"
+
+
+def _full_text(response):
+    return response.text_annotations[0].description if response.text_annotations else ''
+
+
+def _cached(image_bytes, key=None):
+    with stageTimer.stage('ocr_cache'):
+        key = key or ocrCache.image_key(image_bytes)
+        full_text = ocrCache.get(key)
+    if full_text is not None:
+        log.debug("OCR cache hit")
+    return key, full_text
+
+
+def _unavailable(backend):
+    metrics.ocr_error(backend.name, 'unavailable')
+    log.warning("OCR backend unavailable: upload credentials.json or set GOOGLE_APPLICATION_CREDENTIALS",
+                extra={'backend': backend.name})
+    return None, CREDENTIALS_ERROR
+
+
+def _store(backend, key, response):
+    if response.error.message:
+        metrics.ocr_error(backend.name, 'api')
+        log.warning("OCR backend error", extra={'backend': backend.name, 'error': response.error.message})
+        return None, f"API_ERROR: {response.error.message}"
+
+    full_text = _full_text(response)
+    ocrCache.put(key, full_text)
+    return full_text, None
+
+
+def detect_text(image_bytes, key=None):
+    """
+    Returns the full OCR text of an image, served from the OCR cache when possible
+    key: ocrCache.image_key(image_bytes), if the caller already has it
+    Returns: (full_text, error) - full_text is '' when no text was found,
+             error is None on success
+    """
+    key, full_text = _cached(image_bytes, key)
+    if full_text is not None:
+        return full_text, None
+
+    backend = ocrBackend.get_backend()
+    if not backend.available():
+        return _unavailable(backend)
+
+    log.debug("Calling OCR backend", extra={'backend': backend.name})
+    with stageTimer.stage('ocr_preprocess'):
+        payload = ocrPreprocess.prepare_for_ocr(image_bytes)
+    with stageTimer.stage('ocr'), metrics.observe_ocr(backend.name):
+        response = backend.text_detection(payload)
+    return _store(backend, key, response)
+
+
+async def detect_text_async(image_bytes, key=None):
+    """
+    detect_text for the ASGI server: pre-processing runs on an executor
+    thread and the event loop is free while the backend call is in flight
+    Returns: (full_text, error)
+    """
+    key, full_text = _cached(image_bytes, key)
+    if full_text is not None:
+        return full_text, None
+
+    backend = ocrBackend.get_backend()
+    if not backend.available():
+        return _unavailable(backend)
+
+    log.debug("Calling OCR backend", extra={'backend': backend.name})
+    with stageTimer.stage('ocr_preprocess'):
+        payload = await asyncio.to_thread(ocrPreprocess.prepare_for_ocr, image_bytes)
+    with stageTimer.stage('ocr'), metrics.observe_ocr(backend.name):
+        response = await backend.text_detection_async(payload)
+    return _store(backend, key, response)
+
+
+# Vision accepts at most 16 images per synchronous batch_annotate_images call
+BATCH_LIMIT = 16
+
+
+def detect_text_batch(images):
+    """
+    Returns OCR text for up to BATCH_LIMIT images using one backend batch call
+    Cached images are answered locally and left out of the request.
+    Returns: list of (full_text, error) in input order
+    """
+    if len(images) > BATCH_LIMIT:
+        raise ValueError(f"At most {BATCH_LIMIT} images per batch, got {len(images)}")
+
+    results = [None] * len(images)
+    with stageTimer.stage('ocr_cache'):
+        keys = [ocrCache.image_key(image_bytes) for image_bytes in images]
+        pending = []
+        for i, key in enumerate(keys):
+            full_text = ocrCache.get(key)
+            if full_text is not None:
+                results[i] = (full_text, None)
+            else:
+                pending.append(i)
+
+    if not pending:
+        return results
+
+    backend = ocrBackend.get_backend()
+    if not backend.available():
+        metrics.ocr_error(backend.name, 'unavailable')
+        for i in pending:
+            results[i] = (None, CREDENTIALS_ERROR)
+        return results
+
+    log.debug("Calling OCR backend batch", extra={'backend': backend.name, 'images': len(pending)})
+    try:
+        with stageTimer.stage('ocr_preprocess'):
+            payloads = [ocrPreprocess.prepare_for_ocr(images[i]) for i in pending]
+        with stageTimer.stage('ocr'), metrics.observe_ocr(backend.name, 'batch'):
+            responses = backend.batch_text_detection(payloads)
+    except Exception as e:
+        log.warning("OCR backend batch error", extra={'backend': backend.name, 'error': str(e)})
+        for i in pending:
+            results[i] = (None, f"API_ERROR: {e}")
+        return results
+
+    for i, response in zip(pending, responses):
+        if response.error.message:
+            metrics.ocr_error(backend.name, 'api')
+            results[i] = (None, f"API_ERROR: {response.error.message}")
+            continue
+        full_text = _full_text(response)
+        ocrCache.put(keys[i], full_text)
+        results[i] = (full_text, None)
+
+    for i in pending:
+        if results[i] is None:
+            results[i] = (None, "API_ERROR: missing response")
+
+    return results
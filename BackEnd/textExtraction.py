@@ -0,0 +1,199 @@
+import re
+from collections import namedtuple
+
+# Single-pass extraction of keywords and ID number candidates from OCR text.
+#
+# The keywords of every document type and both number patterns are compiled
+# into one alternation whose branches all start with a literal character, so
+# the regex engine skips every position that cannot start a match without
+# entering the pattern. The text is upper-cased once and scanned once.
+# Numbers OCR split inside a group ('AB CDE 1234 F', '24 61 9341 4471') are
+# found as the original per-line extraction found them: a second, plain
+# regex pass over the text with separators dropped from every line.
+
+# Keywords whose presence raises the confidence of a document type
+DOCUMENT_KEYWORDS = {
+    'aadhar': (
+        'GOVERNMENT', 'INDIA', 'AADHAAR', 'AADHAR', 'UNIQUE', 'IDENTIFICATION',
+        'UIDAI', 'UID', 'DOB', 'MALE', 'FEMALE', 'YEAR', 'BIRTH', 'VID'
+    ),
+    'pan': (
+        'INCOME', 'TAX', 'GOVT', 'GOVERNMENT', 'PERMANENT', 'ACCOUNT', 'NUMBER',
+        'PAN', 'INDIA', 'FATHER', 'NAME', 'DOB', 'SIGNATURE', 'DATE', 'BIRTH'
+    ),
+}
+
+# Characters OCR puts between the groups of a printed number
+_SEP = r"[ \t\-._]*"
+# Separators plus at most one line break
+_BREAK = _SEP + r"(?:\r?\n" + _SEP + r")?"
+
+# Rest of a 4-4-4 Aadhar number after its first digit (2-9), not part of a longer digit run
+_AADHAR_REST = r"(?<![0-9].)[0-9]{3}" + _BREAK + r"[0-9]{4}" + _BREAK + r"[0-9]{4}(?![0-9])"
+
+# Rest of the 4 digit block of a PAN after its first digit. The 5 letters
+# before it (directly or after one separator or line break) and the final
+# letter are only looked at, so keywords next to the number are still seen.
+_PAN_REST = r"(?:(?<=[A-Z]{5}.)|(?<=[A-Z]{5}[ \t\n\-._].))[0-9]{3}" + _BREAK + r"(?=[A-Z])"
+
+# Drops the separators and line breaks a number may contain
+_STRIP_SEPARATORS = str.maketrans('', '', ' \t-._\r\n')
+# Drops the separators but keeps the lines
+_STRIP_LINE_SEPARATORS = str.maketrans('', '', ' \t-._\r')
+# From its first digit: a PAN anywhere in a line, or a line that is an
+# Aadhar number, once separators are dropped (digit first, like the scan)
+_LINE_NUMBERS = re.compile(r"[0-9](?:(?<=[A-Z]{5}[0-9])[0-9]{3}[A-Z]|(?<=^[2-9])[0-9]{11}$)", re.M).finditer
+
+Extraction = namedtuple('Extraction', ['keywords', 'aadhar', 'pan'])
+Extraction.__doc__ = """
+keywords: frozenset of keywords present in the text
+aadhar: 12 digit candidates in text order, single-line hits before ones spanning lines
+pan: 10 character candidates, ordered the same way
+"""
+
+
+def _trie_branches(words):
+    # One regex branch per distinct first letter, shaped as a prefix trie
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional: prefer the longer keyword, its prefixes are implied
+        return '(?:' + body + ')?' if '' in node else body
+
+    return [re.escape(char) + build(child) for char, child in sorted(trie.items())]
+
+
+def _number_branches():
+    branches = []
+    for digit in '0123456789':
+        rest = _PAN_REST if digit in '01' else '(?:' + _AADHAR_REST + '|' + _PAN_REST + ')'
+        branches.append(digit + rest)
+    return branches
+
+
+def _ordered(single_line, spanning):
+    # Same-line candidates, (line, number) pairs, in line order ahead of those spanning lines
+    return tuple(dict.fromkeys([number for _, number in sorted(single_line, key=lambda hit: hit[0])] + spanning))
+
+
+class TextExtractor:
+    """Compiled extractor for a mapping of document type -> keywords"""
+
+    def __init__(self, document_keywords):
+        self.document_keywords = {doc: frozenset(k.upper() for k in words) for doc, words in document_keywords.items()}
+        keywords = sorted(set().union(*self.document_keywords.values()))
+
+        # The scan consumes what it matches, so a keyword overlapping one found
+        # earlier is not reported on its own. Those contained in a hit are
+        # implied by it; those that only partly overlap one are re-checked.
+        self._implied = {
+            word: frozenset(other for other in keywords if other in word)
+            for word in keywords
+        }
+        self._overlapping = {
+            word: tuple(
+                other for other in keywords
+                if other not in word and any(other.startswith(word[i:]) for i in range(1, len(word)))
+                or word not in other and any(word.startswith(other[i:]) for i in range(1, len(other)))
+            )
+            for word in keywords
+        }
+
+        numbers = _number_branches()
+        self._scan = re.compile('|'.join(_trie_branches(keywords) + numbers)).finditer
+        self._numbers = re.compile('|'.join(numbers)).search
+
+    def _number(self, text, match, candidates):
+        # candidates: {'aadhar': ([], []), 'pan': ([], [])} of single-line and spanning hits
+        value = match.group()
+        spans_lines = '\n' in value
+        digits = value.translate(_STRIP_SEPARATORS)
+        if len(digits) == 12:
+            number = digits
+            document = 'aadhar'
+        else:
+            start = match.start()
+            letters = text[start - 5:start] if text[start - 1].isalpha() else text[start - 6:start - 1]
+            number = letters + digits + text[match.end()]
+            document = 'pan'
+        if spans_lines:
+            candidates[document][1].append(number)
+        else:
+            candidates[document][0].append((text.count('\n', 0, match.start()), number))
+        return spans_lines
+
+    def extract(self, full_text):
+        """
+        Scans OCR text once
+        Returns: Extraction
+        """
+        text = (full_text or '').upper()
+        found = set()
+        candidates = {'aadhar': ([], []), 'pan': ([], [])}
+        for match in self._scan(text):
+            value = match.group()
+            if value[0] > '9':
+                found.add(value)
+            elif self._number(text, match, candidates):
+                # A candidate spanning lines may have swallowed the start of a
+                # real number printed on the next line; look inside it again
+                start, end = match.span()
+                inner = self._numbers(text, start + 1)
+                while inner and inner.start() < end:
+                    self._number(text, inner, candidates)
+                    inner = self._numbers(text, inner.start() + 1)
+
+        stripped = text.translate(_STRIP_LINE_SEPARATORS)
+        for match in _LINE_NUMBERS(stripped):
+            start, end = match.span()
+            if end - start == 12:
+                candidates['aadhar'][0].append((stripped.count('\n', 0, start), match.group()))
+            else:
+                candidates['pan'][0].append((stripped.count('\n', 0, start), stripped[start - 5:end]))
+
+        keywords = set()
+        implied = self._implied
+        for word in found:
+            keywords |= implied[word]
+        overlapping = self._overlapping
+        pending = list(found)
+        while pending:
+            for other in overlapping[pending.pop()]:
+                if other not in keywords and other in text:
+                    keywords |= implied[other]
+                    pending.append(other)
+
+        return Extraction(frozenset(keywords), _ordered(*candidates['aadhar']), _ordered(*candidates['pan']))
+
+    def keyword_count(self, extraction, doc_type):
+        """
+        Returns: number of doc_type keywords found in an Extraction
+        """
+        return len(extraction.keywords & self.document_keywords[doc_type])
+
+
+_default = TextExtractor(DOCUMENT_KEYWORDS)
+
+
+def extract(full_text):
+    """
+    Extracts keywords and Aadhar/PAN candidates with the default keyword sets
+    Returns: Extraction
+    """
+    return _default.extract(full_text)
+
+
+def keyword_count(extraction, doc_type):
+    """
+    Returns: number of DOCUMENT_KEYWORDS[doc_type] found in an Extraction
+    """
+    return _default.keyword_count(extraction, doc_type)
@@ -0,0 +1,132 @@
+import os
+import threading
+
+import structuredLog
+
+# Process-wide Google Cloud Vision client.
+#
+# Building an ImageAnnotatorClient opens a gRPC channel, performs a TLS
+# handshake and fetches an auth token, so it is created once per worker and
+# shared by every request thread. gRPC channels must not cross a fork, which
+# is why the cached client is dropped in the child after gunicorn forks.
+
+log = structuredLog.get_logger(__name__)
+
+DEFAULT_CREDENTIALS_PATH = 'credentials.json'
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+_async_loop = None
+_credentials_path = None
+_resolved = False
+_pid = os.getpid()
+
+
+def _reset_after_fork():
+    global _lock, _client, _async_client, _async_loop, _credentials_path, _resolved, _pid
+    _lock = threading.Lock()
+    _client = None
+    _async_client = None
+    _async_loop = None
+    _credentials_path = None
+    _resolved = False
+    _pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _check_pid():
+    # Fallback for fork paths that bypass os.register_at_fork
+    if _pid != os.getpid():
+        _reset_after_fork()
+
+
+def credentials_path():
+    """
+    Resolves the service account file once per worker
+    Returns: credentials file path or None if no credentials are available
+    """
+    global _credentials_path, _resolved
+    _check_pid()
+    if _resolved:
+        return _credentials_path
+
+    with _lock:
+        if not _resolved:
+            path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or DEFAULT_CREDENTIALS_PATH
+            _credentials_path = path if os.path.exists(path) else None
+            _resolved = True
+    return _credentials_path
+
+
+def get_client():
+    """
+    Returns the shared ImageAnnotatorClient for this process
+    Returns: client or None if credentials are not configured
+    """
+    global _client
+    _check_pid()
+    if _client is not None:
+        return _client
+
+    path = credentials_path()
+    if path is None:
+        return None
+
+    with _lock:
+        if _client is None:
+            from google.cloud import vision
+            _client = vision.ImageAnnotatorClient.from_service_account_file(path)
+    return _client
+
+
+def get_async_client():
+    """
+    Returns the ImageAnnotatorAsyncClient for the running event loop
+    Its gRPC channel belongs to the loop it was created on, so a client is
+    kept per process and replaced if the loop changes.
+    Returns: client or None if credentials are not configured
+    """
+    global _async_client, _async_loop
+    import asyncio
+    _check_pid()
+    loop = asyncio.get_running_loop()
+    if _async_client is not None and _async_loop is loop:
+        return _async_client
+
+    path = credentials_path()
+    if path is None:
+        return None
+
+    from google.cloud import vision
+    _async_client = vision.ImageAnnotatorAsyncClient.from_service_account_file(path)
+    _async_loop = loop
+    return _async_client
+
+
+def warm():
+    """
+    Creates the client ahead of the first request (e.g. at worker boot)
+    Returns: True if a client is ready
+    """
+    try:
+        return get_client() is not None
+    except Exception as e:
+        log.warning("Could not warm Vision client", extra={'error': str(e)})
+        return False
+
+
+def reset():
+    """
+    Drops the cached client and credentials so they are resolved again
+    """
+    global _client, _async_client, _async_loop, _credentials_path, _resolved
+    with _lock:
+        _client = None
+        _async_client = None
+        _async_loop = None
+        _credentials_path = None
+        _resolved = False
@@ -2,36 +2,103 @@ import re
 import sys
 import os
 import json
+import tempfile
 from io import BytesIO
 
 # Add BackEnd directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'BackEnd'))
 
-from flask import Flask, render_template, Response, request, send_file, jsonify
+from flask import Flask, Request, current_app, g, render_template, Response, request, send_file, jsonify, stream_with_context
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 from PIL import Image
 
+import structuredLog
+
+structuredLog.configure()
+log = structuredLog.get_logger('app')
+
 # Import backend modules
 try:
-    import aadharVerification
-    import panVerification
-    import panResize 
-    import aadharResize
-    import reduceSize
+    import visionClient
+    import batchVerification
+    import jobQueue
+    import imagePool
+    import apiHandlers
+    import bulkValidation
+    import metrics
+    import stageTimer
 except ImportError as e:
-    print(f"Warning: Could not import backend modules: {e}")
+    log.warning("Could not import backend modules", extra={'error': str(e)})
+
+class SpooledRequest(Request):
+    """Buffers each uploaded file in memory up to UPLOAD_SPOOL_BYTES, then on disk"""
+
+    spool_bytes = int(os.getenv('UPLOAD_SPOOL_BYTES', str(512 * 1024)))
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_bytes, mode='rb+')
+
+    @property
+    def max_content_length(self):
+        # The bulk routes stream their rows, so they take far larger bodies than an image upload
+        if self.url_rule is not None and self.url_rule.rule in BULK_ROUTES:
+            return current_app.config['BULK_MAX_CONTENT_LENGTH']
+        return super().max_content_length
 
 app = Flask(__name__, 
             template_folder='Frontend/Templates',
             static_folder='Frontend/static')
 
+app.request_class = SpooledRequest
+
 app.config['UPLOAD_FOLDER'] = "/tmp/images"
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['BULK_MAX_CONTENT_LENGTH'] = int(os.getenv('BULK_MAX_CONTENT_LENGTH', str(1024 * 1024 * 1024)))
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+# Open the Vision channel at boot instead of on the first upload.
+# Under gunicorn --preload the client is dropped again in each forked worker.
+if os.getenv('VISION_WARM_ON_BOOT', '').lower() in ('1', 'true', 'yes'):
+    visionClient.warm()
+
+@app.before_request
+def start_stage_timing():
+    g.stage_timings = stageTimer.begin()
+    if request.mimetype == 'multipart/form-data':
+        # Parse the upload here so it shows up as its own stage
+        with stageTimer.stage('parse'):
+            try:
+                request.files
+            except Exception:
+                # Left for the view to report, as before
+                pass
+
+@app.before_request
+def bind_image_pool():
+    imagePool.bind_route(request.url_rule.rule if request.url_rule else request.path)
+
+@app.after_request
+def finish_stage_timing(response):
+    timings = g.pop('stage_timings', None)
+    if timings is not None:
+        if stageTimer.SERVER_TIMING:
+            response.headers['Server-Timing'] = stageTimer.server_timing(timings)
+        stageTimer.end(timings, request.url_rule.rule if request.url_rule else request.path)
+    return response
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _send(reply):
+    """An apiHandlers.Reply as a Flask response"""
+    if reply.download_name is not None:
+        response = send_file(BytesIO(reply.body), mimetype=reply.content_type, as_attachment=True, download_name=reply.download_name)
+        response.content_length = len(reply.body)
+        response.headers.update(reply.headers or {})
+        return response
+    return Response(reply.body, reply.status, reply.headers, content_type=reply.content_type)
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -51,218 +118,180 @@ def resize_page():
 
 @app.route("/aadharVerification", methods=['POST', 'GET'])
 def aadhar():
-    try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                is_valid, num, confidence = aadharVerification.aadhar_auth_img(file_bytes)
-                return jsonify({
-                    'valid': bool(is_valid),
-                    'number': str(num),
-                    'confidence': int(confidence),
-                    'message': 'Aadhar card verified successfully' if is_valid else 'Invalid or unreadable Aadhar card'
-                })
-        else:
-            number = request.form.get("number", "")
-            is_valid, num, confidence = aadharVerification.aadhar_auth_number(number)
-            return jsonify({
-                'valid': bool(is_valid),
-                'number': str(num),
-                'confidence': int(confidence),
-                'message': 'Valid Aadhar number' if is_valid else 'Invalid Aadhar number format'
-            })
-    except Exception as e:
-        print(f"Error in aadhar verification: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'valid': False,
-            'number': '',
-            'confidence': 0,
-            'error': str(e),
-            'message': 'Error processing Aadhar verification'
-        }), 403
+    return _send(apiHandlers.aadhar(request))
 
 @app.route("/panVerification", methods=['POST', 'GET'])
 def pan():
+    return _send(apiHandlers.pan(request))
+
+def _batch_response(doc_type):
+    """Streams one NDJSON line per uploaded file, in upload order"""
+    uploads = request.files.getlist('file') + request.files.getlist('files')
+    files = [(f.filename, f.stream) for f in uploads if f.filename != ""]
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+
+    def generate():
+        for result in batchVerification.verify_batch(files, doc_type):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route("/batch/aadharVerification", methods=['POST'])
+def batch_aadhar():
     try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                is_valid, num, confidence = panVerification.pan_auth_img(file_bytes)
-                holder_type = panVerification.get_pan_holder_type(num) if num else ''
-                return jsonify({
-                    'valid': bool(is_valid),
-                    'number': str(num),
-                    'confidence': int(confidence),
-                    'holder_type': holder_type,
-                    'message': 'PAN card verified successfully' if is_valid else 'Invalid or unreadable PAN card'
-                })
-        else:
-            number = request.form.get("number", "")
-            is_valid, num, confidence = panVerification.pan_auth_number(number)
-            holder_type = panVerification.get_pan_holder_type(num) if num else ''
-            return jsonify({
-                'valid': bool(is_valid),
-                'number': str(num),
-                'confidence': int(confidence),
-                'holder_type': holder_type,
-                'message': 'Valid PAN number' if is_valid else 'Invalid PAN number format'
-            })
+        return _batch_response('aadhar')
     except Exception as e:
-        print(f"Error in PAN verification: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'valid': False,
-            'number': '',
-            'confidence': 0,
-            'error': str(e),
-            'message': 'Error processing PAN verification'
-        }), 400
+        log.exception("Error in batch Aadhar verification")
+        return jsonify({'error': str(e), 'message': 'Error processing batch Aadhar verification'}), 400
 
-@app.route("/panResizeMAR", methods=["POST", "GET"])
-def panresizeMAR():
+@app.route("/batch/panVerification", methods=['POST'])
+def batch_pan():
     try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                height = int(request.form.get('height', 0))
-                width = int(request.form.get('width', 0))
-                result_bytes = panResize.resize_pan_mar(file_bytes, height, width)
-                if result_bytes:
-                    return send_file(BytesIO(result_bytes), mimetype='image/jpeg', as_attachment=True, download_name='resized.jpeg')
-                else:
-                    return "Inappropriate size", 400
+        return _batch_response('pan')
     except Exception as e:
-        print(f"Error in PAN resize MAR: {e}")
-        return f"Error: {str(e)}", 500
+        log.exception("Error in batch PAN verification")
+        return jsonify({'error': str(e), 'message': 'Error processing batch PAN verification'}), 400
 
-@app.route("/panResizeHard", methods=["POST", "GET"])
-def panresizehard():
+# Routes whose body is limited by BULK_MAX_CONTENT_LENGTH instead of MAX_CONTENT_LENGTH
+BULK_ROUTES = ('/bulk/aadharVerification', '/bulk/panVerification')
+
+def _bulk_response(validate_stream):
+    """Streams one NDJSON line per input row followed by a summary line"""
+    upload = request.files.get('file')
+    if upload is not None and upload.filename != "":
+        stream, content_type, filename = upload.stream, upload.mimetype, upload.filename
+    else:
+        stream, content_type, filename = request.stream, request.mimetype, ''
+    fmt = request.args.get('format') or bulkValidation.detect_format(content_type, filename)
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': f"Unsupported format: {fmt}"}), 400
+
+    def generate():
+        for result in validate_stream(stream, fmt):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route("/bulk/aadharVerification", methods=['POST'])
+def bulk_aadhar():
     try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                height = int(request.form.get('height', 0))
-                width = int(request.form.get('width', 0))
-                result_bytes = panResize.resize_pan_hard(file_bytes, height=height, width=width)
-                if result_bytes:
-                    return send_file(BytesIO(result_bytes), mimetype='image/jpeg', as_attachment=True, download_name='resized.jpeg')
-                else:
-                    return "Inappropriate size", 400
+        return _bulk_response(bulkValidation.validate_aadhar_stream)
+    except HTTPException:
+        # 413 past BULK_MAX_CONTENT_LENGTH
+        raise
     except Exception as e:
-        print(f"Error in PAN resize hard: {e}")
-        return f"Error: {str(e)}", 500
+        log.exception("Error in bulk Aadhar validation")
+        return jsonify({'error': str(e), 'message': 'Error processing bulk Aadhar validation'}), 400
 
-@app.route("/aadharResizeHard", methods=["POST", "GET"])
-def aadhar_resize_hard():
+@app.route("/bulk/panVerification", methods=['POST'])
+def bulk_pan():
     try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                height = int(request.form.get('height', 0))
-                width = int(request.form.get('width', 0))
-                result_bytes = aadharResize.resize_aadhar_hard(file_bytes, height=height, width=width)
-                if result_bytes:
-                    return send_file(BytesIO(result_bytes), mimetype='image/jpeg', as_attachment=True, download_name='resized.jpeg')
-                else:
-                    return "Inappropriate size", 400
+        return _bulk_response(bulkValidation.validate_pan_stream)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in Aadhar resize hard: {e}")
-        return f"Error: {str(e)}", 500
+        log.exception("Error in bulk PAN validation")
+        return jsonify({'error': str(e), 'message': 'Error processing bulk PAN validation'}), 400
+
+@app.route("/panResizeMAR", methods=["POST", "GET"])
+def panresizeMAR():
+    return _send(apiHandlers.pan_resize_mar(request))
+
+@app.route("/panResizeHard", methods=["POST", "GET"])
+def panresizehard():
+    return _send(apiHandlers.pan_resize_hard(request))
+
+@app.route("/aadharResizeHard", methods=["POST", "GET"])
+def aadhar_resize_hard():
+    return _send(apiHandlers.aadhar_resize_hard(request))
 
 @app.route("/aadharResizeMAR", methods=["POST", "GET"])
 def aadhar_resize_mar():
-    try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                height = int(request.form.get('height', 0))
-                width = int(request.form.get('width', 0))
-                result_bytes = aadharResize.resize_aadhar_mar(file_bytes, height=height, width=width)
-                if result_bytes:
-                    return send_file(BytesIO(result_bytes), mimetype='image/jpeg', as_attachment=True, download_name='resized.jpeg')
-                else:
-                    return "Inappropriate size", 400
-    except Exception as e:
-        print(f"Error in Aadhar resize MAR: {e}")
-        return f"Error: {str(e)}", 500
+    return _send(apiHandlers.aadhar_resize_mar(request))
 
 @app.route("/reduceSize", methods=["POST", "GET"])
 def reduce():
-    try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                result_bytes = reduceSize.reduce_storage(file_bytes)
-                if result_bytes:
-                    return send_file(BytesIO(result_bytes), mimetype='image/jpeg', as_attachment=True, download_name='reduced.jpeg')
-                else:
-                    return "Error reducing size", 500
-    except Exception as e:
-        print(f"Error in reduce size: {e}")
-        return f"Error: {str(e)}", 500
+    return _send(apiHandlers.reduce(request))
 
 # General image resize endpoints (for any image)
 @app.route("/resizeMAR", methods=["POST", "GET"])
 def resize_mar():
     """General image resize maintaining aspect ratio"""
-    try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                height = int(request.form.get('height', 0))
-                width = int(request.form.get('width', 0))
-                
-                # Use Pillow to resize
-                from PIL import Image
-                img = Image.open(BytesIO(file_bytes))
-                
-                # Calculate height maintaining aspect ratio
-                aspect_ratio = img.height / img.width
-                new_height = int(width * aspect_ratio)
-                
-                resized = img.resize((width, new_height), Image.Resampling.LANCZOS)
-                
-                output = BytesIO()
-                resized.save(output, format='JPEG', quality=95)
-                result_bytes = output.getvalue()
-                
-                return send_file(BytesIO(result_bytes), mimetype='image/jpeg', as_attachment=True, download_name='resized.jpeg')
-    except Exception as e:
-        print(f"Error in general resize MAR: {e}")
-        return f"Error: {str(e)}", 500
+    return _send(apiHandlers.resize_mar(request))
 
 @app.route("/resizeHard", methods=["POST", "GET"])
 def resize_hard():
     """General image hard resize to exact dimensions"""
+    return _send(apiHandlers.resize_hard(request))
+
+@app.route("/pipeline", methods=["POST"])
+def pipeline():
+    """Runs several image operations (resize, fit, reduce, format) on one upload"""
+    return _send(apiHandlers.pipeline(request))
+
+# Asynchronous jobs: submit returns immediately, clients poll for the result
+@app.route("/jobs", methods=["POST"])
+def submit_job():
     try:
-        if request.files and 'file' in request.files:   
-            if request.files['file'].filename != "":
-                file_bytes = request.files['file'].read()
-                height = int(request.form.get('height', 0))
-                width = int(request.form.get('width', 0))
-                
-                # Use Pillow to resize
-                from PIL import Image
-                img = Image.open(BytesIO(file_bytes))
-                
-                resized = img.resize((width, height), Image.Resampling.LANCZOS)
-                
-                output = BytesIO()
-                resized.save(output, format='JPEG', quality=95)
-                result_bytes = output.getvalue()
-                
-                return send_file(BytesIO(result_bytes), mimetype='image/jpeg', as_attachment=True, download_name='resized.jpeg')
+        job_type = request.form.get('type', '')
+        if job_type not in jobQueue.JOB_TYPES:
+            return jsonify({'error': f"Unknown job type '{job_type}'", 'types': sorted(jobQueue.JOB_TYPES)}), 400
+        if not (request.files and 'file' in request.files) or request.files['file'].filename == "":
+            return jsonify({'error': 'No file uploaded'}), 400
+
+        file_bytes = request.files['file'].read()
+        params = {
+            'height': int(request.form.get('height', 0)),
+            'width': int(request.form.get('width', 0)),
+            'target_bytes': int(request.form.get('target_bytes', 0)) or None,
+            'target_ratio': float(request.form.get('target_ratio', 0)) or None,
+        }
+        job_id = jobQueue.submit(job_type, file_bytes, params)
+        return jsonify({'job_id': job_id, 'status': jobQueue.QUEUED}), 202, {'Location': f"/jobs/{job_id}"}
+    except jobQueue.QueueFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except HTTPException:
+        # 413 past MAX_CONTENT_LENGTH
+        raise
     except Exception as e:
-        print(f"Error in general resize hard: {e}")
-        return f"Error: {str(e)}", 500
+        log.exception("Error submitting job")
+        return jsonify({'error': str(e)}), 400
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobQueue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.pop('has_image'):
+        job['result_url'] = f"/jobs/{job_id}/result"
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    result = jobQueue.get_image(job_id)
+    if result is None:
+        return jsonify({'error': 'No image result for this job'}), 404
+    result_bytes, mimetype = result
+    return send_file(BytesIO(result_bytes), mimetype=mimetype, as_attachment=True,
+                     download_name=f"result.{mimetype.split('/')[-1]}")
 
 # Health check endpoint for Vercel
 @app.route("/health")
 def health():
-    return {"status": "healthy"}, 200
+    return _send(apiHandlers.health(request))
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return _send(apiHandlers.metrics_page(request))
+
+# Routes whose upload and response sizes are recorded
+IMAGE_ROUTES = (
+    '/aadharResizeMAR', '/aadharResizeHard', '/panResizeMAR', '/panResizeHard',
+    '/resizeMAR', '/resizeHard', '/reduceSize', '/pipeline',
+)
+
+metrics.instrument_app(app, image_routes=IMAGE_ROUTES)
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5001, debug=True)
@@ -0,0 +1,290 @@
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import python_multipart
+from python_multipart.exceptions import FormParserError
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import CombinedMultiDict, FileStorage, Headers, MultiDict
+from werkzeug.http import parse_options_header
+
+# Importing the Flask app puts BackEnd on sys.path and configures logging
+from app import app as flask_app, SpooledRequest, IMAGE_ROUTES
+
+import apiHandlers
+import imageOps
+import imagePool
+import metrics
+import stageTimer
+import structuredLog
+
+# ASGI serving mode: uvicorn asgi:app
+#
+# The verification routes await the OCR backend instead of holding a thread
+# for the whole Vision round trip, so one process keeps hundreds of them in
+# flight. Decoding, resizing and OCR pre-processing still hold the GIL and
+# run on the loop's default executor (ASGI_EXECUTOR_THREADS threads), or in
+# the image pool when IMAGE_POOL_WORKERS > 0. The verification, resize,
+# reduce and pipeline routes run the same apiHandlers as app.py, on a body
+# parsed by python-multipart; every other route (pages, static files, jobs,
+# batch and bulk) is passed to the Flask app through a2wsgi.
+
+EXECUTOR_THREADS = int(os.getenv('ASGI_EXECUTOR_THREADS', str(min(32, (os.cpu_count() or 1) + 4))))
+MAX_CONTENT_LENGTH = flask_app.config['MAX_CONTENT_LENGTH']
+SPOOL_BYTES = SpooledRequest.spool_bytes
+
+log = structuredLog.get_logger('asgi')
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class Request:
+    """Path, headers, query and form fields and uploads of one HTTP request, as Flask's request exposes them"""
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.mimetype, self.mimetype_options = parse_options_header(self.headers.get('Content-Type', ''))
+        self.form = MultiDict()
+        self.files = MultiDict()
+
+    @property
+    def values(self):
+        # Query string first, then form fields, as Flask's request.values
+        return CombinedMultiDict([self.args, self.form])
+
+    async def load(self, receive):
+        """
+        Reads the body into form and files, uploads spooled to disk past UPLOAD_SPOOL_BYTES
+        Raises: RequestTooLarge past MAX_CONTENT_LENGTH, ClientDisconnected
+        """
+        length = self.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > MAX_CONTENT_LENGTH:
+            raise RequestTooLarge()
+        if self.mimetype == 'application/x-www-form-urlencoded':
+            body = b''.join([chunk async for chunk in _body(receive)])
+            self.form = MultiDict(parse_qsl(body.decode('utf-8', 'replace'), keep_blank_values=True))
+            return
+        parser = self._multipart_parser()
+        async for chunk in _body(receive):
+            if parser is not None:
+                try:
+                    parser.write(chunk)
+                except FormParserError as e:
+                    # Keep what was parsed, as werkzeug does with a broken form
+                    log.warning("Could not parse request body", extra={'error': str(e)})
+                    parser = None
+        if parser is not None:
+            try:
+                parser.finalize()
+            except FormParserError as e:
+                log.warning("Could not parse request body", extra={'error': str(e)})
+
+    def _multipart_parser(self):
+        """
+        Returns: a python-multipart parser filling form and files, or None for other bodies
+        """
+        boundary = self.mimetype_options.get('boundary')
+        if self.mimetype != 'multipart/form-data' or not boundary:
+            return None
+
+        def on_field(field):
+            self.form.add(_decode(field.field_name), _decode(field.value))
+
+        def on_file(file):
+            stream = file.file_object
+            stream.seek(0)
+            self.files.add(_decode(file.field_name), FileStorage(stream, _decode(file.file_name), _decode(file.field_name)))
+
+        return python_multipart.FormParser(
+            self.mimetype, on_field, on_file, boundary=boundary, config={'MAX_MEMORY_FILE_SIZE': SPOOL_BYTES})
+
+
+def _decode(value):
+    return (value or b'').decode('utf-8', 'replace')
+
+
+async def _body(receive):
+    """
+    Yields the request body chunk by chunk, at most MAX_CONTENT_LENGTH bytes
+    """
+    total = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        total += len(chunk)
+        if total > MAX_CONTENT_LENGTH:
+            raise RequestTooLarge()
+        if chunk:
+            yield chunk
+        if not message.get('more_body', False):
+            return
+
+
+class Response:
+    def __init__(self, body, status=200, content_type=apiHandlers.TEXT, headers=None):
+        self.body = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.status = status
+        # No Content-Type for a 304, as Flask
+        self.headers = {'Content-Type': content_type, 'Content-Length': str(len(self.body))} if content_type else {}
+        self.headers.update(headers or {})
+
+    @property
+    def content_length(self):
+        return len(self.body)
+
+    async def send(self, send):
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in self.headers.items()]
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': self.body})
+
+
+def _response(reply):
+    """An apiHandlers.Reply as a Response"""
+    headers = {}
+    if reply.download_name is not None:
+        # Same headers as Flask's send_file(..., as_attachment=True)
+        headers = {'Content-Disposition': f"attachment; filename={reply.download_name}", 'Cache-Control': 'no-cache'}
+    headers.update(reply.headers or {})
+    return Response(reply.body, reply.status, reply.content_type, headers)
+
+
+def _blocking(handler):
+    """
+    Returns: a coroutine function running a blocking apiHandlers handler on an executor thread
+    """
+    async def run(request):
+        return await asyncio.to_thread(handler, request)
+
+    return run
+
+
+# path -> (handler, methods); other paths and methods go to the Flask app
+ROUTES = {
+    '/aadharVerification': (apiHandlers.aadhar_async, ('GET', 'POST')),
+    '/panVerification': (apiHandlers.pan_async, ('GET', 'POST')),
+    '/panResizeMAR': (_blocking(apiHandlers.pan_resize_mar), ('GET', 'POST')),
+    '/panResizeHard': (_blocking(apiHandlers.pan_resize_hard), ('GET', 'POST')),
+    '/aadharResizeHard': (_blocking(apiHandlers.aadhar_resize_hard), ('GET', 'POST')),
+    '/aadharResizeMAR': (_blocking(apiHandlers.aadhar_resize_mar), ('GET', 'POST')),
+    '/resizeMAR': (_blocking(apiHandlers.resize_mar), ('GET', 'POST')),
+    '/resizeHard': (_blocking(apiHandlers.resize_hard), ('GET', 'POST')),
+    '/reduceSize': (_blocking(apiHandlers.reduce), ('GET', 'POST')),
+    '/pipeline': (_blocking(apiHandlers.pipeline), ('POST',)),
+    '/health': (_blocking(apiHandlers.health), ('GET', 'HEAD')),
+    '/metrics': (_blocking(apiHandlers.metrics_page), ('GET', 'HEAD')),
+}
+
+# Not counted in the request metrics, as in app.py
+UNINSTRUMENTED = ('/metrics',)
+
+
+async def _handle(request, handler, receive):
+    try:
+        if request.mimetype == 'multipart/form-data':
+            with stageTimer.stage('parse'):
+                await request.load(receive)
+        else:
+            await request.load(receive)
+    except RequestTooLarge:
+        return Response("Request Entity Too Large", 413)
+    return _response(await handler(request))
+
+
+async def _instrumented(request, handler, receive):
+    # Same series as metrics.instrument_view on the Flask views
+    route = request.path
+    metrics.IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await _handle(request, handler, receive)
+        status = response.status
+        if route in IMAGE_ROUTES:
+            upload = request.files.get('file')
+            if upload is not None:
+                metrics.IMAGE_BYTES.labels(route, 'in').observe(imageOps.source_size(upload.stream))
+            if status == 200:
+                metrics.IMAGE_BYTES.labels(route, 'out').observe(response.content_length)
+        return response
+    finally:
+        metrics.REQUEST_LATENCY.labels(route).observe(time.perf_counter() - start)
+        metrics.REQUESTS.labels(route, request.method, str(status)).inc()
+        metrics.IN_FLIGHT.dec()
+
+
+async def _serve(scope, receive, send, handler):
+    request = Request(scope)
+    timings = stageTimer.begin()
+    imagePool.bind_route(request.path)
+    try:
+        if request.path in UNINSTRUMENTED:
+            response = await _handle(request, handler, receive)
+        else:
+            response = await _instrumented(request, handler, receive)
+    except ClientDisconnected:
+        stageTimer.end(timings, request.path)
+        return
+    finally:
+        for _, upload in request.files.items(multi=True):
+            upload.close()
+    if stageTimer.SERVER_TIMING:
+        response.headers['Server-Timing'] = stageTimer.server_timing(timings)
+    stageTimer.end(timings, request.path)
+    if request.method == 'HEAD':
+        response.body = b''
+    await response.send(send)
+
+
+def _flask(environ, start_response):
+    # a2wsgi's input ends with the request body, chunked or not, as gunicorn's
+    # does, so Flask reads bodies without Content-Length up to its own limits
+    environ['wsgi.input_terminated'] = True
+    return flask_app(environ, start_response)
+
+
+_serve_wsgi = WSGIMiddleware(_flask, workers=EXECUTOR_THREADS)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            executor = ThreadPoolExecutor(EXECUTOR_THREADS, thread_name_prefix='asgi')
+            asyncio.get_running_loop().set_default_executor(executor)
+            log.info("ASGI app started", extra={'executor_threads': EXECUTOR_THREADS})
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            imagePool.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    route = ROUTES.get(scope['path'])
+    if route is None or scope['method'] not in route[1]:
+        await _serve_wsgi(scope, receive, send)
+    else:
+        await _serve(scope, receive, send, route[0])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', host="0.0.0.0", port=5001)
@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import statistics
+from io import BytesIO
+
+# Make the BackEnd modules importable the same way app.py does
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'BackEnd'))
+
+from PIL import Image, ImageDraw
+
+
+def synthetic_image(width, height, mode='RGB', fmt='JPEG', quality=92, seed=0):
+    """
+    Builds a photo-like test image (gradient, sensor noise and some text-like strokes)
+    Returns: encoded image bytes
+    """
+    noise = Image.effect_noise((width, height), 24 + seed % 8)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    base = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+
+    draw = ImageDraw.Draw(base)
+    line_height = max(height // 24, 4)
+    for row in range(4, 20, 2):
+        y = row * line_height
+        draw.rectangle((width // 12, y, width * (6 + row % 5) // 12, y + line_height // 2), fill=(20, 20, 20))
+
+    if mode == 'RGBA':
+        img = base.convert('RGBA')
+        img.putalpha(gradient)
+    elif mode == 'P':
+        img = base.quantize(colors=64)
+    elif mode == 'L':
+        img = base.convert('L')
+    else:
+        img = base
+
+    output = BytesIO()
+    if fmt == 'JPEG':
+        img.convert('L' if mode == 'L' else 'RGB').save(output, format='JPEG', quality=quality)
+    else:
+        img.save(output, format=fmt)
+    return output.getvalue()
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in MB
+    VmHWM is preferred: unlike ru_maxrss it is not inherited from the
+    process that forked us.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def reset_peak_rss():
+    """
+    Lowers the recorded peak RSS of this process to its current RSS (Linux),
+    so a later peak_rss_mb() covers only what runs after this call
+    Returns: True when the peak could be reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure(function, repeat=5, warmup=1):
+    """
+    Runs function repeatedly
+    Returns: dict of latency statistics in milliseconds and calls/second
+    """
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return latency_summary(timings)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(timings_ms):
+    total = sum(timings_ms)
+    return {
+        'runs': len(timings_ms),
+        'mean_ms': statistics.fmean(timings_ms) if timings_ms else 0.0,
+        'p50_ms': percentile(timings_ms, 0.50),
+        'p95_ms': percentile(timings_ms, 0.95),
+        'p99_ms': percentile(timings_ms, 0.99),
+        'ops_per_sec': len(timings_ms) / (total / 1000) if total else 0.0,
+    }
@@ -0,0 +1,111 @@
+"""
+Local stand-in for the Vision REST API (POST /v1/images:annotate) with
+configurable latency and error rates, for load tests of the real app.
+
+    python benchmarks/fake_vision.py --port 9100 --latency-ms 300 --dist lognormal --error-rate 0.01
+
+Point the app at it with OCR_BACKEND=vision_rest, VISION_ENDPOINT=http://127.0.0.1:9100
+and any VISION_API_KEY. Card text, latency and per-image API errors come
+from the fake OCR backend, so recorded fixtures (--fixtures) are served by
+image hash and any other image gets synthetic card text. --http-error-rate
+answers whole requests with 503, as Vision does when it sheds load.
+"""
+import json
+import base64
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import common  # noqa: F401  (puts BackEnd on sys.path)
+
+import ocrBackend
+
+
+class VisionServer(ThreadingHTTPServer):
+    # The default backlog of 5 resets connections when an async app opens hundreds at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class VisionHandler(BaseHTTPRequestHandler):
+    backend = None
+    http_error_rate = 0.0
+    _random = random.Random()
+    _lock = threading.Lock()
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._send(200, {'status': 'ok'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/v1/images:annotate'):
+            self._send(404, {'error': {'code': 404, 'message': f"Unknown path {self.path}", 'status': 'NOT_FOUND'}})
+            return
+        try:
+            images = [base64.b64decode(item['image']['content']) for item in json.loads(body)['requests']]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {'error': {'code': 400, 'message': f"Invalid request: {e}", 'status': 'INVALID_ARGUMENT'}})
+            return
+
+        with self._lock:
+            unavailable = self._random.random() < self.http_error_rate
+        if unavailable:
+            self._send(503, {'error': {'code': 503, 'message': 'The service is currently unavailable.', 'status': 'UNAVAILABLE'}})
+            return
+
+        responses = []
+        for response in self.backend.batch_text_detection(images):
+            if response.error.message:
+                responses.append({'error': {'code': 13, 'message': response.error.message}})
+            elif response.text_annotations:
+                text = response.text_annotations[0].description
+                words = [{'description': word} for word in text.split()]
+                responses.append({'textAnnotations': [{'locale': 'en', 'description': text}] + words})
+            else:
+                responses.append({})
+        self._send(200, {'responses': responses})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--dist', default='fixed', choices=('fixed', 'uniform', 'normal', 'lognormal'))
+    parser.add_argument('--spread', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of images answered with an API error')
+    parser.add_argument('--http-error-rate', type=float, default=0.0, help='fraction of requests answered with HTTP 503')
+    parser.add_argument('--document', default='both', choices=('aadhar', 'pan', 'both'))
+    parser.add_argument('--fixtures', default='', help='directory of recorded responses keyed by image hash')
+    args = parser.parse_args()
+
+    VisionHandler.backend = ocrBackend.FakeBackend(
+        fixtures_dir=args.fixtures, document=args.document, latency_ms=args.latency_ms,
+        distribution=args.dist, spread=args.spread, error_rate=args.error_rate
+    )
+    VisionHandler.http_error_rate = args.http_error_rate
+    server = VisionServer((args.host, args.port), VisionHandler)
+    print(f"Fake Vision listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
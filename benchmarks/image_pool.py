@@ -0,0 +1,108 @@
+"""
+Throughput of concurrent resizes run on request threads against the image
+process pool, and how much each slows down light I/O-bound requests
+running alongside them.
+
+    python benchmarks/image_pool.py [--workers 1 2 4] [--tasks 24] [--width 2000 --height 1500]
+
+For each worker count N, N threads resize images back to back, either
+inline (sharing the GIL) or through an N-process pool. Meanwhile a probe
+thread sleeps 10ms, as a request waiting on OCR would, and then extracts
+text; its overshoot shows how long it waited for the GIL. Each case runs
+in a fresh interpreter.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from common import synthetic_image, latency_summary, percentile
+
+PROBE_SLEEP = 0.010
+
+
+def child(mode, workers, tasks, width, height):
+    os.environ['IMAGE_POOL_WORKERS'] = str(workers if mode == 'pool' else 0)
+    os.environ['IMAGE_POOL_QUEUE'] = str(workers)
+    import imageOps
+    import imagePool
+    import ocrBackend
+    import textExtraction
+
+    images = [synthetic_image(width, height, seed=seed) for seed in range(4)]
+    text = ocrBackend.synthetic_text(0, 'both')
+
+    def resize(i):
+        imagePool.bind_route('/resizeMAR')
+        start = time.perf_counter()
+        imageOps.resize_to_jpeg(images[i % len(images)], 600, 0, keep_aspect=True)
+        return (time.perf_counter() - start) * 1000
+
+    # Start the pool processes outside the measurement
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(resize, range(workers)))
+
+    done = threading.Event()
+    overshoots = []
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            time.sleep(PROBE_SLEEP)
+            textExtraction.extract(text)
+            overshoots.append((time.perf_counter() - start - PROBE_SLEEP) * 1000)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        timings = list(pool.map(resize, range(tasks)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    prober.join()
+    imagePool.shutdown()
+
+    result = latency_summary(timings)
+    result.update({
+        'mode': mode,
+        'workers': workers,
+        'tasks': tasks,
+        'images_per_sec': tasks / elapsed,
+        'probe_overshoot_p50_ms': percentile(overshoots, 0.50),
+        'probe_overshoot_p99_ms': percentile(overshoots, 0.99),
+    })
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    default_workers = sorted({1, 2, 4, os.cpu_count() or 1})
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers)
+    parser.add_argument('--tasks', type=int, default=24)
+    parser.add_argument('--width', type=int, default=2000)
+    parser.add_argument('--height', type=int, default=1500)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'WORKERS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), args.tasks, args.width, args.height)
+        return
+
+    cases = []
+    for workers in args.workers:
+        for mode in ('threads', 'pool'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', mode, str(workers), '--tasks', str(max(args.tasks, workers)),
+                 '--width', str(args.width), '--height', str(args.height)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            cases.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps({'cpu_count': os.cpu_count(), 'source': f"{args.width}x{args.height} JPEG", 'cases': cases}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
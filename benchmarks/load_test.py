@@ -0,0 +1,328 @@
+"""
+End-to-end load test: the real app under gunicorn (or uvicorn), OCR calls
+answered by a local fake Vision server, mixed traffic across the
+verification, resize and reduce routes.
+
+    python benchmarks/load_test.py --workers 4 --threads 4 --concurrency 32 --duration 60 \\
+        --ocr-latency-ms 400 --ocr-dist lognormal --ocr-error-rate 0.01
+    python benchmarks/load_test.py --server uvicorn --workers 1 --concurrency 256
+
+--server uvicorn serves asgi:app instead of the Flask app; --threads then
+sets ASGI_EXECUTOR_THREADS.
+
+Without --rate, --concurrency clients send back to back (closed loop) and
+the report shows the throughput the deployment sustains. With --rate the
+requests are sent on a fixed schedule (open loop) and latency is measured
+from the scheduled send time, so a server that falls behind shows it in the
+percentiles instead of silently lowering the offered load. Requests sent
+during --warmup are not counted. The report gives RPS, p50/p95/p99 latency
+and error rate per route and overall.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import ROOT, synthetic_image, percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# route -> form fields; every route also gets an uploaded image
+ROUTES = {
+    '/aadharVerification': {},
+    '/panVerification': {},
+    '/aadharResizeMAR': {'width': '600', 'height': '0'},
+    '/aadharResizeHard': {'width': '600', 'height': '400'},
+    '/panResizeMAR': {'width': '600', 'height': '0'},
+    '/panResizeHard': {'width': '600', 'height': '400'},
+    '/resizeMAR': {'width': '1200', 'height': '0'},
+    '/resizeHard': {'width': '1200', 'height': '900'},
+    '/reduceSize': {},
+}
+# Verification dominates campaign traffic
+DEFAULT_MIX = (
+    'aadharVerification=4,panVerification=4,aadharResizeMAR=1,aadharResizeHard=1,'
+    'panResizeMAR=1,panResizeHard=1,resizeMAR=1,resizeHard=1,reduceSize=2'
+)
+# Verification answers that mean OCR failed even though the status is 200
+OCR_FAILURE_PREFIXES = ('API_ERROR', 'EXCEPTION', 'Please set up')
+
+
+def parse_mix(mix):
+    """
+    Returns: {route: weight} from 'route=weight,...' (the leading / is optional)
+    """
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition('=')
+        route = '/' + name.strip().lstrip('/')
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route '{route}', expected one of {sorted(ROUTES)}")
+        weights[route] = float(weight or 1)
+    return {route: weight for route, weight in weights.items() if weight > 0}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not start")
+
+
+def start_fake_vision(args, port):
+    command = [
+        sys.executable, os.path.join(HERE, 'fake_vision.py'), '--port', str(port),
+        '--latency-ms', str(args.ocr_latency_ms), '--dist', args.ocr_dist, '--spread', str(args.ocr_spread),
+        '--error-rate', str(args.ocr_error_rate), '--http-error-rate', str(args.ocr_http_error_rate),
+    ]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_server(args, port, vision_port, log_file):
+    env = dict(
+        os.environ,
+        OCR_BACKEND='vision_rest',
+        VISION_ENDPOINT=f"http://127.0.0.1:{vision_port}",
+        VISION_API_KEY='load-test',
+        LOG_LEVEL=args.log_level,
+    )
+    if not args.ocr_cache:
+        env.update(OCR_CACHE_SIZE='0', OCR_CACHE_DIR='')
+    if not args.result_cache:
+        env['RESULT_CACHE_BYTES'] = '0'
+    if not args.singleflight:
+        env['SINGLEFLIGHT'] = '0'
+    if args.server == 'uvicorn':
+        env['ASGI_EXECUTOR_THREADS'] = str(args.threads)
+        command = [
+            sys.executable, '-m', 'uvicorn', 'asgi:app',
+            '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(args.workers),
+            '--log-level', 'warning',
+        ]
+        return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--bind', f"127.0.0.1:{port}",
+        '--workers', str(args.workers),
+        '--threads', str(args.threads),
+        '--worker-class', 'gthread' if args.threads > 1 else 'sync',
+        '--timeout', str(args.timeout),
+    ]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+class Recorder:
+    """Collects (route, latency_ms, status, ocr_failed) of counted requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, sample):
+        with self._lock:
+            self.samples.append(sample)
+
+
+def _send(session, url, route, image_bytes, timeout):
+    """
+    Returns: (status, ocr_failed); status is 0 when the request did not complete
+    """
+    try:
+        response = session.post(
+            url + route, data=ROUTES[route], files={'file': ('card.jpg', image_bytes, 'image/jpeg')}, timeout=timeout
+        )
+    except requests.RequestException:
+        return 0, False
+    ocr_failed = False
+    if route in ('/aadharVerification', '/panVerification') and response.status_code == 200:
+        ocr_failed = str(response.json().get('number', '')).startswith(OCR_FAILURE_PREFIXES)
+    return response.status_code, ocr_failed
+
+
+def drive(url, weights, images, args, recorder):
+    """
+    Sends traffic until warmup + duration have passed
+    Returns: (counted window start, counted window end) in perf_counter seconds
+    """
+    routes = list(weights)
+    route_weights = [weights[route] for route in routes]
+    started = time.perf_counter()
+    window_start = started + args.warmup
+    window_end = window_start + args.duration
+    local = threading.local()
+
+    def request(seed, scheduled=None):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        rng = random.Random(seed)
+        route = rng.choices(routes, route_weights)[0]
+        image_bytes = images[rng.randrange(len(images))]
+        sent = scheduled if scheduled is not None else time.perf_counter()
+        status, ocr_failed = _send(session, url, route, image_bytes, args.timeout)
+        if window_start <= sent < window_end:
+            recorder.add((route, (time.perf_counter() - sent) * 1000, status, ocr_failed))
+
+    if args.rate:
+        # Open loop: fixed schedule, at most --concurrency requests in flight
+        interval = 1.0 / args.rate
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            i = 0
+            while True:
+                scheduled = started + i * interval
+                if scheduled >= window_end:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(request, f"{args.seed}:{i}", scheduled)
+                i += 1
+    else:
+        def client(index):
+            i = 0
+            while time.perf_counter() < window_end:
+                request(f"{args.seed}:{index}:{i}")
+                i += 1
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(client, range(args.concurrency)))
+    return window_start, window_end
+
+
+def summarize(samples, seconds):
+    latencies = [latency for _, latency, _, _ in samples]
+    errors = sum(1 for _, _, status, _ in samples if not 200 <= status < 400)
+    ocr_failures = sum(1 for _, _, _, failed in samples if failed)
+    statuses = {}
+    for _, _, status, _ in samples:
+        key = str(status) if status else 'connection_error'
+        statuses[key] = statuses.get(key, 0) + 1
+    count = len(samples)
+    return {
+        'requests': count,
+        'rps': round(count / seconds, 2) if seconds else 0.0,
+        'mean_ms': round(sum(latencies) / count, 2) if count else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'ocr_failure_rate': round(ocr_failures / count, 4) if count else 0.0,
+        'status_counts': statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', default='gunicorn', choices=('gunicorn', 'uvicorn'), help='app:app or asgi:app')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='threads per worker (gthread worker when > 1), or executor threads under uvicorn')
+    parser.add_argument('--concurrency', type=int, default=16, help='clients (closed loop) or max in flight (open loop)')
+    parser.add_argument('--rate', type=float, default=0.0, help='requests/sec to offer on a fixed schedule (open loop)')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of counted traffic')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds of uncounted traffic first')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="route weights, e.g. 'aadharVerification=4,reduceSize=1'")
+    parser.add_argument('--image-size', default='2000x1500', help='size of the uploaded synthetic JPEGs')
+    parser.add_argument('--images', type=int, default=16, help='distinct images to upload')
+    parser.add_argument('--ocr-latency-ms', type=float, default=300.0)
+    parser.add_argument('--ocr-dist', default='lognormal', choices=('fixed', 'uniform', 'normal', 'lognormal'))
+    parser.add_argument('--ocr-spread', type=float, default=0.5)
+    parser.add_argument('--ocr-error-rate', type=float, default=0.0, help='fraction of images the fake Vision fails')
+    parser.add_argument('--ocr-http-error-rate', type=float, default=0.0, help='fraction of Vision calls answered 503')
+    parser.add_argument('--ocr-cache', action='store_true', help='keep the OCR cache on (off by default)')
+    parser.add_argument('--result-cache', action='store_true', help='keep the resize/reduce output cache on (off by default)')
+    parser.add_argument('--singleflight', action='store_true', help='keep coalescing of identical verifications on (off by default)')
+    parser.add_argument('--timeout', type=int, default=60, help='gunicorn worker and client request timeout')
+    parser.add_argument('--log-level', default='WARNING', help='LOG_LEVEL of the app under test')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here as well')
+    args = parser.parse_args()
+
+    try:
+        __import__(args.server)
+    except ImportError:
+        sys.exit(f"{args.server} is not installed (pip install -r requirements.txt)")
+
+    weights = parse_mix(args.mix)
+    width, height = (int(value) for value in args.image_size.split('x'))
+    images = [synthetic_image(width, height, seed=seed) for seed in range(args.images)]
+
+    vision_port, app_port = _free_port(), _free_port()
+    app_url = f"http://127.0.0.1:{app_port}"
+    vision = start_fake_vision(args, vision_port)
+    server_log = tempfile.TemporaryFile(mode='w+')
+    server = None
+    try:
+        _wait_ready(f"http://127.0.0.1:{vision_port}/", vision)
+        server = start_server(args, app_port, vision_port, server_log)
+        _wait_ready(app_url + '/health', server)
+
+        recorder = Recorder()
+        window_start, window_end = drive(app_url, weights, images, args, recorder)
+        seconds = window_end - window_start
+    except RuntimeError as e:
+        server_log.seek(0)
+        sys.exit(f"{e}\n{server_log.read()}")
+    finally:
+        for process in (server, vision):
+            if process is not None:
+                process.terminate()
+                process.wait()
+        server_log.close()
+
+    by_route = {}
+    for sample in recorder.samples:
+        by_route.setdefault(sample[0], []).append(sample)
+    report = {
+        'config': {
+            'server': args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'mode': f"open loop at {args.rate} rps" if args.rate else 'closed loop',
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'image_size': args.image_size,
+            'mix': weights,
+            'ocr': {
+                'latency_ms': args.ocr_latency_ms, 'dist': args.ocr_dist, 'spread': args.ocr_spread,
+                'error_rate': args.ocr_error_rate, 'http_error_rate': args.ocr_http_error_rate,
+                'cache': args.ocr_cache,
+            },
+            'result_cache': args.result_cache,
+            'singleflight': args.singleflight,
+            'cpu_count': os.cpu_count(),
+        },
+        'overall': summarize(recorder.samples, seconds),
+        'routes': {route: summarize(samples, seconds) for route, samples in sorted(by_route.items())},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
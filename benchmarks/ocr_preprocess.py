@@ -0,0 +1,121 @@
+"""
+Compares OCR payload size, end-to-end verification latency and extraction
+accuracy with OCR pre-processing disabled and enabled.
+
+    python benchmarks/ocr_preprocess.py --fixtures path/to/fixtures
+    OCR_BACKEND=fake python benchmarks/ocr_preprocess.py --uplink-mbps 20
+
+A fixture directory holds card images plus an expected.json mapping each
+file name to {"type": "aadhar" | "pan", "number": "..."}. Accuracy is only
+meaningful against a real backend; without fixtures, synthetic phone-photo
+sized images are used to measure payload size and latency.
+"""
+import os
+import json
+import time
+import argparse
+
+from common import synthetic_image, latency_summary
+
+import aadharVerification
+import panVerification
+import ocrBackend
+import ocrCache
+import ocrPreprocess
+import textDetection
+
+AUTH_TEXT = {
+    'aadhar': aadharVerification.aadhar_auth_text,
+    'pan': panVerification.pan_auth_text,
+}
+
+
+class RecordingBackend:
+    """Wraps a backend, counting the bytes it is sent and simulating the upload"""
+
+    def __init__(self, inner, uplink_mbps):
+        self.inner = inner
+        self.name = inner.name
+        self.uplink_mbps = uplink_mbps
+        self.bytes_sent = 0
+
+    def available(self):
+        return self.inner.available()
+
+    def text_detection(self, image_bytes):
+        self.bytes_sent += len(image_bytes)
+        if self.uplink_mbps:
+            time.sleep(len(image_bytes) * 8 / (self.uplink_mbps * 1_000_000))
+        return self.inner.text_detection(image_bytes)
+
+
+def load_fixtures(path):
+    with open(os.path.join(path, 'expected.json'), 'r', encoding='utf-8') as f:
+        expected = json.load(f)
+    fixtures = []
+    for name, spec in sorted(expected.items()):
+        with open(os.path.join(path, name), 'rb') as f:
+            fixtures.append((name, f.read(), spec['type'], spec.get('number')))
+    return fixtures
+
+
+def synthetic_fixtures():
+    sizes = [(4000, 3000), (3000, 4000), (2048, 1536), (1200, 800)]
+    return [
+        (f"synthetic_{w}x{h}.jpg", synthetic_image(w, h, seed=i), 'aadhar' if i % 2 == 0 else 'pan', None)
+        for i, (w, h) in enumerate(sizes)
+    ]
+
+
+def normalise(number):
+    return (number or '').replace(' ', '').upper()
+
+
+def run(fixtures, enabled, backend):
+    ocrPreprocess.ENABLED = enabled
+    ocrCache.clear()
+    backend.bytes_sent = 0
+    timings = []
+    correct = 0
+    checked = 0
+    for name, image_bytes, doc_type, expected in fixtures:
+        start = time.perf_counter()
+        full_text, error = textDetection.detect_text(image_bytes)
+        is_valid, number, _ = AUTH_TEXT[doc_type](full_text) if not error else (False, error, 0)
+        timings.append((time.perf_counter() - start) * 1000)
+        if expected is not None:
+            checked += 1
+            correct += int(bool(is_valid) and normalise(number) == normalise(expected))
+    result = latency_summary(timings)
+    result['bytes_in'] = sum(len(f[1]) for f in fixtures)
+    result['bytes_sent'] = backend.bytes_sent
+    result['accuracy'] = correct / checked if checked else None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fixtures', help='directory with images and expected.json')
+    parser.add_argument('--uplink-mbps', type=float, default=0, help='simulate upload bandwidth to the OCR backend')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures()
+    backend = RecordingBackend(ocrBackend.get_backend(), args.uplink_mbps)
+    ocrBackend.set_backend(backend)
+    # Every run must reach the backend
+    ocrCache.MAX_ENTRIES = 0
+
+    report = {
+        'backend': backend.name,
+        'images': len(fixtures),
+        'max_dimension': ocrPreprocess.MAX_DIMENSION,
+        'grayscale': ocrPreprocess.GRAYSCALE,
+        'jpeg_quality': ocrPreprocess.JPEG_QUALITY,
+        'before': run(fixtures, False, backend),
+        'after': run(fixtures, True, backend),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Output size and encode time of each output format preset against the
+baseline quality 95 JPEG, for a photo-like upload, a line-art scan and a
+card with transparency.
+
+    python benchmarks/output_formats.py [--width 1000] [--repeat 3]
+
+Every preset resizes the same upload to --width through the image
+pipeline, as the resize routes do with ?format=<name>.
+"""
+import json
+import argparse
+from io import BytesIO
+
+from common import synthetic_image, measure
+
+import imageOps
+import outputFormat
+from PIL import Image, ImageDraw
+
+
+def line_art(width, height):
+    """
+    Returns: PNG bytes of a black-on-white scanned form
+    """
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    line_height = max(height // 40, 6)
+    for row in range(2, 38):
+        y = row * line_height
+        # Words of text, with a ruled line under every fourth row
+        x = width // 16
+        while x < width * 14 // 16:
+            word = (7 + (row * x) % 11) * line_height // 4
+            draw.rectangle((x, y, x + word, y + line_height // 2), fill=0)
+            x += word + line_height // 2
+        if row % 4 == 0:
+            draw.line((width // 16, y + line_height - 2, width * 15 // 16, y + line_height - 2), fill=0, width=2)
+    output = BytesIO()
+    page.save(output, format='PNG')
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sources = {
+        'photo_jpeg': synthetic_image(2000, 1500),
+        'line_art_png': line_art(2480, 3508),
+        'card_rgba_png': synthetic_image(1600, 1000, mode='RGBA', fmt='PNG'),
+    }
+    report = {'outputs': outputFormat.available(), 'qualities': outputFormat.QUALITIES, 'cases': []}
+    for source, image_bytes in sources.items():
+        for name in outputFormat.available():
+            step = dict(outputFormat.operation(name), baseline=True)
+            operations = [{'op': 'resize', 'width': args.width}, step]
+            result = imageOps.run_pipeline_local(image_bytes, operations)
+            # Time the preset alone, without the baseline encode
+            timing = measure(lambda: imageOps.run_pipeline_local(image_bytes, operations[:1] + [outputFormat.operation(name)]),
+                             repeat=args.repeat)
+            report['cases'].append({
+                'source': source,
+                'output': name,
+                'bytes': result['size'],
+                'baseline_bytes': result['baseline_size'],
+                'saved_pct': round(100 * (1 - result['size'] / result['baseline_size']), 1),
+                'p50_ms': round(timing['p50_ms'], 1),
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
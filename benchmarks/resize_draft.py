@@ -0,0 +1,85 @@
+"""
+Measures decode+resize+encode time and peak memory for large JPEG resizes,
+comparing a full decode with LANCZOS against draft-mode (scaled IDCT)
+decoding with reducing_gap.
+
+    python benchmarks/resize_draft.py [--width 4000 --height 3000]
+
+Each case runs in a fresh interpreter so peak RSS is not shared.
+"""
+import os
+import sys
+import json
+import tempfile
+import argparse
+import subprocess
+from io import BytesIO
+
+from common import synthetic_image, measure, peak_rss_mb
+
+import imageOps
+from PIL import Image
+
+TARGET_WIDTHS = [200, 600, 1200]
+
+
+def full_decode(image_bytes, width):
+    img = Image.open(BytesIO(image_bytes))
+    target = imageOps.target_size(img.size, width, 0, keep_aspect=True)
+    resized = img.resize(target, Image.Resampling.LANCZOS)
+    return imageOps.encode_jpeg(resized)
+
+
+def draft_decode(image_bytes, width):
+    return imageOps.resize_to_jpeg(image_bytes, width, 0, keep_aspect=True)
+
+
+PATHS = {'full': full_decode, 'draft': draft_decode}
+
+
+def child(path, width, source_path, repeat):
+    with open(source_path, 'rb') as f:
+        image_bytes = f.read()
+    baseline_mb = peak_rss_mb()
+    function = PATHS[path]
+    result = measure(lambda: function(image_bytes, width), repeat=repeat)
+    result['peak_rss_delta_mb'] = peak_rss_mb() - baseline_mb
+    result['output_bytes'] = len(function(image_bytes, width))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', nargs=3, metavar=('PATH', 'TARGET_WIDTH', 'SOURCE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), args.child[2], args.repeat)
+        return
+
+    # Build the source once, outside the measured processes
+    fd, source_path = tempfile.mkstemp(suffix='.jpg')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(synthetic_image(args.width, args.height))
+
+    report = {'source': f"{args.width}x{args.height} JPEG", 'cases': []}
+    try:
+        for width in TARGET_WIDTHS:
+            for path in PATHS:
+                output = subprocess.run(
+                    [sys.executable, __file__, '--child', path, str(width), source_path, '--repeat', str(args.repeat)],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                case = json.loads(output)
+                case.update({'path': path, 'target_width': width})
+                report['cases'].append(case)
+    finally:
+        os.remove(source_path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Measures the server's peak RSS while N concurrent clients upload large
+images to the resize and reduce routes.
+
+    python benchmarks/response_memory.py [--concurrency 1 4 8] [--requests 16]
+
+Every (route, concurrency) case gets a fresh server process so peaks are
+not carried over between cases.
+"""
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import ROOT, synthetic_image
+
+ROUTES = {
+    '/resizeMAR': {'width': '2000'},
+    '/aadharResizeHard': {'width': '2000', 'height': '1500'},
+    '/reduceSize': {},
+}
+
+SERVER = """
+import sys
+sys.path.insert(0, {root!r})
+import app
+app.app.run(host='127.0.0.1', port={port}, threaded=True, debug=False, use_reloader=False)
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status", 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _wait_ready(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url + '/health', timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+
+def run_case(route, fields, image_bytes, concurrency, total):
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-c', SERVER.format(root=ROOT, port=port)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(url)
+        idle_mb = _peak_rss_mb(server.pid)
+
+        def call(_):
+            response = requests.post(url + route, data=fields, files={'file': ('scan.jpg', image_bytes, 'image/jpeg')})
+            return response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            statuses = list(pool.map(call, range(total)))
+        elapsed = time.perf_counter() - start
+        return {
+            'route': route,
+            'concurrency': concurrency,
+            'requests': total,
+            'errors': sum(1 for status in statuses if status != 200),
+            'idle_rss_mb': round(idle_mb, 1),
+            'peak_rss_mb': round(_peak_rss_mb(server.pid), 1),
+            'peak_over_idle_mb': round(_peak_rss_mb(server.pid) - idle_mb, 1),
+            'requests_per_sec': round(total / elapsed, 2),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests', type=int, default=16)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    args = parser.parse_args()
+
+    image_bytes = synthetic_image(args.width, args.height)
+    cases = [
+        run_case(route, fields, image_bytes, concurrency, max(args.requests, concurrency))
+        for route, fields in ROUTES.items()
+        for concurrency in args.concurrency
+    ]
+    print(json.dumps({'upload_bytes': len(image_bytes), 'cases': cases}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
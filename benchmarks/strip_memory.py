@@ -0,0 +1,104 @@
+"""
+Peak memory of the image pipeline on A4 scans at 150, 300 and 600 DPI,
+processing the decoded image whole against in strips (IMAGE_STRIP_PIXELS).
+
+    python benchmarks/strip_memory.py [--dpi 150 300 600] [--width 1000]
+
+Sources are a JPEG, an RGBA PNG and a palette PNG of the sheet. "resize"
+scales to --width as the resize routes do, "reduce" re-encodes at full
+size to half the upload as /reduceSize does. Each case runs in a fresh
+interpreter; decoded_mb is the raster Pillow decodes the upload into, and
+working_mb is the peak on top of it, which strips keep flat as the
+resolution grows.
+"""
+import os
+import sys
+import json
+import tempfile
+import argparse
+import subprocess
+
+from common import synthetic_image, peak_rss_mb, reset_peak_rss
+
+# A4 at 1 DPI, in inches
+A4 = (8.27, 11.69)
+
+SOURCES = {
+    'jpeg_rgb': ('RGB', 'JPEG'),
+    'png_rgba': ('RGBA', 'PNG'),
+    'png_p': ('P', 'PNG'),
+}
+
+BYTES_PER_PIXEL = {'1': 1 / 8, 'L': 1, 'P': 1, 'RGB': 4, 'RGBA': 4, 'CMYK': 4}
+
+
+def operations_for(operation, width):
+    if operation == 'resize':
+        return [{'op': 'resize', 'width': width}, {'op': 'format', 'format': 'JPEG'}]
+    return [{'op': 'reduce', 'target_ratio': 0.5, 'max_passes': 3}, {'op': 'format', 'format': 'JPEG'}]
+
+
+def child(mode, operation, width, source_path):
+    os.environ['IMAGE_STRIP_PIXELS'] = '0' if mode == 'full' else os.getenv('IMAGE_STRIP_PIXELS', str(8_000_000))
+    import imageOps
+    import stageTimer
+
+    with open(source_path, 'rb') as f:
+        image_bytes = f.read()
+    operations = operations_for(operation, width)
+    img, _ = imageOps.open_for_size(image_bytes, imageOps.parse_operations(operations))
+    decoded_mb = img.width * img.height * BYTES_PER_PIXEL.get(img.mode, 4) / (1024 * 1024)
+    del img
+
+    reset_peak_rss()
+    baseline_mb = peak_rss_mb()
+    with stageTimer.collect() as timings:
+        result = imageOps.run_pipeline_local(image_bytes, operations)
+    peak_mb = peak_rss_mb() - baseline_mb
+    print(json.dumps({
+        'mode': mode,
+        'decoded_mb': round(decoded_mb, 1),
+        'peak_rss_delta_mb': round(peak_mb, 1),
+        'working_mb': round(peak_mb - decoded_mb, 1),
+        'ms': round(sum(timings.stages.values()) * 1000, 1),
+        'output': f"{result['width']}x{result['height']}",
+        'output_bytes': result['size'],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dpi', type=int, nargs='+', default=[150, 300, 600])
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--child', nargs=4, metavar=('MODE', 'OPERATION', 'WIDTH', 'SOURCE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], int(args.child[2]), args.child[3])
+        return
+
+    report = {'strip_pixels': int(os.getenv('IMAGE_STRIP_PIXELS', str(8_000_000))), 'cases': []}
+    for dpi in args.dpi:
+        size = round(A4[0] * dpi), round(A4[1] * dpi)
+        for source, (image_mode, fmt) in SOURCES.items():
+            # Build each source once, outside the measured processes
+            fd, source_path = tempfile.mkstemp(suffix='.' + fmt.lower())
+            with os.fdopen(fd, 'wb') as f:
+                f.write(synthetic_image(*size, mode=image_mode, fmt=fmt))
+            try:
+                for operation in ('resize', 'reduce'):
+                    for mode in ('full', 'strips'):
+                        output = subprocess.run(
+                            [sys.executable, __file__, '--child', mode, operation, str(args.width), source_path],
+                            check=True, capture_output=True, text=True
+                        ).stdout
+                        case = json.loads(output.strip().splitlines()[-1])
+                        case.update({'dpi': dpi, 'size': f"{size[0]}x{size[1]}", 'source': source, 'operation': operation})
+                        report['cases'].append(case)
+            finally:
+                os.remove(source_path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""
+Benchmark suite for the resize, reduce and verify paths, with JSON results
+that can be compared against a stored baseline.
+
+    python benchmarks/suite.py run [--filter resize_aadhar] [--output results.json]
+    python benchmarks/suite.py compare benchmarks/baseline.json results.json
+
+Image cases run on synthetic images of several sizes in RGB (JPEG) and
+RGBA and P (PNG). Verify cases run on canned OCR responses from
+benchmarks/fixtures/ocr; the image paths get them through the fake OCR
+backend with the OCR cache disabled. Every case runs in a fresh interpreter
+so peak RSS is its own. compare exits with status 1 when a case got slower,
+lost throughput or used more memory than the thresholds allow.
+"""
+import os
+import sys
+import json
+import time
+import random
+import fnmatch
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import common
+from common import synthetic_image, peak_rss_mb, reset_peak_rss, latency_summary
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures', 'ocr')
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+SIZES = ((640, 480), (2000, 1500), (4000, 3000))
+MODES = ('RGB', 'RGBA', 'P')
+IMAGE_FUNCTIONS = ('resize_aadhar_mar', 'resize_aadhar_hard', 'resize_pan_mar', 'resize_pan_hard', 'reduce_storage')
+# Output size of the resize cases; _mar derives the height from the width
+RESIZE_WIDTH, RESIZE_HEIGHT = 600, 400
+
+NUMBER_BATCH = 10000
+TEXT_FIXTURES = {
+    'aadhar_auth_text': ('aadhar_clean', 'aadhar_noisy', 'no_number'),
+    'pan_auth_text': ('pan_clean', 'pan_noisy', 'no_number'),
+}
+IMG_FIXTURES = {'aadhar_auth_img': 'aadhar_noisy', 'pan_auth_img': 'pan_noisy'}
+
+# Run until both minimums are reached, or MAX_RUNS
+MIN_RUNS = 5
+MIN_SECONDS = 2.0
+MAX_RUNS = 1000
+
+# Memory growth below this is noise from the allocator, not a regression
+MEMORY_FLOOR_MB = 4.0
+
+
+def case_names():
+    names = []
+    for function in IMAGE_FUNCTIONS:
+        for width, height in SIZES:
+            for mode in MODES:
+                names.append(f"{function}/{width}x{height}/{mode}")
+    names.append(f"_verhoeff_validate/{NUMBER_BATCH}")
+    names.append(f"pan_auth_number/{NUMBER_BATCH}")
+    for function, fixtures in TEXT_FIXTURES.items():
+        names.extend(f"{function}/{fixture}" for fixture in fixtures)
+    names.append('text_extraction/all')
+    names.extend(f"{function}/{fixture}" for function, fixture in IMG_FIXTURES.items())
+    return names
+
+
+def _fixture_text(name):
+    with open(os.path.join(FIXTURES, name + '.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)['textAnnotations'][0]['description']
+
+
+def _aadhar_numbers(count, seed=0):
+    import ocrBackend
+    rng = random.Random(seed)
+    numbers = []
+    for i in range(count):
+        number = ocrBackend._verhoeff_complete(str(rng.randint(2, 9)) + ''.join(rng.choice('0123456789') for _ in range(10)))
+        if i % 2:
+            number = number[:11] + str((int(number[11]) + 1) % 10)
+        numbers.append(number)
+    return numbers
+
+
+def _pan_numbers(count, seed=0):
+    rng = random.Random(seed)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    numbers = []
+    for i in range(count):
+        # Every fourth PAN has a holder type that does not exist
+        holder = 'X' if i % 4 == 3 else rng.choice('PCHFATBLJG')
+        numbers.append(
+            ''.join(rng.choice(letters) for _ in range(3)) + holder + rng.choice(letters)
+            + ''.join(rng.choice('0123456789') for _ in range(4)) + rng.choice(letters)
+        )
+    return numbers
+
+
+def _image_case(function, size, mode):
+    import aadharResize
+    import panResize
+    import reduceSize
+    width, height = (int(value) for value in size.split('x'))
+    image_bytes = synthetic_image(width, height, mode=mode, fmt='JPEG' if mode == 'RGB' else 'PNG')
+    if function == 'reduce_storage':
+        return lambda: reduceSize.reduce_storage(image_bytes), 1
+    module = aadharResize if 'aadhar' in function else panResize
+    resize = getattr(module, function)
+    return lambda: resize(image_bytes, height=RESIZE_HEIGHT, width=RESIZE_WIDTH), 1
+
+
+def _number_case(function, count):
+    import aadharVerification
+    import panVerification
+    count = int(count)
+    if function == '_verhoeff_validate':
+        numbers = _aadhar_numbers(count)
+        validate = aadharVerification._verhoeff_validate
+    else:
+        numbers = _pan_numbers(count)
+        validate = panVerification.pan_auth_number
+    return lambda: [validate(number) for number in numbers], count
+
+
+def _text_case(function, fixture):
+    import aadharVerification
+    import panVerification
+    import textExtraction
+    if function == 'text_extraction':
+        texts = [_fixture_text(os.path.splitext(name)[0]) for name in sorted(os.listdir(FIXTURES))]
+        return lambda: [textExtraction.extract(text) for text in texts], len(texts)
+    text = _fixture_text(fixture)
+    verify = aadharVerification.aadhar_auth_text if function == 'aadhar_auth_text' else panVerification.pan_auth_text
+    return lambda: verify(text), 1
+
+
+def _img_case(function, fixture, fixtures_dir):
+    import aadharVerification
+    import panVerification
+    import ocrBackend
+    import ocrPreprocess
+    image_bytes = synthetic_image(2000, 1500)
+    # The fake backend answers with the recording stored under the hash of the
+    # image it receives, which is the pre-processed upload
+    key = hashlib.sha256(ocrPreprocess.prepare_for_ocr(image_bytes)).hexdigest()
+    with open(os.path.join(FIXTURES, fixture + '.json'), 'rb') as source, \
+            open(os.path.join(fixtures_dir, key + '.json'), 'wb') as target:
+        target.write(source.read())
+    ocrBackend.set_backend(ocrBackend.FakeBackend(fixtures_dir=fixtures_dir, latency_ms=0))
+    verify = aadharVerification.aadhar_auth_img if function == 'aadhar_auth_img' else panVerification.pan_auth_img
+    return lambda: verify(image_bytes), 1
+
+
+def build_case(name, fixtures_dir):
+    """
+    Returns: (function to time, items handled per call)
+    """
+    function, _, params = name.partition('/')
+    if function in IMAGE_FUNCTIONS:
+        size, mode = params.split('/')
+        return _image_case(function, size, mode)
+    if function in ('_verhoeff_validate', 'pan_auth_number'):
+        return _number_case(function, params)
+    if function in TEXT_FIXTURES or function == 'text_extraction':
+        return _text_case(function, params)
+    if function in IMG_FIXTURES:
+        return _img_case(function, params, fixtures_dir)
+    raise ValueError(f"Unknown case '{name}'")
+
+
+def child(name, min_runs, min_seconds, max_runs):
+    with tempfile.TemporaryDirectory() as fixtures_dir:
+        function, items = build_case(name, fixtures_dir)
+        # Memory is counted from here: the case's input is built, the warm-up
+        # call and the timed runs are included
+        reset_peak_rss()
+        baseline_mb = peak_rss_mb()
+        function()  # warm up imports, tables and compiled patterns
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < max_runs and (len(timings) < min_runs or time.perf_counter() - started < min_seconds):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    result = latency_summary(timings)
+    result['items_per_call'] = items
+    result['items_per_sec'] = result['ops_per_sec'] * items
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['peak_rss_delta_mb'] = result['peak_rss_mb'] - baseline_mb
+    print(json.dumps(result))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=common.ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    from PIL import __version__ as pillow_version
+    return {
+        'python': platform.python_version(),
+        'pillow': pillow_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': _git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def run(args):
+    names = [name for name in case_names() if not args.filter or any(fnmatch.fnmatch(name, f"*{pattern}*") for pattern in args.filter)]
+    if not names:
+        sys.exit(f"No case matches {args.filter}")
+
+    # No OCR cache: every verify call goes through pre-processing and the backend
+    env = dict(os.environ, OCR_CACHE_SIZE='0', OCR_CACHE_DIR='', OCR_BACKEND='fake')
+    results = {}
+    for name in names:
+        completed = subprocess.run(
+            [sys.executable, __file__, 'child', name,
+             '--min-runs', str(args.min_runs), '--min-seconds', str(args.min_seconds), '--max-runs', str(args.max_runs)],
+            capture_output=True, text=True, env=env
+        )
+        if completed.returncode != 0:
+            sys.exit(f"Case {name} failed:\n{completed.stderr}")
+        results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{name:45} p50 {results[name]['p50_ms']:10.3f} ms  {results[name]['items_per_sec']:12.1f} items/s  "
+              f"peak {results[name]['peak_rss_mb']:7.1f} MB", file=sys.stderr)
+
+    report = {'environment': _environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            sys.exit(report_regressions(json.load(f), report, args))
+
+
+def _change(base, current):
+    return (current - base) / base if base else 0.0
+
+
+def find_regressions(baseline, current, latency_threshold, throughput_threshold, memory_threshold):
+    """
+    Returns: list of (case, metric, baseline value, current value, relative change)
+             for every metric that moved past its threshold in the wrong direction
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            change = _change(base[metric], result[metric])
+            if change > latency_threshold:
+                regressions.append((name, metric, base[metric], result[metric], change))
+        change = _change(base['items_per_sec'], result['items_per_sec'])
+        if change < -throughput_threshold:
+            regressions.append((name, 'items_per_sec', base['items_per_sec'], result['items_per_sec'], change))
+        grown = result['peak_rss_delta_mb'] - base['peak_rss_delta_mb']
+        if grown > MEMORY_FLOOR_MB and _change(base['peak_rss_delta_mb'], result['peak_rss_delta_mb']) > memory_threshold:
+            regressions.append((name, 'peak_rss_delta_mb', base['peak_rss_delta_mb'], result['peak_rss_delta_mb'],
+                                _change(base['peak_rss_delta_mb'], result['peak_rss_delta_mb'])))
+    return regressions
+
+
+def report_regressions(baseline, current, args):
+    """
+    Prints the per-case comparison
+    Returns: process exit status, 1 when there are regressions
+    """
+    if baseline.get('environment', {}).get('machine') != current.get('environment', {}).get('machine'):
+        print("warning: baseline was recorded on a different machine type", file=sys.stderr)
+
+    print(f"{'case':45} {'p50 ms':>21} {'items/s':>25} {'peak delta MB':>19}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:45} (not in baseline)")
+            continue
+        print(f"{name:45} {base['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} "
+              f"{base['items_per_sec']:11.1f} -> {result['items_per_sec']:11.1f} "
+              f"{base['peak_rss_delta_mb']:7.1f} -> {result['peak_rss_delta_mb']:7.1f}")
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing and not getattr(args, 'filter', None):
+        print(f"\nnot run: {', '.join(missing)}")
+
+    regressions = find_regressions(baseline, current, args.latency_threshold, args.throughput_threshold, args.memory_threshold)
+    if not regressions:
+        print("\nno regressions")
+        return 0
+    print(f"\n{len(regressions)} regression(s):")
+    for name, metric, before, after, change in regressions:
+        print(f"  {name} {metric}: {before:.3f} -> {after:.3f} ({change:+.1%})")
+    return 1
+
+
+def compare(args):
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    sys.exit(report_regressions(baseline, current, args))
+
+
+def _add_thresholds(parser):
+    parser.add_argument('--latency-threshold', type=float, default=0.10, help='allowed p50/p95 increase (fraction)')
+    parser.add_argument('--throughput-threshold', type=float, default=0.10, help='allowed items/s drop (fraction)')
+    parser.add_argument('--memory-threshold', type=float, default=0.20, help='allowed peak RSS growth (fraction)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the suite and write JSON results')
+    run_parser.add_argument('--filter', nargs='+', help='only run cases whose name contains one of these patterns')
+    run_parser.add_argument('--output', help='results file (default: print to stdout)')
+    run_parser.add_argument('--compare', nargs='?', const=BASELINE, help='compare with a baseline afterwards')
+    run_parser.add_argument('--min-runs', type=int, default=MIN_RUNS)
+    run_parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS)
+    run_parser.add_argument('--max-runs', type=int, default=MAX_RUNS)
+    _add_thresholds(run_parser)
+
+    compare_parser = commands.add_parser('compare', help='flag regressions of a results file against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    _add_thresholds(compare_parser)
+
+    commands.add_parser('list', help='print the case names')
+
+    child_parser = commands.add_parser('child')
+    child_parser.add_argument('name')
+    child_parser.add_argument('--min-runs', type=int, default=MIN_RUNS)
+    child_parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS)
+    child_parser.add_argument('--max-runs', type=int, default=MAX_RUNS)
+
+    args = parser.parse_args()
+    if args.command == 'child':
+        child(args.name, args.min_runs, args.min_seconds, args.max_runs)
+    elif args.command == 'list':
+        print('\n'.join(case_names()))
+    elif args.command == 'compare':
+        compare(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
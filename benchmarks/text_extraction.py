@@ -0,0 +1,123 @@
+"""
+Micro-benchmark of OCR text extraction: the original per-keyword,
+per-line scan against the compiled single-pass engine.
+
+    python benchmarks/text_extraction.py --texts 2000 --repeat 5
+
+Texts are synthetic card OCR output. Every third one has its ID numbers
+split across two lines, as OCR often returns them, to show what each
+extractor recovers.
+"""
+import re
+import json
+import time
+import random
+import argparse
+
+import common  # noqa: F401  (puts BackEnd on sys.path)
+
+import ocrBackend
+import textExtraction
+
+AADHAR_KEYWORDS = textExtraction.DOCUMENT_KEYWORDS['aadhar']
+PAN_KEYWORDS = textExtraction.DOCUMENT_KEYWORDS['pan']
+
+
+def legacy_extract(full_text):
+    # The original aadhar_auth_text / pan_auth_text extraction, prints removed
+    texts = full_text.split("\n")
+    aadhar_matches = sum(1 for keyword in AADHAR_KEYWORDS if keyword.upper() in full_text.upper())
+    pan_matches = sum(1 for keyword in PAN_KEYWORDS if keyword.upper() in full_text.upper())
+
+    aadhar_number = None
+    for text in texts:
+        clean_text = text.replace(" ", "").replace("-", "").replace(".", "").replace("_", "")
+        if len(clean_text) == 12 and clean_text.isdigit():
+            if clean_text[0] in '23456789':
+                aadhar_number = clean_text
+                break
+        match = re.search(r"[2-9]{1}[0-9]{3}\s*[0-9]{4}\s*[0-9]{4}", text)
+        if match:
+            aadhar_number = match.group().replace(" ", "")
+            break
+
+    pan_number = None
+    regex1 = r"[A-Z]{5}[0-9]{4}[A-Z]{1}"
+    for text in texts:
+        text_clean = text.strip().upper().replace(" ", "").replace("-", "").replace(".", "").replace("_", "")
+        if len(text_clean) == 10:
+            if re.match(regex1, text_clean):
+                pan_number = text_clean
+                break
+        match = re.search(regex1, text_clean)
+        if match:
+            pan_number = match.group()
+            break
+
+    return aadhar_matches, pan_matches, aadhar_number, pan_number
+
+
+def engine_extract(full_text):
+    extraction = textExtraction.extract(full_text)
+    return (
+        textExtraction.keyword_count(extraction, 'aadhar'),
+        textExtraction.keyword_count(extraction, 'pan'),
+        extraction.aadhar[0] if extraction.aadhar else None,
+        extraction.pan[0] if extraction.pan else None,
+    )
+
+
+def build_texts(count, seed=0):
+    """
+    Returns: list of (text, aadhar_number, pan_number)
+    """
+    rng = random.Random(seed)
+    cases = []
+    for i in range(count):
+        text = ocrBackend.synthetic_text(rng.random(), 'both')
+        aadhar = re.search(r"[2-9][0-9]{3} [0-9]{4} [0-9]{4}", text).group()
+        pan = re.search(r"[A-Z]{5}[0-9]{4}[A-Z]", text).group()
+        if i % 3 == 0:
+            text = text.replace(aadhar, aadhar[:9] + "\n" + aadhar[10:]).replace(pan, pan[:5] + "\n" + pan[5:])
+        cases.append((text, aadhar.replace(" ", ""), pan))
+    return cases
+
+
+def run(label, fn, cases, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [fn(text) for text, _, _ in cases]
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return {
+        'extractor': label,
+        'us_per_text': round(best / len(cases) * 1e6, 2),
+        'texts_per_sec': round(len(cases) / best),
+        'aadhar_found': sum(out[2] == aadhar for out, (_, aadhar, _) in zip(outputs, cases)),
+        'pan_found': sum(out[3] == pan for out, (_, _, pan) in zip(outputs, cases)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--texts', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cases = build_texts(args.texts)
+    results = [
+        run('legacy', legacy_extract, cases, args.repeat),
+        run('compiled_single_pass', engine_extract, cases, args.repeat),
+    ]
+    keyword_agreement = sum(legacy_extract(text)[:2] == engine_extract(text)[:2] for text, _, _ in cases)
+    print(json.dumps({
+        'texts': len(cases),
+        'split_across_lines': sum(1 for i in range(len(cases)) if i % 3 == 0),
+        'keyword_counts_identical': keyword_agreement,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
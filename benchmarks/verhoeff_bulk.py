@@ -0,0 +1,127 @@
+"""
+Compares Aadhar number validation throughput (numbers/sec) of the per-call
+path against the bulk module, with and without NumPy.
+
+    python benchmarks/verhoeff_bulk.py --count 200000
+
+Half of the generated numbers carry a valid check digit, the other half a
+corrupted one, so both outcomes are exercised.
+"""
+import io
+import json
+import time
+import random
+import argparse
+
+import common  # noqa: F401  (puts BackEnd on sys.path)
+
+import aadharVerification
+import bulkValidation
+import ocrBackend
+
+
+def legacy_verhoeff(number):
+    # The original implementation, which rebuilt both tables on every call
+    d = [
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+        [1, 2, 3, 4, 0, 6, 7, 8, 9, 5],
+        [2, 3, 4, 0, 1, 7, 8, 9, 5, 6],
+        [3, 4, 0, 1, 2, 8, 9, 5, 6, 7],
+        [4, 0, 1, 2, 3, 9, 5, 6, 7, 8],
+        [5, 9, 8, 7, 6, 0, 4, 3, 2, 1],
+        [6, 5, 9, 8, 7, 1, 0, 4, 3, 2],
+        [7, 6, 5, 9, 8, 2, 1, 0, 4, 3],
+        [8, 7, 6, 5, 9, 3, 2, 1, 0, 4],
+        [9, 8, 7, 6, 5, 4, 3, 2, 1, 0]
+    ]
+    p = [
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+        [1, 5, 7, 6, 2, 8, 3, 0, 9, 4],
+        [5, 8, 0, 3, 7, 9, 6, 1, 4, 2],
+        [8, 9, 1, 6, 0, 4, 3, 5, 2, 7],
+        [9, 4, 5, 3, 1, 2, 6, 8, 7, 0],
+        [4, 2, 8, 6, 5, 7, 3, 9, 0, 1],
+        [2, 7, 9, 3, 8, 0, 6, 4, 1, 5],
+        [7, 0, 4, 6, 9, 1, 3, 2, 5, 8]
+    ]
+    c = 0
+    for i, digit in enumerate(number[::-1]):
+        c = d[c][p[(i % 8)][int(digit)]]
+    return c == 0
+
+
+def generate_numbers(count, seed=0):
+    rng = random.Random(seed)
+    numbers = []
+    for i in range(count):
+        number = ocrBackend._verhoeff_complete(str(rng.randint(2, 9)) + ''.join(rng.choice('0123456789') for _ in range(10)))
+        if i % 2:
+            number = number[:11] + str((int(number[11]) + 1) % 10)
+        numbers.append(f"{number[0:4]} {number[4:8]} {number[8:12]}")
+    return numbers
+
+
+def run(label, fn, numbers):
+    start = time.perf_counter()
+    valid = fn(numbers)
+    seconds = time.perf_counter() - start
+    return {
+        'path': label,
+        'seconds': round(seconds, 4),
+        'numbers_per_sec': round(len(numbers) / seconds),
+        'valid': valid,
+    }
+
+
+def per_call_legacy(numbers):
+    return sum(legacy_verhoeff(n.replace(" ", "")) for n in numbers)
+
+
+def per_call(numbers):
+    return sum(aadharVerification.aadhar_auth_number(n)[0] for n in numbers)
+
+
+def bulk(numbers):
+    return sum(valid for valid, _ in bulkValidation.validate_aadhar_numbers(numbers))
+
+
+def bulk_pure_python(numbers):
+    np = bulkValidation.np
+    bulkValidation.np = None
+    try:
+        return bulk(numbers)
+    finally:
+        bulkValidation.np = np
+
+
+def bulk_stream(numbers):
+    # Full path of the HTTP route: CSV parsing, validation and NDJSON encoding
+    data = io.BytesIO(("number\n" + "\n".join(numbers) + "\n").encode())
+    valid = 0
+    for line in bulkValidation.validate_aadhar_stream(data, 'csv'):
+        json.dumps(line)
+        valid += line.get('valid', False)
+    return valid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000)
+    args = parser.parse_args()
+
+    numbers = generate_numbers(args.count)
+    paths = [
+        ('per_call_legacy_tables', per_call_legacy),
+        ('per_call_aadhar_auth_number', per_call),
+        ('bulk_pure_python', bulk_pure_python),
+    ]
+    if bulkValidation.np is not None:
+        paths.append(('bulk_numpy', bulk))
+    paths.append(('bulk_stream_csv_to_ndjson', bulk_stream))
+
+    results = [run(label, fn, numbers) for label, fn in paths]
+    print(json.dumps({'count': args.count, 'numpy': bulkValidation.np is not None, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
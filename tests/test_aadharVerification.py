@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import aadharVerification
+import bulkValidation
+
+
+@pytest.mark.parametrize('number, expected', [
+    ('2461 9341 4471', (True, '2461 9341 4471', 85)),
+    ('2461-9341-4471', (True, '2461 9341 4471', 85)),
+    ('2461 9341 4472', (False, '', 0)),
+    ('1461 9341 4471', (False, '', 0)),
+    ('２461 9341 4471', (False, '', 0)),
+    ('2461 9341 447١', (False, '', 0)),
+    ('２４６１ ９３４１ ４４７１', (False, '', 0)),
+])
+def test_aadhar_auth_number(number, expected):
+    assert aadharVerification.aadhar_auth_number(number) == expected
+
+
+@pytest.mark.parametrize('number', ['2461 9341 4471', '2461 9341 447１', '２４６１ ９３４１ ４４７１', '2461 9341 447١'])
+def test_single_and_bulk_paths_agree(number):
+    single = aadharVerification.aadhar_auth_number(number)[0]
+    bulk = next(bulkValidation.validate_aadhar_numbers([number]))[0]
+
+    assert single == bulk
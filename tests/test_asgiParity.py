@@ -0,0 +1,111 @@
+import io
+import os
+import sys
+import json
+import asyncio
+
+import httpx
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'BackEnd'))
+sys.path.insert(0, ROOT)
+
+from app import app as flask_app
+import asgi
+import ocrBackend
+import resultCache
+
+# Headers both serving modes must agree on; Date and Server differ by design
+COMPARED = (
+    'Content-Type', 'Content-Disposition', 'Content-Length', 'Cache-Control', 'ETag', 'Vary',
+    'X-Cache', 'X-Output-Format', 'X-Quality', 'X-Original-Size', 'X-Achieved-Size',
+    'X-Target-Size', 'X-Target-Met', 'X-Encode-Passes', 'X-Baseline-Size', 'X-Bytes-Saved',
+)
+
+
+def _image(fmt='JPEG', mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, (800, 500), 'purple' if mode == 'RGB' else None).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+JPEG, PNG, GIF = _image(), _image('PNG'), _image('GIF', 'P')
+SIZE = {'width': '300', 'height': '200'}
+
+CASES = {
+    'aadhar_number': ('POST', '/aadharVerification', {'data': {'number': '2461 9341 4471'}}),
+    'aadhar_invalid': ('POST', '/aadharVerification', {'data': {'number': '12'}}),
+    'pan_number': ('POST', '/panVerification', {'data': {'number': 'ABCPE1234F'}}),
+    'aadhar_image': ('POST', '/aadharVerification', {'files': {'file': ('card.jpg', JPEG)}}),
+    'pan_image': ('POST', '/panVerification', {'files': {'file': ('card.jpg', JPEG)}}),
+    'pan_resize': ('POST', '/panResizeMAR', {'files': {'file': ('card.jpg', JPEG)}, 'data': SIZE}),
+    'aadhar_resize': ('POST', '/aadharResizeHard', {'files': {'file': ('card.jpg', JPEG)}, 'data': SIZE}),
+    'resize_webp': ('POST', '/resizeHard', {'files': {'file': ('card.jpg', JPEG)}, 'data': SIZE,
+                                            'headers': {'Accept': 'image/webp'}}),
+    'resize_png': ('POST', '/resizeMAR', {'files': {'file': ('card.png', PNG)}, 'data': dict(SIZE, format='png')}),
+    'resize_gif': ('POST', '/resizeHard', {'files': {'file': ('card.gif', GIF)}, 'data': SIZE}),
+    'resize_bad_format': ('POST', '/resizeHard', {'files': {'file': ('card.jpg', JPEG)}, 'data': dict(SIZE, format='bmp')}),
+    'resize_bad_size': ('POST', '/resizeHard', {'files': {'file': ('card.jpg', JPEG)}, 'data': {'width': '-5', 'height': '10'}}),
+    'resize_not_an_image': ('POST', '/resizeHard', {'files': {'file': ('card.jpg', b'not an image')}, 'data': SIZE}),
+    'reduce': ('POST', '/reduceSize', {'files': {'file': ('card.jpg', JPEG)}}),
+    'reduce_target': ('POST', '/reduceSize?target_kb=3', {'files': {'file': ('card.jpg', JPEG)}}),
+    'reduce_no_filename': ('POST', '/reduceSize', {'files': {'file': ('', JPEG)}}),
+    'pipeline': ('POST', '/pipeline', {'files': {'file': ('card.jpg', JPEG)},
+                                       'data': {'ops': json.dumps([{'op': 'resize', 'width': 200}])}}),
+    'pipeline_invalid': ('POST', '/pipeline', {'files': {'file': ('card.jpg', JPEG)}, 'data': {'ops': 'nope'}}),
+    'pipeline_no_file': ('POST', '/pipeline', {'data': {'ops': '[]'}}),
+    'bulk': ('POST', '/bulk/aadharVerification', {'content': b'number\n2461 9341 4471\n12\n',
+                                                   'headers': {'Content-Type': 'text/csv'}}),
+    'health': ('GET', '/health', {}),
+    'method_not_allowed': ('DELETE', '/resizeHard', {}),
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_ocr():
+    ocrBackend.set_backend(ocrBackend.FakeBackend(latency_ms=0, error_rate=0))
+    yield
+    ocrBackend.set_backend(None)
+
+
+def _summary(response):
+    return response.status_code, {name: response.headers.get(name) for name in COMPARED}, response.content
+
+
+def _flask(method, path, options):
+    with httpx.Client(transport=httpx.WSGITransport(app=flask_app), base_url='http://test') as client:
+        return client.request(method, path, **options)
+
+
+def _asgi(method, path, options):
+    async def request():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.app), base_url='http://test') as client:
+            return await client.request(method, path, **options)
+    return asyncio.run(request())
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_asgi_answers_like_flask(case):
+    method, path, options = CASES[case]
+    responses = []
+    for send in (_flask, _asgi):
+        # Each app computes its own response rather than reading the other's
+        resultCache.clear()
+        responses.append(send(method, path, options))
+
+    flask, asgi_response = responses
+    assert _summary(asgi_response) == _summary(flask)
+
+
+@pytest.mark.parametrize('case', ['pan_resize', 'aadhar_resize', 'resize_webp', 'resize_png', 'resize_gif', 'reduce', 'reduce_target'])
+def test_asgi_revalidates_like_flask(case):
+    method, path, options = CASES[case]
+    etag = _flask(method, path, options).headers['ETag']
+    options = dict(options, headers=dict(options.get('headers', {}), **{'If-None-Match': etag}))
+
+    flask, asgi_response = _flask(method, path, options), _asgi(method, path, options)
+
+    assert asgi_response.status_code == flask.status_code == 304
+    assert _summary(asgi_response) == _summary(flask)
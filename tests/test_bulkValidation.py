@@ -0,0 +1,18 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import bulkValidation
+
+
+def test_non_ascii_digits_are_invalid_rows():
+    rows = ['number', '2461 9341 4471', '2461 9341 447１', '2461 9341 447١', '2461 9341 4471']
+    stream = io.BytesIO('\n'.join(rows).encode('utf-8'))
+
+    results = list(bulkValidation.validate_aadhar_stream(stream, 'csv'))
+
+    assert [result['valid'] for result in results[:-1]] == [True, False, False, True]
+    assert results[0]['number'] == '2461 9341 4471'
+    assert results[-1] == {'summary': {'total': 4, 'valid': 2, 'invalid': 2}}
@@ -0,0 +1,87 @@
+import io
+import os
+import sys
+import zlib
+import struct
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import imageAdmission
+
+
+def _image(fmt, size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def _declared_jpeg(width, height):
+    # A small JPEG whose frame header declares width x height; only the header is read
+    data = bytearray(_image('JPEG'))
+    sof = data.index(b'\xff\xc0')
+    struct.pack_into('>HH', data, sof + 5, height, width)
+    return io.BytesIO(bytes(data))
+
+
+def _declared_png(width, height):
+    data = bytearray(_image('PNG'))
+    struct.pack_into('>II', data, 16, width, height)
+    struct.pack_into('>I', data, 29, zlib.crc32(data[12:29]))
+    return io.BytesIO(bytes(data))
+
+
+def test_jpeg_over_pillow_bomb_limit_is_downgraded():
+    # 20000 x 20000 is over both IMAGE_MAX_PIXELS and Pillow's default
+    # refusal at twice MAX_IMAGE_PIXELS (~179MP), but fits at 1/4 scale
+    width = height = 20000
+    assert width * height > imageAdmission.MAX_PIXELS
+    assert width * height > 2 * 89_478_485
+
+    img, scale = imageAdmission.admit(_declared_jpeg(width, height))
+
+    assert scale == imageAdmission.decode_scale((width, height))
+    assert scale > 1
+    width, height = imageAdmission.decoded_size(img.size, scale)
+    assert width * height <= imageAdmission.MAX_PIXELS
+
+
+@pytest.mark.filterwarnings('ignore::PIL.Image.DecompressionBombWarning')
+def test_jpeg_over_the_smallest_draft_scale_is_refused():
+    side = int((imageAdmission.MAX_PIXELS * 64) ** 0.5) + 8
+
+    with pytest.raises(imageAdmission.ImageRejectedError) as error:
+        imageAdmission.admit(_declared_jpeg(side, side))
+
+    assert error.value.status == 413
+    assert error.value.reason == 'pixels'
+
+
+def test_png_over_budget_is_refused():
+    with pytest.raises(imageAdmission.ImageRejectedError) as error:
+        imageAdmission.admit(_declared_png(30000, 30000))
+
+    assert (error.value.status, error.value.reason) == (413, 'pixels')
+
+
+def test_unreadable_upload_is_refused():
+    with pytest.raises(imageAdmission.ImageRejectedError) as error:
+        imageAdmission.admit(io.BytesIO(b'not an image'))
+
+    assert (error.value.status, error.value.reason) == (422, 'format')
+
+
+def test_output_over_budget_is_refused():
+    with pytest.raises(imageAdmission.ImageRejectedError) as error:
+        imageAdmission.admit(io.BytesIO(_image('PNG')), plan=lambda size: (100_000, 100_000))
+
+    assert (error.value.status, error.value.reason) == (422, 'output_pixels')
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG', 'GIF', 'BMP', 'TIFF', 'WEBP'])
+def test_any_pillow_format_is_admitted(fmt):
+    img, scale = imageAdmission.admit(io.BytesIO(_image(fmt)))
+
+    assert (img.format, scale) == (fmt, 1)
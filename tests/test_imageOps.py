@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import imageOps
+
+
+def _photo(size=(320, 240), seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 255, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    return Image.fromarray(noise).resize(size, Image.BICUBIC)
+
+
+def _jpeg(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4])
+def test_parallel_search_encodes_match_single_encodes(workers):
+    img = _photo()
+    target = len(_jpeg(img, 60))
+
+    buffer, quality, passes = imageOps.encode_to_target(img, 'JPEG', target, max_passes=8, workers=workers, optimize=True)
+
+    assert buffer.getvalue() == _jpeg(img, quality)
+    assert len(buffer.getvalue()) <= target
+
+
+def _whole(img, target, fmt):
+    img = imageOps._normalise_mode(img)
+    if target != img.size:
+        img = imageOps.resize(img, target)
+    return imageOps.flatten_for(img, fmt)
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'LA', 'P', 'CMYK'])
+@pytest.mark.parametrize('target', [(320, 240), (97, 61), (40, 30), (500, 377)])
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG'])
+def test_strips_match_the_whole_image(mode, target, fmt):
+    img = _photo((320, 240)).convert(mode)
+
+    strips = imageOps.convert_in_strips(img, target, fmt, rows=13)
+    whole = _whole(img, target, fmt)
+
+    assert (strips.mode, strips.size) == (whole.mode, whole.size)
+    assert strips.tobytes() == whole.tobytes()
+
+
+def test_pipeline_output_is_the_same_with_strips(monkeypatch):
+    source = _jpeg(_photo((640, 480)), 90)
+    operations = [{'op': 'resize', 'width': 150, 'height': 100}, {'op': 'format', 'format': 'PNG'}]
+    whole = imageOps.run_pipeline_local(source, operations)['buffer'].getvalue()
+
+    monkeypatch.setattr(imageOps, 'STRIP_PIXELS', 1)
+    monkeypatch.setattr(imageOps, 'STRIP_ROWS', 16)
+
+    assert imageOps.run_pipeline_local(source, operations)['buffer'].getvalue() == whole
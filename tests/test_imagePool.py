@@ -0,0 +1,69 @@
+import io
+import os
+import sys
+import threading
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import imageAdmission
+import imageOps
+import imagePool
+
+OPERATIONS = [{'op': 'resize', 'width': 120, 'height': 90}, {'op': 'format', 'format': 'JPEG'}]
+
+
+def _image(size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.radial_gradient('L').convert('RGB').resize(size).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(imagePool, 'WORKERS', 1)
+    monkeypatch.setattr(imagePool, 'QUEUE_SIZE', 2)
+    yield imagePool
+    imagePool.shutdown()
+
+
+def test_pool_result_matches_local(pool):
+    result = pool.run_pipeline(_image(), OPERATIONS)
+    local = imageOps.run_pipeline_local(_image(), OPERATIONS)
+
+    assert result['buffer'].getvalue() == local['buffer'].getvalue()
+    assert (result['width'], result['height']) == (120, 90)
+
+
+def test_errors_in_the_pool_process_reach_the_caller(pool):
+    with pytest.raises(imageAdmission.ImageRejectedError):
+        pool.run_pipeline(b'not an image', OPERATIONS)
+
+
+def test_timed_out_task_is_killed_and_its_process_replaced(pool, monkeypatch):
+    monkeypatch.setattr(imagePool, 'TIMEOUT', 0.05)
+    slow = [{'op': 'reduce', 'target_bytes': 1, 'max_passes': 90}, {'op': 'format', 'format': 'JPEG'}]
+
+    with pytest.raises(imagePool.TaskTimeoutError):
+        pool.run_pipeline(_image((4000, 3000)), slow)
+
+    monkeypatch.setattr(imagePool, 'TIMEOUT', 30)
+    assert pool.run_pipeline(_image(), OPERATIONS)['width'] == 120
+
+
+@pytest.mark.parametrize('source', [_image(), b'not an image'], ids=['finished', 'failed'])
+def test_task_clears_its_pid_when_it_ends(monkeypatch, source):
+    # A cleared header keeps a late timeout from killing the process's next task
+    monkeypatch.setattr(imagePool, '_task_lock', threading.Lock())
+    block, size = imagePool._to_shared_memory(source)
+    try:
+        try:
+            imagePool._run_task(block.name, size, OPERATIONS, None)
+        except imageAdmission.ImageRejectedError:
+            pass
+        assert imagePool._HEADER.unpack_from(block.buf, 0)[0] == 0
+    finally:
+        block.close()
+        block.unlink()
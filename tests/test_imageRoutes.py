@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+import zlib
+import struct
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def _image(fmt='JPEG', size=(300, 200), mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def _post(client, route, data=None, image=None, headers=None):
+    data = dict(data or {}, file=(io.BytesIO(image or _image()), 'card.jpg'))
+    return client.post(route, data=data, headers=headers, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize('route, data', [
+    ('/resizeMAR', {'width': '0'}),
+    ('/resizeHard', {'width': '-5', 'height': '10'}),
+    ('/resizeHard', {'width': '50', 'height': '0'}),
+    ('/resizeHard', {'width': 'abc', 'height': '10'}),
+    ('/reduceSize', {'target_bytes': 'x'}),
+    ('/reduceSize', {'target_kb': 'x'}),
+    ('/reduceSize', {'target_ratio': 'x'}),
+    ('/reduceSize', {'target_bytes': '-4'}),
+])
+def test_invalid_parameters_are_client_errors(client, route, data):
+    response = _post(client, route, data)
+
+    assert response.status_code == 400
+    assert response.get_data(as_text=True).startswith("Invalid parameters: ")
+
+
+def _declared_png(width, height):
+    data = bytearray(_image('PNG'))
+    struct.pack_into('>II', data, 16, width, height)
+    struct.pack_into('>I', data, 29, zlib.crc32(data[12:29]))
+    return bytes(data)
+
+
+@pytest.mark.parametrize('route, data, image, status', [
+    ('/resizeHard', {'width': '50', 'height': '50'}, _declared_png(30000, 30000), 413),
+    ('/reduceSize', {}, _declared_png(30000, 30000), 413),
+    ('/resizeHard', {'width': '50', 'height': '50'}, b'not an image', 422),
+    ('/resizeHard', {'width': '100000', 'height': '100000'}, None, 422),
+])
+def test_refused_uploads_get_admission_statuses(client, route, data, image, status):
+    response = _post(client, route, data, image)
+
+    assert response.status_code == status
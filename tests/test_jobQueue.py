@@ -0,0 +1,155 @@
+import io
+import os
+import sys
+import json
+import time
+import stat
+import sqlite3
+import threading
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'BackEnd'))
+sys.path.insert(0, ROOT)
+
+import jobQueue
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobQueue, 'DB_PATH', str(tmp_path / 'jobs' / 'jobs.sqlite3'))
+    monkeypatch.setattr(jobQueue, '_schema_ready', False)
+    monkeypatch.setitem(jobQueue.JOB_TYPES, 'echo', (lambda data, params: {'number': '2461 9341 4471', 'size': len(data)}, False))
+    return jobQueue
+
+
+def _wait(job_id, status=jobQueue.DONE):
+    for _ in range(200):
+        job = jobQueue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}")
+
+
+def _row(column, job_id):
+    conn = sqlite3.connect(jobQueue.DB_PATH)
+    try:
+        return conn.execute(f"SELECT {column} FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_database_is_private(jobs):
+    umask = os.umask(0o022)
+    try:
+        _wait(jobs.submit('echo', b'card'))
+    finally:
+        os.umask(umask)
+
+    directory = os.path.dirname(jobs.DB_PATH)
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    for name in os.listdir(directory):
+        assert stat.S_IMODE(os.stat(os.path.join(directory, name)).st_mode) == 0o600
+
+
+def test_upload_is_spooled_and_dropped_when_done(jobs):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(data, params):
+        started.set()
+        release.wait(5)
+        return {'size': len(data)}
+
+    jobs.JOB_TYPES['slow'] = (slow, False)
+    try:
+        job_id = jobs.submit('slow', b'card image')
+        started.wait(5)
+        assert _row('upload', job_id) == b'card image'
+        release.set()
+        assert _wait(job_id)['result'] == {'size': 10}
+        assert _row('upload', job_id) is None
+    finally:
+        release.set()
+        del jobs.JOB_TYPES['slow']
+
+
+def test_number_is_masked_after_the_first_poll(jobs):
+    job_id = jobs.submit('echo', b'card')
+
+    assert _wait(job_id)['result']['number'] == '2461 9341 4471'
+    assert jobs.get(job_id)['result']['number'] == 'XXXX XXXX 4471'
+    assert json.loads(_row('result', job_id))['number'] == 'XXXX XXXX 4471'
+
+
+def test_jobs_of_a_dead_worker_are_failed(jobs, monkeypatch):
+    conn = jobs._connect()
+    conn.execute(
+        "INSERT INTO jobs (id, type, status, created_at, updated_at, upload) VALUES (?, ?, ?, ?, ?, ?)",
+        ('orphan', 'echo', jobs.RUNNING, time.time(), time.time(), b'card'))
+    conn.commit()
+    conn.close()
+    assert jobs.get('orphan')['status'] == jobs.RUNNING
+
+    monkeypatch.setattr(jobs, 'STALE_AFTER', 0)
+    job = jobs.get('orphan')
+
+    assert job['status'] == jobs.FAILED
+    assert job['error'] == 'Worker stopped before finishing the job'
+    assert _row('upload', 'orphan') is None
+
+
+def test_unknown_job_type(jobs):
+    with pytest.raises(ValueError):
+        jobs.submit('nope', b'card')
+
+
+def _image(fmt, size=(300, 200)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(jobs):
+    from app import app
+    return app.test_client()
+
+
+def _result(client, job_id):
+    for _ in range(200):
+        status = client.get(f"/jobs/{job_id}").get_json()
+        if status['status'] in (jobQueue.DONE, jobQueue.FAILED):
+            return client.get(f"/jobs/{job_id}/result")
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never finished")
+
+
+@pytest.mark.parametrize('job_type, fmt, mimetype', [
+    ('aadharResizeHard', 'PNG', 'image/jpeg'),
+    # A flat image does not shrink, so the upload comes back as it was
+    ('reduceSize', 'GIF', 'image/gif'),
+    ('reduceSize', 'PNG', 'image/png'),
+])
+def test_result_is_sent_with_its_mimetype(client, job_type, fmt, mimetype):
+    data = {'type': job_type, 'width': '120', 'height': '80', 'file': (io.BytesIO(_image(fmt)), 'card')}
+    submitted = client.post('/jobs', data=data, content_type='multipart/form-data')
+    assert submitted.status_code == 202
+
+    response = _result(client, submitted.get_json()['job_id'])
+
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert Image.open(io.BytesIO(response.data)).get_format_mimetype() == mimetype
+    assert response.headers['Content-Disposition'] == f"attachment; filename=result.{mimetype.split('/')[1]}"
+
+
+def test_oversized_submission_is_413(client, monkeypatch):
+    from app import app
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    data = {'type': 'reduceSize', 'file': (io.BytesIO(b'x' * 4096), 'card')}
+
+    assert client.post('/jobs', data=data, content_type='multipart/form-data').status_code == 413
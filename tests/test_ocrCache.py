@@ -0,0 +1,53 @@
+import os
+import sys
+import stat
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import ocrCache
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocrCache, 'CACHE_DIR', str(tmp_path / 'ocr'))
+    monkeypatch.setattr(ocrCache, '_dir_ready', False)
+    monkeypatch.setattr(ocrCache, '_entries', ocrCache.OrderedDict())
+    return tmp_path / 'ocr'
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_disk_tier_is_private(disk_cache):
+    umask = os.umask(0o022)
+    try:
+        key = ocrCache.image_key(b'card')
+        ocrCache.put(key, '2461 9341 4471')
+    finally:
+        os.umask(umask)
+
+    path = ocrCache._disk_path(key)
+    assert _mode(disk_cache) == 0o700
+    assert _mode(os.path.dirname(path)) == 0o700
+    assert _mode(path) == 0o600
+
+
+def test_existing_directory_is_made_private(disk_cache):
+    disk_cache.mkdir(mode=0o755)
+    os.chmod(disk_cache, 0o755)
+
+    ocrCache.put(ocrCache.image_key(b'card'), 'text')
+
+    assert _mode(disk_cache) == 0o700
+
+
+def test_disk_hit_after_memory_eviction(disk_cache):
+    key = ocrCache.image_key(b'card')
+    ocrCache.put(key, 'GOVERNMENT OF INDIA')
+    ocrCache._entries.clear()
+
+    assert ocrCache.get(key) == 'GOVERNMENT OF INDIA'
+    assert ocrCache.get(ocrCache.image_key(b'other')) is None
@@ -0,0 +1,147 @@
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'BackEnd'))
+sys.path.insert(0, ROOT)
+
+from app import app
+import outputFormat
+import resultCache
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(outputFormat, 'NEGOTIATE', ('avif', 'webp'))
+    monkeypatch.setattr(outputFormat, 'DEFAULT_OUTPUT', 'jpeg')
+    monkeypatch.setattr(outputFormat, 'QUALITIES', dict(outputFormat.DEFAULT_QUALITIES))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(resultCache, '_entries', resultCache.OrderedDict())
+    monkeypatch.setattr(resultCache, '_size', 0)
+    return app.test_client()
+
+
+def _image(fmt='JPEG', quality=95):
+    buffer = io.BytesIO()
+    Image.radial_gradient('L').convert('RGB').resize((400, 300)).save(buffer, fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def _post(client, route, data, accept=None, image=None):
+    data = dict(data, file=(io.BytesIO(image or _image()), 'card.jpg'))
+    headers = {'Accept': accept} if accept else None
+    return client.post(route, data=data, headers=headers, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, 'jpeg'),
+    ('*/*', 'jpeg'),
+    ('image/*,*/*;q=0.8', 'jpeg'),
+    ('image/webp,*/*', 'webp'),
+    ('image/gif', 'jpeg'),
+    ('image/webp;q=0.5,image/png;q=0.9', 'png'),
+    ('image/png;q=0.5,image/webp;q=0.9', 'webp'),
+    ('image/webp;q=0', 'jpeg'),
+])
+def test_negotiate_picks_the_highest_explicit_mimetype(monkeypatch, accept, expected):
+    monkeypatch.setattr(outputFormat, 'NEGOTIATE', ('webp', 'png'))
+
+    assert outputFormat.negotiate(accept) == expected
+
+
+def test_negotiate_ties_go_to_the_earlier_output(monkeypatch):
+    monkeypatch.setattr(outputFormat, 'NEGOTIATE', ('png', 'webp'))
+
+    assert outputFormat.negotiate('image/webp,image/png') == 'png'
+
+
+def test_negotiate_skips_outputs_pillow_cannot_encode(monkeypatch):
+    monkeypatch.setattr(outputFormat, 'available', lambda: ['jpeg', 'pjpeg', 'webp', 'png'])
+
+    assert outputFormat.negotiate('image/avif,image/webp;q=0.5') == 'webp'
+
+
+def test_lossy_negotiation_never_picks_png(monkeypatch):
+    monkeypatch.setattr(outputFormat, 'NEGOTIATE', ('png',))
+    monkeypatch.setattr(outputFormat, 'DEFAULT_OUTPUT', 'png')
+
+    assert outputFormat.negotiate('image/png') == 'png'
+    assert outputFormat.negotiate('image/png', lossy=True) == 'jpeg'
+
+
+@pytest.mark.parametrize('requested, expected', [
+    ('', 'webp'),
+    ('auto', 'webp'),
+    ('JPG', 'jpeg'),
+    (' png ', 'png'),
+    ('pjpeg', 'pjpeg'),
+])
+def test_choose_takes_the_requested_output_or_negotiates(requested, expected):
+    assert outputFormat.choose(requested, 'image/webp') == expected
+
+
+@pytest.mark.parametrize('requested, lossy', [('gif', False), ('tiff', False), ('png', True)])
+def test_choose_refuses_unknown_or_unfit_outputs(requested, lossy):
+    with pytest.raises(outputFormat.OutputFormatError):
+        outputFormat.choose(requested, None, lossy)
+
+
+def test_resize_negotiates_from_accept(client):
+    response = _post(client, '/resizeHard', {'width': '120', 'height': '90'}, accept='image/webp,*/*;q=0.8')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert response.headers['X-Output-Format'] == 'webp'
+    assert response.headers['Vary'] == 'Accept'
+    assert int(response.headers['X-Bytes-Saved']) == int(response.headers['X-Baseline-Size']) - len(response.data)
+    assert Image.open(io.BytesIO(response.data)).format == 'WEBP'
+
+
+def test_format_parameter_wins_over_accept(client):
+    response = _post(client, '/resizeHard', {'width': '120', 'height': '90', 'format': 'png'}, accept='image/webp')
+
+    assert response.mimetype == 'image/png'
+    assert response.headers['X-Output-Format'] == 'png'
+
+
+def test_default_output_is_the_baseline_jpeg(client):
+    response = _post(client, '/resizeHard', {'width': '120', 'height': '90'})
+
+    assert response.mimetype == 'image/jpeg'
+    assert response.headers['X-Output-Format'] == 'jpeg'
+    assert 'X-Baseline-Size' not in response.headers
+
+
+def test_unknown_format_is_a_client_error(client):
+    response = _post(client, '/resizeHard', {'width': '120', 'height': '90', 'format': 'bmp'})
+
+    assert response.status_code == 400
+
+
+def test_accept_variants_are_cached_apart(client):
+    data = {'width': '120', 'height': '90'}
+    jpeg = _post(client, '/resizeHard', data)
+    webp = _post(client, '/resizeHard', data, accept='image/webp')
+
+    assert webp.headers['X-Cache'] == 'miss'
+    assert jpeg.headers['ETag'] != webp.headers['ETag']
+    assert webp.mimetype == 'image/webp'
+
+
+def test_passthrough_reports_the_upload_format(client):
+    # A low quality WebP grows as a JPEG, so the upload goes back as it was
+    upload = _image('WEBP', quality=5)
+
+    response = _post(client, '/reduceSize', {'target_bytes': str(10 * len(upload))}, image=upload)
+
+    assert response.status_code == 200
+    assert response.data == upload
+    assert response.mimetype == 'image/webp'
+    assert response.headers['X-Output-Format'] == 'webp'
@@ -0,0 +1,87 @@
+import io
+import os
+import sys
+import importlib
+
+import pytest
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'BackEnd'))
+sys.path.insert(0, ROOT)
+
+from app import app
+import imageAdmission
+import imageOps
+import resultCache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(resultCache, '_entries', resultCache.OrderedDict())
+    monkeypatch.setattr(resultCache, '_size', 0)
+    return app.test_client()
+
+
+def _image():
+    buffer = io.BytesIO()
+    Image.radial_gradient('L').convert('RGB').resize((400, 300)).save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def _resize(client, width='120', image=None, headers=None):
+    data = {'width': width, 'height': '90', 'file': (io.BytesIO(image or _image()), 'card.jpg')}
+    return client.post('/resizeHard', data=data, headers=headers, content_type='multipart/form-data')
+
+
+def test_repeat_is_a_cache_hit_with_the_same_etag(client):
+    first = _resize(client)
+    second = _resize(client)
+
+    assert (first.headers['X-Cache'], second.headers['X-Cache']) == ('miss', 'hit')
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.data == second.data
+    assert first.headers['Vary'] == 'Accept'
+
+
+def test_if_none_match_gets_304(client):
+    etag = _resize(client).headers['ETag']
+
+    response = _resize(client, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_other_parameters_get_another_etag(client):
+    etag = _resize(client).headers['ETag']
+
+    response = _resize(client, width='121', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def _key_with(monkeypatch, module, name, value):
+    monkeypatch.setattr(module, name, value)
+    try:
+        return importlib.reload(resultCache).key('/resizeHard', b'upload', {'width': 10})
+    finally:
+        monkeypatch.undo()
+        importlib.reload(resultCache)
+
+
+@pytest.mark.parametrize('module, name, value', [
+    (imageAdmission, 'MAX_PIXELS', 1_000_000),
+    (imageOps, 'STRIP_PIXELS', 0),
+    (imageOps, 'STRIP_ROWS', 64),
+    (imageOps, 'REDUCING_GAP', 3.0),
+    (imageOps, 'MAX_PASSES', 3),
+    (imageOps, 'WORKERS', 4),
+])
+def test_settings_that_change_the_output_change_the_key(monkeypatch, module, name, value):
+    baseline = resultCache.key('/resizeHard', b'upload', {'width': 10})
+
+    assert _key_with(monkeypatch, module, name, value) != baseline
+    assert resultCache.key('/resizeHard', b'upload', {'width': 10}) == baseline
@@ -0,0 +1,136 @@
+import os
+import sys
+import stat
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import singleFlight
+
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(singleFlight, 'ENABLED', True)
+    monkeypatch.setattr(singleFlight, 'LOCK_DIR', '')
+    monkeypatch.setattr(singleFlight, '_dir_ready', False)
+    monkeypatch.setattr(singleFlight, '_stats', dict.fromkeys(singleFlight._stats, 0))
+
+
+@pytest.fixture
+def lock_dir(monkeypatch, tmp_path):
+    path = tmp_path / 'flights'
+    monkeypatch.setattr(singleFlight, 'LOCK_DIR', str(path))
+    return path
+
+
+def _gated_work(release):
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return ['246193414471', 2]
+    return work, calls
+
+
+def _run_concurrently(count, call, release):
+    with ThreadPoolExecutor(count) as executor:
+        futures = [executor.submit(call) for _ in range(count)]
+        # Let every caller reach the flight before the leader finishes
+        time.sleep(0.2)
+        release.set()
+        return [future.result() for future in futures]
+
+
+def test_concurrent_callers_share_one_run():
+    release = threading.Event()
+    work, calls = _gated_work(release)
+
+    results = _run_concurrently(6, lambda: singleFlight.do('aadhar', 'k', work), release)
+
+    assert len(calls) == 1
+    assert results == [['246193414471', 2]] * 6
+    stats = singleFlight.stats()
+    assert (stats['leaders'], stats['process_followers'], stats['in_flight']) == (1, 5, 0)
+
+
+def test_other_keys_do_not_wait():
+    release = threading.Event()
+    release.set()
+    work, calls = _gated_work(release)
+
+    singleFlight.do('aadhar', 'a', work)
+    singleFlight.do('aadhar', 'b', work)
+    singleFlight.do('pan', 'a', work)
+
+    assert len(calls) == 3
+
+
+def test_followers_run_the_work_when_the_leader_fails():
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            raise RuntimeError("vision unavailable")
+        return 'followed'
+
+    def call():
+        try:
+            return singleFlight.do('pan', 'k', work)
+        except RuntimeError:
+            return 'failed'
+
+    results = _run_concurrently(3, call, release)
+
+    assert sorted(results) == ['failed', 'followed', 'followed']
+    assert singleFlight.stats()['fallbacks'] == 2
+
+
+def test_async_callers_share_one_run():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*(singleFlight.do_async('pan', 'k', work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['result'] * 5
+    assert len(calls) == 1
+
+
+@pytest.mark.skipif(singleFlight.fcntl is None, reason="needs flock")
+def test_workers_share_results_through_the_lock_dir(lock_dir):
+    # Two threads calling _across_workers hold separate flocks, like two workers
+    release = threading.Event()
+    work, calls = _gated_work(release)
+
+    results = _run_concurrently(2, lambda: singleFlight._across_workers('aadhar', 'k', work), release)
+
+    assert len(calls) == 1
+    assert sorted(results, key=str) == [(['246193414471', 2], 'host'), (['246193414471', 2], None)]
+    # The last follower removed the shared result
+    assert not list(lock_dir.glob('*.json'))
+
+
+@pytest.mark.skipif(singleFlight.fcntl is None, reason="needs flock")
+def test_lock_dir_and_files_are_private(lock_dir):
+    lock_dir.mkdir(mode=0o755)
+    os.chmod(lock_dir, 0o755)
+
+    singleFlight.do('aadhar', 'k', lambda: 'result')
+
+    assert stat.S_IMODE(os.stat(lock_dir).st_mode) == 0o700
+    files = list(lock_dir.iterdir())
+    assert files
+    assert all(stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0 for path in files)
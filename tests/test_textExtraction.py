@@ -0,0 +1,101 @@
+import os
+import re
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BackEnd'))
+
+import ocrBackend
+import textExtraction
+
+
+def baseline_extract(full_text):
+    # The per-line extraction of the original aadhar_auth_text / pan_auth_text
+    texts = full_text.split("\n")
+    keywords = {
+        doc: sum(1 for keyword in words if keyword in full_text.upper())
+        for doc, words in textExtraction.DOCUMENT_KEYWORDS.items()
+    }
+
+    aadhar_number = None
+    for text in texts:
+        clean_text = text.replace(" ", "").replace("-", "").replace(".", "").replace("_", "")
+        if len(clean_text) == 12 and clean_text.isdigit() and clean_text[0] in '23456789':
+            aadhar_number = clean_text
+            break
+        match = re.search(r"[2-9]{1}[0-9]{3}\s*[0-9]{4}\s*[0-9]{4}", text)
+        if match:
+            aadhar_number = match.group().replace(" ", "")
+            break
+
+    pan_number = None
+    for text in texts:
+        text_clean = text.strip().upper().replace(" ", "").replace("-", "").replace(".", "").replace("_", "")
+        match = re.search(r"[A-Z]{5}[0-9]{4}[A-Z]{1}", text_clean)
+        if match:
+            pan_number = match.group()
+            break
+
+    return keywords, aadhar_number, pan_number
+
+
+def engine_extract(full_text):
+    extraction = textExtraction.extract(full_text)
+    keywords = {doc: textExtraction.keyword_count(extraction, doc) for doc in textExtraction.DOCUMENT_KEYWORDS}
+    return (
+        keywords,
+        extraction.aadhar[0] if extraction.aadhar else None,
+        extraction.pan[0] if extraction.pan else None,
+    )
+
+
+@pytest.mark.parametrize('text', [
+    "INCOME TAX DEPARTMENT\nAB CDE 1234 F\n",
+    "ABC-DE-1234-F",
+    "ABCDE.1234.F",
+    "abcde_1234_f",
+    "PAN: ABCDE1234F",
+    "Permanent Account Number\nAB CD E 12 34 F\nSignature",
+    "GOVERNMENT OF INDIA\n2461 9341 4471\nMALE",
+    "24 61 9341 4471",
+    "2461-9341-4471",
+    "2461.9341.4471",
+    "DOB 01/01/1990\nFEMALE\n2461 9341 4471",
+    "no numbers here",
+    "",
+])
+def test_matches_baseline(text):
+    assert engine_extract(text) == baseline_extract(text)
+
+
+def _respaced(rng, number):
+    # Separators OCR puts inside a printed number
+    return ''.join(char + (rng.choice(' -._') if rng.random() < 0.3 else '') for char in number).rstrip(' -._')
+
+
+def test_matches_baseline_on_synthetic_cards():
+    rng = random.Random(7)
+    for i in range(300):
+        text = ocrBackend.synthetic_text(rng.random(), 'both')
+        if i % 2:
+            pan = re.search(r"[A-Z]{5}[0-9]{4}[A-Z]", text).group()
+            aadhar = re.search(r"[2-9][0-9]{3} [0-9]{4} [0-9]{4}", text).group()
+            text = text.replace(pan, _respaced(rng, pan)).replace(aadhar, _respaced(rng, aadhar.replace(' ', '')))
+        assert engine_extract(text) == baseline_extract(text), text
+
+
+def test_finds_numbers_split_across_lines():
+    # Beyond the baseline, which looked at one line at a time
+    extraction = textExtraction.extract("ABCDE\n1234F\n2461 9341\n4471")
+
+    assert extraction.pan == ('ABCDE1234F',)
+    assert extraction.aadhar == ('246193414471',)
+
+
+def test_same_line_candidates_come_first():
+    extraction = textExtraction.extract("2461 9341\n4471\nXYZ\n3124 5678 9012")
+
+    assert extraction.aadhar[0] == '312456789012'
+